@@ -1,31 +1,911 @@
+import bisect
+import io
+import os
+import sqlite3
 import sys
-import random
+import threading
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QTableWidget, QTableWidgetItem, QPushButton,
-    QVBoxLayout, QHBoxLayout, QWidget, QMenu, QAction, QDialog, QLabel, QLineEdit,
-    QComboBox, QDateEdit, QTimeEdit, QMessageBox
+    QApplication, QMainWindow, QTableView, QHeaderView,
+    QPushButton, QVBoxLayout, QHBoxLayout, QWidget, QMenu, QAction, QDialog, QLabel,
+    QLineEdit, QComboBox, QDateEdit, QTimeEdit, QTextEdit, QMessageBox, QInputDialog,
+    QFileDialog, QProgressDialog, QProgressBar, QDateTimeEdit, QCompleter
 )
-from PyQt5.QtCore import Qt, QDateTime
+from PyQt5.QtGui import QFontMetrics, QKeySequence, QTextCursor, QPdfWriter, QPainter, QFont, QPageSize
+from PyQt5.QtCore import (
+    Qt, QDateTime, QDate, QTime, QAbstractTableModel, QAbstractProxyModel, QSortFilterProxyModel,
+    QModelIndex, QTimer, QElapsedTimer, QObject, QRunnable, QThreadPool, QThread, QSizeF, QMarginsF, QStringListModel,
+    pyqtSignal
+)
+
+from columns import IdColumn, ItemColumns, receipt_columns
+from core import (
+    CALCULATION_TYPES, CASHIERS, CATEGORIES, ORGANIZATION_FIELDS, RECEIPT_FIELDS, RECEIPT_WIDTH, chunked,
+    fixed_item_line, footer_lines, generate_receipt_number, header_lines, iter_receipts, make_item,
+    normalize_receipt, random_item_name, receipt_row, render_receipt, write_receipts
+)
+from journal import (
+    ADD_RECEIPT, Journal, UndoStack, journal_directory, organization_added, receipt_added, receipt_deleted,
+    replay
+)
+from numbering import ReceiptNumberAllocator, assign_numbers, kkt_key, number_in_range
+from organizations import OrganizationRegistry
+from pricing import parse_item
+from printing import OrderedWriter, receipt_file_name, render_escpos
+from reports import REPORT_DAY, REPORT_X, REPORT_Z, day_summary, render_report, write_report, x_report, z_report
+from search import ReceiptIndex
+from storage import DEFAULT_DB_PATH, ReceiptStore, to_timestamp
+import tracing
+
+DATE_TIME_FORMAT = "yyyy-MM-dd HH:mm:ss"
+
+
+class ReceiptTableModel(QAbstractTableModel):
+    """Модель списка чеков с поколоночным хранением данных.
+
+    Строки отображения формируются только в data(), то есть для видимых ячеек.
+    Столбцы - компактные массивы columns.receipt_columns(): повторяющиеся
+    строки закодированы словарём, дата/время хранится целым числом секунд
+    от эпохи. Если передано хранилище,
+    сохранённые чеки подгружаются из него страницами по мере прокрутки.
+    """
+
+    HEADERS = [
+        "Категория", "Наименование", "Организация (ККМ)", "Кассир",
+        "Смена", "Чек", "Признак", "Дата/Время", "Способ оплаты"
+    ]
+    DATE_TIME_COLUMN = 7
+    PAGE_SIZE = 1000
+    # Доля каждого прохода цикла событий на фоновую подгрузку и размер её страниц
+    FETCH_SLICE_MS = 10
+    FETCH_SLICE_PAGE = 250
+
+    fetch_finished = pyqtSignal()
+
+    def __init__(self, store=None, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._columns = receipt_columns()
+        self._ids = IdColumn()
+        # Чеки из базы подгружаются до id, существовавшего при открытии;
+        # добавленные в этом сеансе идут в конец списка после них.
+        self._fetched_rows = 0
+        self._fetch_cursor = 0
+        self._fetch_limit = store.max_receipt_id() if store is not None else 0
+        self._fetch_timer = QTimer(self)
+        self._fetch_timer.setInterval(0)
+        self._fetch_timer.timeout.connect(self._fetch_slice)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        value = self._columns[index.column()][index.row()]
+        if index.column() == self.DATE_TIME_COLUMN:
+            return QDateTime.fromSecsSinceEpoch(value).toString(DATE_TIME_FORMAT)
+        return value
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return section + 1
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._fetch_cursor < self._fetch_limit
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._fetch_page(self.PAGE_SIZE)
+
+    def _fetch_page(self, size):
+        page = self.store.fetch_page(self._fetch_cursor, self._fetch_limit, size)
+        if not page:
+            self._fetch_cursor = self._fetch_limit
+            return
+        self._fetch_cursor = page[-1][0]
+        self._insert(self._fetched_rows, [values for _, values in page], [receipt_id for receipt_id, _ in page])
+        self._fetched_rows += len(page)
+
+    def fetch_remaining(self):
+        """Подгрузка оставшихся чеков страницами между событиями интерфейса.
+
+        Каждый проход цикла событий получает не больше FETCH_SLICE_MS;
+        по окончании испускается fetch_finished.
+        """
+        if self.canFetchMore():
+            self._fetch_timer.start()
+        else:
+            self.fetch_finished.emit()
+
+    def is_fetching(self):
+        return self._fetch_timer.isActive()
+
+    def _fetch_slice(self):
+        elapsed = QElapsedTimer()
+        elapsed.start()
+        while self.canFetchMore() and elapsed.elapsed() < self.FETCH_SLICE_MS:
+            self._fetch_page(self.FETCH_SLICE_PAGE)
+        if not self.canFetchMore():
+            self._fetch_timer.stop()
+            self.fetch_finished.emit()
+
+    def columns(self):
+        """Столбцы значений по строкам (живые списки, только для чтения)."""
+        return self._columns
+
+    def receipt_id(self, row):
+        """Идентификатор чека в хранилище (None для несохранённых)."""
+        return self._ids[row]
+
+    def row_values(self, row):
+        """Значения строки в том же виде, в каком их возвращает EditReceiptDialog.get_data."""
+        values = [column[row] for column in self._columns]
+        values[self.DATE_TIME_COLUMN] = QDateTime.fromSecsSinceEpoch(
+            values[self.DATE_TIME_COLUMN]).toString(DATE_TIME_FORMAT)
+        return values
+
+    def append_receipts(self, rows, ids=None):
+        """Добавление пачки чеков в конец списка одним уведомлением."""
+        rows = list(rows)
+        if ids is None:
+            ids = [None] * len(rows)
+        self._insert(self.rowCount(), rows, list(ids))
+
+    def append_receipt(self, values, receipt_id=None):
+        """Добавление одного чека в конец списка."""
+        self.append_receipts([values], [receipt_id])
+
+    def insert_receipt(self, values, receipt_id):
+        """Добавление сохранённого чека на его место в порядке id (новые - в конец, отмена удаления - на прежнее)."""
+        if self._fetch_cursor < receipt_id <= self._fetch_limit:
+            return  # Ещё не подгружен: придёт со страницей из хранилища
+        position = bisect.bisect_left(self._ids.codes, receipt_id)
+        self._insert(position, [values], [receipt_id])
+        if receipt_id <= self._fetch_cursor:
+            self._fetched_rows += 1
+
+    def row_of(self, receipt_id):
+        """Строка чека с этим id или None."""
+        try:
+            return self._ids.codes.index(receipt_id)
+        except ValueError:
+            return None
+
+    def remove_receipts(self, row, count=1):
+        """Удаление count чеков, начиная со строки row."""
+        if row < 0 or count <= 0 or row + count > self.rowCount():
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        for column in self._columns:
+            del column[row:row + count]
+        del self._ids[row:row + count]
+        if row < self._fetched_rows:
+            self._fetched_rows -= min(count, self._fetched_rows - row)
+        self.endRemoveRows()
+        return True
+
+    def _insert(self, position, rows, ids):
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), position, position + len(rows) - 1)
+        encoded = [self._encode(values) for values in rows]
+        if len(encoded) == 1 and position == len(self._ids):
+            # Один чек в конец (создание в редакторе): без промежуточных списков
+            for column, value in zip(self._columns, encoded[0]):
+                column.append(value)
+            self._ids.append(ids[0])
+        else:
+            for column_index, column in enumerate(self._columns):
+                column[position:position] = [values[column_index] for values in encoded]
+            self._ids[position:position] = ids
+        self.endInsertRows()
+
+    def _encode(self, values):
+        values = list(values)
+        date_time = values[self.DATE_TIME_COLUMN]
+        if isinstance(date_time, QDateTime):
+            values[self.DATE_TIME_COLUMN] = date_time.toSecsSinceEpoch()
+        else:
+            values[self.DATE_TIME_COLUMN] = to_timestamp(date_time)
+        return values
+
+
+class ReceiptItemsModel(QAbstractTableModel):
+    """Позиции чека в редакторе поверх columns.ItemColumns.
+
+    Числа хранятся целыми величинами движка цен; стоимость вычисляется
+    при отображении и не редактируется.
+    """
+
+    HEADERS = ["Наименование", "Кол-во", "Цена", "Скидка (%)", "НДС (%)", "Стоимость"]
+    COST_COLUMN = 5
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.items = ItemColumns()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.items)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        return self.items.text(index.row(), index.column())
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        try:
+            self.items.set_value(index.row(), index.column(), str(value))
+        except (ValueError, OverflowError):
+            return False
+        # Вместе с полем меняется стоимость позиции
+        self.dataChanged.emit(index, self.index(index.row(), self.COST_COLUMN))
+        return True
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and index.column() != self.COST_COLUMN:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return section + 1
+
+    def append_items(self, items):
+        # Разбор до beginInsertRows: ошибка не оставит представление без endInsertRows
+        rows = [self.items.convert(item) for item in items]
+        if not rows:
+            return
+        first = len(self.items)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.items.extend_converted(rows)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.items.clear()
+        self.endResetModel()
+
+
+class OrganizationTableModel(QAbstractTableModel):
+    """Список организаций, общий для главного окна и всех диалогов выбора.
+
+    Данные лежат в OrganizationRegistry; словари не копируются в ячейки,
+    текст берётся в data().
+    """
+
+    HEADERS = [
+        "Категория", "Наименование", "Торговый объект", "Адрес расчета", "Контактные данные",
+        "Система налогообложения", "ИНН", "ЗН КХТ", "РН КХТ"
+    ]
+
+    def __init__(self, organizations=(), parent=None):
+        super().__init__(parent)
+        self.registry = OrganizationRegistry(organizations)
+        self.organizations = self.registry.organizations
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.organizations)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(ORGANIZATION_FIELDS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return self.organizations[index.row()].get(ORGANIZATION_FIELDS[index.column()], "")
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return section + 1
+
+    def organization(self, row):
+        """Копия организации строки row (или None)."""
+        if 0 <= row < len(self.organizations):
+            return dict(self.organizations[row])
+        return None
+
+    def add_organizations(self, organizations):
+        if not organizations:
+            return
+        first = len(self.organizations)
+        self.beginInsertRows(QModelIndex(), first, first + len(organizations) - 1)
+        self.registry.extend(organizations)
+        self.endInsertRows()
+
+
+class OrganizationFilterProxyModel(QSortFilterProxyModel):
+    """Отбор строк списка организаций по результату OrganizationRegistry.search."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = None
+
+    def set_rows(self, rows):
+        """rows - номера строк источника или None (показывать все)."""
+        self._rows = None if rows is None else set(rows)
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self._rows is None or source_row in self._rows
+
+
+class ReceiptFilterProxyModel(QAbstractProxyModel):
+    """Отбор строк списка чеков по индексам search.ReceiptIndex.
+
+    Без фильтра строки отображаются один к одному; с фильтром хранится
+    отсортированный список подходящих строк источника, поэтому отбор
+    не требует вызова filterAcceptsRow для каждой строки.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.receipt_index = None
+        self._conditions = {}
+        self._rows = None
+
+    def setSourceModel(self, model):
+        self.beginResetModel()
+        super().setSourceModel(model)
+        self.receipt_index = ReceiptIndex(model.columns())
+        model.rowsAboutToBeInserted.connect(self._source_rows_about_to_be_inserted)
+        model.rowsInserted.connect(self._source_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._source_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self._source_rows_removed)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._source_reset)
+        self.endResetModel()
+
+    def set_filter(self, **conditions):
+        """Условия как у ReceiptIndex.query; без условий фильтр снимается."""
+        self.beginResetModel()
+        self._conditions = conditions
+        self._rows = self.receipt_index.query(**conditions)
+        self.endResetModel()
+
+    def is_filtered(self):
+        return self._rows is not None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self._rows is None:
+            return self.sourceModel().rowCount()
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.sourceModel().columnCount()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        row = proxy_index.row() if self._rows is None else self._rows[proxy_index.row()]
+        return self.sourceModel().index(row, proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        row = source_index.row()
+        if self._rows is not None:
+            position = bisect.bisect_left(self._rows, row)
+            if position == len(self._rows) or self._rows[position] != row:
+                return QModelIndex()
+            row = position
+        return self.index(row, source_index.column())
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Vertical and role == Qt.DisplayRole:
+            return section + 1
+        return self.sourceModel().headerData(section, orientation, role)
+
+    def _source_rows_about_to_be_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.beginInsertRows(QModelIndex(), first, last)
+
+    def _source_rows_inserted(self, parent, first, last):
+        self.receipt_index.rows_appended(first, last)
+        if self._rows is None:
+            self.endInsertRows()
+        elif first == self.sourceModel().rowCount() - (last - first + 1):
+            # Дописанные в конец строки проверяются по одной, без повторного отбора
+            matched = [row for row in range(first, last + 1)
+                       if self.receipt_index.matches(row, **self._conditions)]
+            if matched:
+                self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(matched) - 1)
+                self._rows.extend(matched)
+                self.endInsertRows()
+        else:
+            self.set_filter(**self._conditions)
+
+    def _source_rows_about_to_be_removed(self, parent, first, last):
+        if self._rows is None:
+            self.beginRemoveRows(QModelIndex(), first, last)
+
+    def _source_rows_removed(self, parent, first, last):
+        self.receipt_index.invalidate()
+        if self._rows is None:
+            self.endRemoveRows()
+        else:
+            self.set_filter(**self._conditions)
+
+    def _source_reset(self):
+        self.receipt_index.invalidate()
+        if self._conditions:
+            self._rows = self.receipt_index.query(**self._conditions)
+        self.endResetModel()
+
+
+class ColumnWidths(QObject):
+    """Ширины столбцов таблицы без режима ResizeToContents.
+
+    ResizeToContents измеряет строки при каждом изменении модели. Здесь
+    измеряются только выборка добавленных строк и видимые строки, ширина
+    текста вычисляется один раз на различное значение, а ширины столбцов
+    только растут - вставка не вызывает перерасчёта всей таблицы.
+    Вставки, сделанные до возврата в цикл событий, измеряются одной выборкой.
+    Сброс модели (смена фильтра) только расширяет столбцы под новые строки:
+    ширины, заданные пользователем, сохраняются.
+    """
+
+    PADDING = 20
+    MAX_WIDTH = 400
+    # Сколько строк измерять при вставке пачки: половина - равномерно, половина - последние
+    SAMPLE_ROWS = 200
+    CACHE_LIMIT = 50000
+    VISIBLE_DELAY_MS = 100
+
+    def __init__(self, table, parent=None):
+        super().__init__(parent or table)
+        self.table = table
+        self.header = table.horizontalHeader()
+        self._widths = []
+        self._text_widths = {}
+        self._model = None
+        self._inserted = None
+        self._insert_timer = QTimer(self)
+        self._insert_timer.setSingleShot(True)
+        self._insert_timer.timeout.connect(self._measure_inserted)
+        self._visible_timer = QTimer(self)
+        self._visible_timer.setSingleShot(True)
+        self._visible_timer.setInterval(self.VISIBLE_DELAY_MS)
+        self._visible_timer.timeout.connect(self.measure_visible)
+        table.verticalScrollBar().valueChanged.connect(self._visible_timer.start)
+
+    def _text_width(self, text):
+        width = self._text_widths.get(text)
+        if width is None:
+            if len(self._text_widths) >= self.CACHE_LIMIT:
+                self._text_widths.clear()
+            width = self._text_widths[text] = self._metrics.horizontalAdvance(text)
+        return width
+
+    def reset(self):
+        """Ширины по заголовкам, выборке строк и видимой части таблицы."""
+        model = self.table.model()
+        if model is not self._model:
+            self._model = model
+            model.rowsInserted.connect(self._rows_inserted)
+            model.modelReset.connect(self._model_reset)
+        self._inserted = None
+        self._metrics = QFontMetrics(self.table.font())
+        header_metrics = QFontMetrics(self.header.font())
+        self._widths = [
+            header_metrics.horizontalAdvance(str(model.headerData(column, Qt.Horizontal)))
+            for column in range(model.columnCount())
+        ]
+        for column in range(len(self._widths)):
+            self.header.setSectionResizeMode(column, QHeaderView.Interactive)
+            self.header.resizeSection(column, min(self._widths[column] + self.PADDING, self.MAX_WIDTH))
+        self._measure(self._sample(0, model.rowCount() - 1))
+        self.measure_visible()
+
+    def _model_reset(self):
+        if len(self._widths) != self._model.columnCount():
+            self.reset()
+            return
+        self._inserted = None
+        self._measure(self._sample(0, self._model.rowCount() - 1))
+        self.measure_visible()
+
+    def _sample(self, first, last):
+        count = last - first + 1
+        if count <= self.SAMPLE_ROWS:
+            return range(first, last + 1)
+        half = self.SAMPLE_ROWS // 2
+        step = count / half
+        return sorted({first + int(step * index) for index in range(half)} | set(range(last - half + 1, last + 1)))
+
+    def _measure(self, rows):
+        model = self._model
+        widths = self._widths
+        for column in range(len(widths)):
+            widest = widths[column]
+            for row in rows:
+                text = model.index(row, column).data()
+                if text:
+                    widest = max(widest, self._text_width(str(text)))
+            if widest > widths[column]:
+                widths[column] = widest
+                # Уже расширенный пользователем столбец не сужается
+                width = min(widest + self.PADDING, self.MAX_WIDTH)
+                if width > self.header.sectionSize(column):
+                    self.header.resizeSection(column, width)
+
+    def _rows_inserted(self, parent, first, last):
+        if self._inserted is not None:
+            # Вставка внутри ожидающего диапазона сдвигает его конец
+            pending_first, pending_last = self._inserted
+            shifted_last = pending_last + last - first + 1 if first <= pending_last else pending_last
+            first, last = min(first, pending_first), max(last, shifted_last)
+        self._inserted = (first, last)
+        self._insert_timer.start()
+
+    def _measure_inserted(self):
+        if self._inserted is not None:
+            first, last = self._inserted
+            self._inserted = None
+            self._measure(self._sample(first, min(last, self._model.rowCount() - 1)))
+
+    def measure_visible(self):
+        first = self.table.rowAt(0)
+        if first < 0:
+            return
+        last = self.table.rowAt(self.table.viewport().height() - 1)
+        if last < 0:
+            last = self._model.rowCount() - 1
+        self._measure(range(first, last + 1))
+
+
+def render_pdf(receipt, path, point_size=8, margin=12):
+    """Сохранение чека в PDF моноширинным шрифтом на ленте шириной под текст чека."""
+    lines = render_receipt(receipt).split("\n")
+    line_height = point_size * 1.25
+    # Ширина символа моноширинного шрифта - около 0.6 кегля
+    width = RECEIPT_WIDTH * point_size * 0.6 + 2 * margin
+    height = len(lines) * line_height + 2 * margin
+    points_per_mm = 72 / 25.4
+
+    writer = QPdfWriter(path)
+    writer.setResolution(72)
+    writer.setPageSize(QPageSize(QSizeF(width / points_per_mm, height / points_per_mm), QPageSize.Millimeter))
+    writer.setPageMargins(QMarginsF(0, 0, 0, 0))
+    font = QFont("Courier New", point_size)
+    font.setStyleHint(QFont.TypeWriter)
+    painter = QPainter(writer)
+    try:
+        painter.setFont(font)
+        for number, line in enumerate(lines):
+            painter.drawText(int(margin), int(margin + (number + 1) * line_height), line)
+    finally:
+        painter.end()
+
+
+class PrintJob(QRunnable):
+    """Отрисовка одного чека в рабочем потоке пула."""
+
+    def __init__(self, queue, index, receipt):
+        super().__init__()
+        self.queue = queue
+        self.index = index
+        self.receipt = receipt
+
+    def run(self):
+        self.queue._run_job(self.index, self.receipt)
+
+
+class PrintQueue(QObject):
+    """Очередь печати: чеки отрисовываются в пуле потоков, интерфейс не блокируется.
+
+    PDF сохраняются по одному файлу на чек в каталог, ESC/POS пишется одним
+    потоком в файл или устройство в порядке выбора чеков.
+    """
+
+    FORMATS = ["PDF", "ESC/POS"]
+
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal(int, int)
+
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool if pool is not None else QThreadPool.globalInstance()
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._writer = None
+        self._total = self._done = self._errors = self._skipped = 0
+
+    def open(self, output_format, target):
+        """Подготовка каталога PDF или открытие файла/устройства ESC/POS; OSError - недоступно."""
+        self.output_format = output_format
+        self.target = target
+        if output_format == "PDF":
+            os.makedirs(target, exist_ok=True)
+        else:
+            self._writer = OrderedWriter(target)
+
+    def start(self, receipts):
+        """Печать чеков в открытое методом open место."""
+        receipts = list(receipts)
+        self._cancelled.clear()
+        self._total, self._done, self._errors, self._skipped = len(receipts), 0, 0, 0
+        if not receipts:
+            self._finish()
+            return
+        for index, receipt in enumerate(receipts):
+            self.pool.start(PrintJob(self, index, receipt))
+
+    def cancel(self):
+        """Отмена: ещё не начатые задания пропускаются."""
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def _run_job(self, index, receipt):
+        error = None
+        skipped = self._cancelled.is_set()
+        if not skipped:
+            try:
+                if self.output_format == "PDF":
+                    render_pdf(receipt, os.path.join(self.target, receipt_file_name(index, receipt, "pdf")))
+                else:
+                    self._writer.write(index, render_escpos(receipt))
+            except Exception as exception:
+                error = f"Чек {receipt.get('receipt_number', '')}: {exception}"
+        if self._writer is not None and (error or skipped):
+            self._writer.skip(index)
+        with self._lock:
+            self._done += 1
+            self._errors += bool(error)
+            self._skipped += skipped
+            done = self._done
+        if error:
+            self.failed.emit(error)
+        self.progress.emit(done, self._total)
+        if done == self._total:
+            self._finish()
+
+    def _finish(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self.finished.emit(self._done - self._errors - self._skipped, self._errors)
+
+
+def start_printing(parent, receipts):
+    """Выбор формата и места печати, запуск очереди с индикатором хода и отменой."""
+    output_format, ok = QInputDialog.getItem(parent, "Печать", "Формат:", PrintQueue.FORMATS, 0, False)
+    if not ok:
+        return None
+    if output_format == "PDF":
+        target = QFileDialog.getExistingDirectory(parent, "Каталог для PDF")
+    else:
+        target, _ = QFileDialog.getSaveFileName(parent, "Файл или устройство ESC/POS")
+    if not target:
+        return None
+
+    queue = PrintQueue(parent)
+    try:
+        queue.open(output_format, target)
+    except OSError as error:
+        queue.deleteLater()
+        QMessageBox.critical(parent, "Печать", f"Не удалось открыть {target}: {error}")
+        return None
+    progress = QProgressDialog("Печать чеков...", "Отмена", 0, len(receipts), parent)
+    progress.setWindowModality(Qt.NonModal)
+    progress.setMinimumDuration(0)
+    progress.canceled.connect(queue.cancel)
+    queue.progress.connect(lambda done, total: progress.setValue(done))
+    errors = []
+    queue.failed.connect(errors.append)
+
+    def finished(printed, failed):
+        progress.close()
+        if errors:
+            QMessageBox.warning(parent, "Печать", f"Не напечатано чеков: {failed}\n" + "\n".join(errors[:10]))
+        queue.deleteLater()
+        progress.deleteLater()
+
+    queue.finished.connect(finished)
+    queue.start(receipts)
+    return queue
+
+
+class ImportThread(QThread):
+    """Потоковый импорт чеков из CSV/JSONL в рабочем потоке.
+
+    Файл читается пачками, каждая пачка сохраняется в базу отдельной транзакцией
+    и передаётся в список одним сигналом. Поток ждёт, пока список примет
+    предыдущие пачки, поэтому очередь сигналов не растёт.
+    """
+
+    MAX_BATCHES_IN_FLIGHT = 2
+    PROGRESS_SCALE = 1000
+
+    rows_ready = pyqtSignal(list, list)
+    organizations_added = pyqtSignal(list)
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, db_path, numbers, chunk_size=2000, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.db_path = db_path
+        self.numbers = numbers
+        self.chunk_size = chunk_size
+        self.imported = 0
+        # Повторяющиеся номера (чеки сохранены) и номера вне диапазона (чеки пропущены)
+        self.duplicates = []
+        self.skipped = []
+        self._in_flight = threading.Semaphore(self.MAX_BATCHES_IN_FLIGHT)
+
+    def batch_consumed(self):
+        """Вызывается списком после приёма пачки."""
+        self._in_flight.release()
+
+    def run(self):
+        try:
+            self._import()
+        except Exception as exception:
+            self.failed.emit(str(exception))
+
+    def _import(self):
+        store = ReceiptStore(self.db_path)
+        known = {(org["inn"], org["rn_kht"]) for org in store.load_organizations()}
+        total = os.path.getsize(self.path) or 1
+        try:
+            with open(self.path, "rb") as raw:
+                stream = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+                for chunk in chunked(iter_receipts(self.path, stream), self.chunk_size):
+                    if self.isInterruptionRequested():
+                        break
+                    self.skipped.extend(receipt["receipt_number"] for receipt in chunk
+                                        if not number_in_range(receipt.get("receipt_number", "")))
+                    chunk = [receipt for receipt in chunk if number_in_range(receipt.get("receipt_number", ""))]
+                    self.duplicates.extend(assign_numbers(chunk, self.numbers))
+                    receipts, organizations = [], []
+                    for data in chunk:
+                        receipt = normalize_receipt(data)
+                        organization = receipt["organization"]
+                        key = (organization["inn"], organization["rn_kht"])
+                        if any(key) and key not in known:
+                            known.add(key)
+                            store.add_organization(organization)
+                            organizations.append(organization)
+                        receipts.append((receipt_row(receipt), organization, receipt["items"]))
+                    ids = list(store.add_receipts(receipts))
+                    rows = [values for values, _, _ in receipts]
+                    self.imported += len(rows)
+                    # Сохранённая пачка передаётся в список и при отмене, иначе её не будет видно до перезапуска
+                    while not self._in_flight.acquire(timeout=0.1):
+                        if self.isInterruptionRequested():
+                            break
+                    if organizations:
+                        self.organizations_added.emit(organizations)
+                    self.rows_ready.emit(rows, ids)
+                    self.progress.emit(raw.tell() * self.PROGRESS_SCALE // total, self.imported)
+        finally:
+            store.close()
+
+
+class ExportThread(QThread):
+    """Потоковая выгрузка всех чеков в CSV/JSONL в рабочем потоке."""
+
+    PROGRESS_EVERY = 1000
+    PROGRESS_SCALE = 1000
+
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, db_path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.db_path = db_path
+        self.exported = 0
+
+    def run(self):
+        try:
+            store = ReceiptStore(self.db_path)
+            try:
+                total = store.count_receipts() or 1
+                with open(self.path, "w", encoding="utf-8", newline="") as stream:
+                    write_receipts(self.path, self._receipts(store, total), stream)
+            finally:
+                store.close()
+        except Exception as exception:
+            self.failed.emit(str(exception))
+
+    def _receipts(self, store, total):
+        for receipt in store.iter_receipts():
+            if self.isInterruptionRequested():
+                return
+            yield receipt
+            self.exported += 1
+            if self.exported % self.PROGRESS_EVERY == 0:
+                self.progress.emit(self.exported * self.PROGRESS_SCALE // total, self.exported)
+        self.progress.emit(self.PROGRESS_SCALE, self.exported)
+
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    FLUSH_INTERVAL_MS = 1000
+
+    def __init__(self, store=None, journal=None):
         super().__init__()
         self.setWindowTitle("Редактор кассовых чеков")
         self.setGeometry(100, 100, 800, 600)
 
+        # Хранилище чеков; изменения фиксируются пачками по таймеру
+        self.store = store if store is not None else ReceiptStore(DEFAULT_DB_PATH)
+        self.numbers = ReceiptNumberAllocator(self.store.path)
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self.commit_store)
+
+        # Журнал операций: до фиксации базы изменения восстанавливаются из него.
+        # Операции, не попавшие в базу до сбоя, повторяются до загрузки списка.
+        self.journal = journal if journal is not None else Journal(journal_directory(self.store.path))
+        # После фиксации базы сегменты журнала удаляются, поэтому фиксация должна дойти до диска
+        self.store.set_durable()
+        replay(self.store, self.journal)
+        self.undo_stack = UndoStack()
+
         # Главная таблица "Список чеков"
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(9)
-        self.table.setHorizontalHeaderLabels([
-            "Категория", "Наименование", "Организация (ККМ)", "Кассир",
-            "Смена", "Чек", "Признак", "Дата/Время", "Способ оплаты"
-        ])
+        self.model = ReceiptTableModel(self.store, self)
+        self.proxy = ReceiptFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.model.fetch_finished.connect(self._archive_fetched)
+        self.table = QTableView(self)
+        self.table.setModel(self.proxy)
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self.show_context_menu)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.setSelectionMode(QTableView.ExtendedSelection)
+        self.table.setEditTriggers(QTableView.NoEditTriggers)
+        # Фиксированная высота строк: вид не измеряет каждую строку
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
         # Настройка ширины столбцов
+        self.column_widths = ColumnWidths(self.table)
         self.adjust_column_widths()
 
         # Кнопки "Создать чек" и "Удалить чек"
@@ -35,70 +915,382 @@ class MainWindow(QMainWindow):
         self.delete_button = QPushButton("Удалить чек")
         self.delete_button.clicked.connect(self.delete_receipt)
 
+        self.print_button = QPushButton("Печать выбранных")
+        self.print_button.clicked.connect(self.print_selected)
+
+        self.import_button = QPushButton("Импорт")
+        self.import_button.clicked.connect(self.import_receipts)
+
+        self.export_button = QPushButton("Экспорт")
+        self.export_button.clicked.connect(self.export_receipts)
+
+        self.report_button = QPushButton("Отчёты")
+        self.report_button.clicked.connect(self.show_reports)
+
         # Горизонтальный макет для кнопок
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.create_button)
+        button_layout.addWidget(self.import_button)
+        button_layout.addWidget(self.export_button)
+        button_layout.addWidget(self.report_button)
         button_layout.addStretch()
+        button_layout.addWidget(self.print_button)
         button_layout.addWidget(self.delete_button)
 
+        # Панель фильтров
+        filter_layout = self.create_filter_bar()
+
+        # Меню "Правка": отмена и повтор операций с чеками
+        edit_menu = self.menuBar().addMenu("Правка")
+        self.undo_action = edit_menu.addAction("Отменить")
+        self.undo_action.setShortcut(QKeySequence.Undo)
+        self.undo_action.triggered.connect(self.undo)
+        self.redo_action = edit_menu.addAction("Повторить")
+        self.redo_action.setShortcut(QKeySequence.Redo)
+        self.redo_action.triggered.connect(self.redo)
+        self._update_undo_actions()
+
         # Основной макет
         layout = QVBoxLayout()
         layout.addLayout(button_layout)
+        layout.addLayout(filter_layout)
         layout.addWidget(self.table)
 
         container = QWidget()
         container.setLayout(layout)
         self.setCentralWidget(container)
 
+        # Ход импорта/экспорта в строке состояния
+        self.transfer_thread = None
+        self.transfer_progress = QProgressBar()
+        self.transfer_progress.setRange(0, ImportThread.PROGRESS_SCALE)
+        self.transfer_cancel_button = QPushButton("Отмена")
+        self.transfer_cancel_button.clicked.connect(self.cancel_transfer)
+        self.statusBar().addPermanentWidget(self.transfer_progress)
+        self.statusBar().addPermanentWidget(self.transfer_cancel_button)
+        self.transfer_progress.hide()
+        self.transfer_cancel_button.hide()
+
         # Данные для хранения организаций
-        self.organizations = []
+        self.organization_model = OrganizationTableModel(self.store.load_organizations(), self)
+        self.organizations = self.organization_model.organizations
+        # Диалог чека создаётся при первом открытии и затем переиспользуется
+        self._receipt_dialog = None
+
+    FILTER_DELAY_MS = 200
+    FILTER_DATE_UNSET = QDateTime(QDate(2000, 1, 1), QTime(0, 0))
+
+    def create_filter_bar(self):
+        """Поля отбора чеков; изменения применяются с небольшой задержкой."""
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(self.FILTER_DELAY_MS)
+        self.filter_timer.timeout.connect(self.apply_filter)
+
+        self.cashier_filter = QLineEdit()
+        self.cashier_filter.setPlaceholderText("Кассир")
+        self.organization_filter = QLineEdit()
+        self.organization_filter.setPlaceholderText("Организация")
+        self.shift_filter = QLineEdit()
+        self.shift_filter.setPlaceholderText("Смена")
+        self.number_filter = QLineEdit()
+        self.number_filter.setPlaceholderText("Номер чека")
+        for line_edit in (self.cashier_filter, self.organization_filter, self.shift_filter, self.number_filter):
+            line_edit.textChanged.connect(self.filter_timer.start)
+
+        # Подсказки по значениям, уже известным индексу
+        self.filter_completions = {}
+        for field, line_edit in (("cashier", self.cashier_filter), ("organization", self.organization_filter)):
+            completion_model = QStringListModel(self)
+            completer = QCompleter(completion_model, self)
+            completer.setCaseSensitivity(Qt.CaseInsensitive)
+            line_edit.setCompleter(completer)
+            self.filter_completions[field] = completion_model
+
+        self.calculation_type_filter = QComboBox()
+        self.calculation_type_filter.addItems(["Любой признак"] + CALCULATION_TYPES)
+        self.calculation_type_filter.currentIndexChanged.connect(self.filter_timer.start)
+
+        self.date_from_filter = QDateTimeEdit()
+        self.date_to_filter = QDateTimeEdit()
+        for date_edit, placeholder in ((self.date_from_filter, "Дата с"), (self.date_to_filter, "Дата по")):
+            date_edit.setDisplayFormat(DATE_TIME_FORMAT)
+            date_edit.setCalendarPopup(True)
+            # Минимальное значение означает "не задано" и показывается подписью
+            date_edit.setMinimumDateTime(self.FILTER_DATE_UNSET)
+            date_edit.setSpecialValueText(placeholder)
+            date_edit.setDateTime(self.FILTER_DATE_UNSET)
+            date_edit.dateTimeChanged.connect(self.filter_timer.start)
+
+        self.reset_filter_button = QPushButton("Сбросить")
+        self.reset_filter_button.clicked.connect(self.reset_filter)
+
+        filter_layout = QHBoxLayout()
+        for widget in (self.cashier_filter, self.organization_filter, self.shift_filter, self.number_filter,
+                       self.calculation_type_filter, self.date_from_filter, self.date_to_filter,
+                       self.reset_filter_button):
+            filter_layout.addWidget(widget)
+        return filter_layout
+
+    def filter_conditions(self):
+        def date_value(date_edit):
+            date_time = date_edit.dateTime()
+            return None if date_time == self.FILTER_DATE_UNSET else date_time.toSecsSinceEpoch()
+
+        calculation_type = self.calculation_type_filter.currentText()
+        return {
+            "cashier": self.cashier_filter.text().strip(),
+            "organization": self.organization_filter.text().strip(),
+            "shift": self.shift_filter.text().strip(),
+            "number_prefix": self.number_filter.text().strip(),
+            "calculation_type": calculation_type if self.calculation_type_filter.currentIndex() > 0 else "",
+            "date_from": date_value(self.date_from_filter),
+            "date_to": date_value(self.date_to_filter),
+        }
+
+    def apply_filter(self):
+        conditions = self.filter_conditions()
+        if any(value not in (None, "") for value in conditions.values()) and self.model.canFetchMore():
+            # Отбор идёт по всему архиву: оставшиеся страницы подгружаются без блокировки окна,
+            # подходящие строки из них добавляются в отбор по мере подгрузки
+            if not self.model.is_fetching():
+                self.model.fetch_remaining()
+            self.statusBar().showMessage("Архив подгружается, отбор дополняется...")
+        self.proxy.set_filter(**conditions)
+        self._update_filter_completions()
+
+    def _update_filter_completions(self):
+        for field, completion_model in self.filter_completions.items():
+            completion_model.setStringList(self.proxy.receipt_index.values(field))
+
+    def _archive_fetched(self):
+        self._update_filter_completions()
+        self.statusBar().showMessage(f"Архив подгружен: {self.model.rowCount()} чеков", 5000)
+
+    def reset_filter(self):
+        for line_edit in (self.cashier_filter, self.organization_filter, self.shift_filter, self.number_filter):
+            line_edit.clear()
+        self.calculation_type_filter.setCurrentIndex(0)
+        self.date_from_filter.setDateTime(self.FILTER_DATE_UNSET)
+        self.date_to_filter.setDateTime(self.FILTER_DATE_UNSET)
+        self.filter_timer.stop()
+        self.apply_filter()
+
+    def source_row(self, proxy_index):
+        return self.proxy.mapToSource(proxy_index).row()
+
+    def closeEvent(self, event):
+        if self.transfer_thread is not None:
+            self.cancel_transfer()
+            self.transfer_thread.wait()
+        self.commit_store()
+        self.journal.close()
+        self.numbers.close()
+        super().closeEvent(event)
+
+    def commit_store(self):
+        """Фиксация базы; она же снимок, после которого журнал при запуске не повторяется."""
+        seq = self.journal.last_seq
+        self.store.flush()
+        self.journal.checkpoint(seq)
+
+    def import_receipts(self):
+        if self.transfer_thread is not None:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Импорт чеков", "", "Чеки (*.jsonl *.csv)")
+        if path:
+            self.start_import(path)
+
+    def start_import(self, path):
+        # Изменения этого окна фиксируются до начала записи из рабочего потока
+        self.commit_store()
+        thread = ImportThread(path, self.store.path, self.numbers, parent=self)
+        thread.rows_ready.connect(self._append_imported)
+        thread.organizations_added.connect(self.organization_model.add_organizations)
+        self._start_transfer(thread, "Импорт")
+        return thread
+
+    def _append_imported(self, rows, ids):
+        self.model.append_receipts(rows, ids)
+        self.sender().batch_consumed()
+
+    def export_receipts(self):
+        if self.transfer_thread is not None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт чеков", "", "JSONL (*.jsonl);;CSV (*.csv)")
+        if path:
+            self.start_export(path)
+
+    def start_export(self, path):
+        self.commit_store()
+        return self._start_transfer(ExportThread(path, self.store.path, parent=self), "Экспорт")
+
+    def show_reports(self):
+        self.commit_store()
+        ReportDialog(self.store, self).exec_()
+
+    def _start_transfer(self, thread, title):
+        self.transfer_thread = thread
+        self.transfer_title = title
+        thread.progress.connect(self._show_transfer_progress)
+        thread.failed.connect(lambda message: QMessageBox.warning(self, title, message))
+        thread.finished.connect(self._transfer_finished)
+        self.import_button.setEnabled(False)
+        self.export_button.setEnabled(False)
+        self.transfer_progress.setValue(0)
+        self.transfer_progress.show()
+        self.transfer_cancel_button.show()
+        self.statusBar().showMessage(f"{title}...")
+        thread.start()
+        return thread
+
+    def _show_transfer_progress(self, value, count):
+        self.transfer_progress.setValue(value)
+        self.statusBar().showMessage(f"{self.transfer_title}: {count} чеков")
+
+    def cancel_transfer(self):
+        if self.transfer_thread is not None:
+            self.transfer_thread.requestInterruption()
+
+    def _transfer_finished(self):
+        thread = self.transfer_thread
+        count = thread.imported if isinstance(thread, ImportThread) else thread.exported
+        self.statusBar().showMessage(f"{self.transfer_title} завершён: {count} чеков", 5000)
+        if isinstance(thread, ImportThread) and (thread.duplicates or thread.skipped):
+            messages = []
+            if thread.duplicates:
+                messages.append(f"Повторяющиеся номера чеков ({len(thread.duplicates)}): "
+                                + ", ".join(map(str, thread.duplicates[:20])))
+            if thread.skipped:
+                messages.append(f"Пропущены чеки с номером вне диапазона ({len(thread.skipped)}): "
+                                + ", ".join(map(str, thread.skipped[:20])))
+            QMessageBox.warning(self, self.transfer_title, "\n".join(messages))
+        self.transfer_progress.hide()
+        self.transfer_cancel_button.hide()
+        self.import_button.setEnabled(True)
+        self.export_button.setEnabled(True)
+        self.transfer_thread = None
+        thread.deleteLater()
 
     def adjust_column_widths(self):
-        """Настройка ширины столбцов по ширине заголовков."""
-        header = self.table.horizontalHeader()
-        for column in range(self.table.columnCount()):
-            header.setSectionResizeMode(column, header.ResizeToContents)
-            header.resizeSection(column, header.sectionSize(column) + 20)
+        """Ширины столбцов по заголовкам и выборке строк; при вставке - по новым строкам."""
+        self.column_widths.reset()
 
     def show_context_menu(self, position):
         menu = QMenu(self)
         delete_action = QAction("Удалить чек", self)
         edit_action = QAction("Редактировать", self)
+        print_action = QAction("Печать выбранных", self)
         delete_action.triggered.connect(self.delete_receipt)
         edit_action.triggered.connect(self.edit_receipt)
+        print_action.triggered.connect(self.print_selected)
         menu.addAction(delete_action)
         menu.addAction(edit_action)
+        menu.addAction(print_action)
         menu.exec_(self.table.viewport().mapToGlobal(position))
 
+    def receipt_at(self, row):
+        """Чек строки списка целиком, с организацией и позициями."""
+        receipt_id = self.model.receipt_id(row)
+        if receipt_id is not None:
+            receipt = self.store.load_receipt(receipt_id)
+            if receipt is not None:
+                return receipt
+        receipt = dict(zip(RECEIPT_FIELDS, self.model.row_values(row)))
+        receipt.update(organization={"name": receipt["organization_name"]}, items=[])
+        return receipt
+
+    def print_selected(self):
+        rows = sorted(self.source_row(index) for index in self.table.selectionModel().selectedRows())
+        if not rows:
+            QMessageBox.warning(self, "Предупреждение", "Пожалуйста, выберите чеки для печати")
+            return
+        start_printing(self, [self.receipt_at(row) for row in rows])
+
     def delete_receipt(self):
-        selected_row = self.table.currentRow()
-        if selected_row >= 0:
-            self.table.removeRow(selected_row)
+        selected_row = self.source_row(self.table.currentIndex())
+        if selected_row >= 0 and self.journal_ready():
+            receipt_id = self.model.receipt_id(selected_row)
+            receipt = self.store.load_receipt(receipt_id) if receipt_id is not None else None
+            if receipt is not None:
+                # Чек записывается в журнал целиком, чтобы удаление можно было отменить
+                self.undo_stack.push(self.perform(receipt_deleted(receipt_id, receipt)))
+                self._update_undo_actions()
+            else:
+                self.model.remove_receipts(selected_row)
+
+    def receipt_dialog(self):
+        if self._receipt_dialog is None:
+            self._receipt_dialog = EditReceiptDialog(self.organization_model, self, store=self.store,
+                                                     numbers=self.numbers, journal=self.journal)
+        return self._receipt_dialog
 
     def edit_receipt(self):
-        dialog = EditReceiptDialog(self.organizations, self)
+        if not self.journal_ready():
+            return
+        dialog = self.receipt_dialog()
+        dialog.reset()
         if dialog.exec_():
-            category, organization_name, cashier, receipt_number, date_time, calculation_type, items = dialog.get_data()
-
-            # Добавляем новый чек в таблицу
-            row_position = self.table.rowCount()
-            self.table.insertRow(row_position)
-            self.table.setItem(row_position, 0, QTableWidgetItem(category))
-            self.table.setItem(row_position, 1, QTableWidgetItem(""))
-            self.table.setItem(row_position, 2, QTableWidgetItem(organization_name))
-            self.table.setItem(row_position, 3, QTableWidgetItem(cashier))
-            self.table.setItem(row_position, 4, QTableWidgetItem(""))
-            self.table.setItem(row_position, 5, QTableWidgetItem(receipt_number))
-            self.table.setItem(row_position, 6, QTableWidgetItem(calculation_type))
-            self.table.setItem(row_position, 7, QTableWidgetItem(date_time.toString("yyyy-MM-dd HH:mm:ss")))
-            self.table.setItem(row_position, 8, QTableWidgetItem(""))
+            operation = receipt_added(None, dialog.get_data(), dialog.selected_organization, dialog.get_items())
+            self.undo_stack.push(self.perform(operation))
+            self._update_undo_actions()
+
+    def perform(self, operation):
+        """Операция с чеком: база, журнал и список. Возвращает операцию с id чека."""
+        if operation["op"] == ADD_RECEIPT:
+            receipt_id = self.store.add_receipt(operation["values"], operation["organization"],
+                                                operation["items"], receipt_id=operation["id"])
+            operation = dict(operation, id=receipt_id)
+            self.model.insert_receipt(operation["values"], receipt_id)
+        else:
+            self.store.delete_receipts([operation["id"]])
+            row = self.model.row_of(operation["id"])
+            if row is not None:
+                self.model.remove_receipts(row)
+        try:
+            self.journal.append(operation)
+        except OSError as error:
+            # База уже изменена и будет зафиксирована таймером; следующие операции отклоняются
+            QMessageBox.critical(self, "Журнал операций", str(error))
+        self.flush_timer.start()
+        return operation
+
+    def journal_ready(self):
+        """False с сообщением, если журнал операций перестал записываться: изменения не принимаются."""
+        error = self.journal.error
+        if error is not None:
+            QMessageBox.critical(self, "Журнал операций",
+                                 f"Изменения не принимаются: журнал не записывается ({error}). "
+                                 "Освободите место на диске и перезапустите программу.")
+        return error is None
+
+    def undo(self):
+        if self.undo_stack.can_undo() and self.journal_ready():
+            self.perform(self.undo_stack.undo())
+            self._update_undo_actions()
+
+    def redo(self):
+        if self.undo_stack.can_redo() and self.journal_ready():
+            self.perform(self.undo_stack.redo())
+            self._update_undo_actions()
+
+    def _update_undo_actions(self):
+        self.undo_action.setEnabled(self.undo_stack.can_undo())
+        self.redo_action.setEnabled(self.undo_stack.can_redo())
 
 
 class EditReceiptDialog(QDialog):
-    def __init__(self, organizations, parent=None):
+    PREVIEW_DELAY_MS = 150
+
+    def __init__(self, organizations, parent=None, store=None, numbers=None, journal=None):
         super().__init__(parent)
         self.organizations = organizations
+        self.store = store
+        self.numbers = numbers
+        self.journal = journal
         self._selected_organization = None
+        self._organization_dialog = None
+        self._add_item_dialog = None
         self.setWindowTitle("Чек")
         self.setGeometry(200, 200, 800, 600)
 
@@ -113,10 +1305,7 @@ class EditReceiptDialog(QDialog):
         # Кассир (с выпадающим списком)
         self.cashier_label = QLabel("Кассир:")
         self.cashier_input = QComboBox()
-        self.cashier_input.addItems([
-            "Васильев Григорий Павлович",
-            "Николаев Евгений Алексеевич"
-        ])
+        self.cashier_input.addItems(CASHIERS)
         self.cashier_input.setEditable(True)
 
         # Смена
@@ -137,12 +1326,12 @@ class EditReceiptDialog(QDialog):
         # Признак расчета
         self.calculation_type_label = QLabel("Признак расчета:")
         self.calculation_type_combo = QComboBox()
-        self.calculation_type_combo.addItems(["Приход", "Расход", "Возврат прихода", "Возврат расхода"])
+        self.calculation_type_combo.addItems(CALCULATION_TYPES)
 
         # Таблица товаров/услуг
-        self.items_table = QTableWidget()
-        self.items_table.setColumnCount(6)
-        self.items_table.setHorizontalHeaderLabels(["Наименование", "Кол-во", "Цена", "Скидка (%)", "НДС (%)", "Стоимость"])
+        self.items_model = ReceiptItemsModel(self)
+        self.items_table = QTableView()
+        self.items_table.setModel(self.items_model)
 
         # Кнопка "Добавить товар/услугу"
         self.add_item_button = QPushButton("Добавить товар/услугу")
@@ -175,80 +1364,250 @@ class EditReceiptDialog(QDialog):
         left_layout.addWidget(self.print_button)
         left_layout.addWidget(self.ok_button)
 
-        # Правая часть: предварительный просмотр чека
-        self.preview_text = QTextEdit()
-        self.preview_text.setReadOnly(True)
-        self.preview_text.setStyleSheet("background-color: #f0f0f0;")
+        # Правая часть (предварительный просмотр) создаётся при первом показе
+        self.preview_text = None
 
         # Основной макет
-        main_layout = QHBoxLayout()
-        main_layout.addLayout(left_layout)
-        main_layout.addWidget(self.preview_text)
+        self.main_layout = QHBoxLayout()
+        self.main_layout.addLayout(left_layout)
+
+        self.setLayout(self.main_layout)
+
+        # Живой просмотр: любые правки полей и ячеек обновляют чек с задержкой
+        self._reset_preview_state()
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(self.PREVIEW_DELAY_MS)
+        self._preview_timer.timeout.connect(self.update_previews)
+
+        self.cashier_input.currentTextChanged.connect(self._mark_header_dirty)
+        self.shift_input.textChanged.connect(self._mark_header_dirty)
+        self.receipt_number_input.textChanged.connect(self._mark_header_dirty)
+        self.date_edit.dateChanged.connect(self._mark_header_dirty)
+        self.time_edit.timeChanged.connect(self._mark_header_dirty)
+        self.calculation_type_combo.currentTextChanged.connect(self._mark_header_dirty)
+        self.items_model.dataChanged.connect(self._mark_items_dirty)
+        self.items_model.rowsInserted.connect(self.schedule_preview)
+
+    def _reset_preview_state(self):
+        self._preview_built = False
+        self._preview_header_dirty = True
+        self._preview_header_lines = []
+        self._preview_lines = []
+        self._preview_costs = []
+        self._preview_vats = []
+        self._preview_total = 0
+        self._preview_vat_total = 0
+        self._preview_dirty_rows = set()
+        self._generated_receipt_number = None
+
+    def reset(self):
+        """Очистка полей перед очередным чеком (диалог переиспользуется)."""
+        self._selected_organization = None
+        self.organization_button.setText("Выбрать")
+        self.cashier_input.setCurrentIndex(0)
+        self.shift_input.clear()
+        self.receipt_number_input.clear()
+        now = QDateTime.currentDateTime()
+        self.date_edit.setDate(now.date())
+        self.time_edit.setTime(now.time())
+        self.calculation_type_combo.setCurrentIndex(0)
+        self.items_model.clear()
+        self._reset_preview_state()
+        if self.preview_text is not None:
+            self.update_previews()
 
-        self.setLayout(main_layout)
+    def showEvent(self, event):
+        if self.preview_text is None:
+            self.update_previews()
+        super().showEvent(event)
+
+    def _ensure_preview(self):
+        if self.preview_text is None:
+            self.preview_text = QTextEdit()
+            self.preview_text.setReadOnly(True)
+            self.preview_text.setStyleSheet("background-color: #f0f0f0;")
+            self.main_layout.addWidget(self.preview_text)
+        return self.preview_text
+
+    def organization_dialog(self):
+        if self._organization_dialog is None:
+            self._organization_dialog = OrganizationDialog(self.organizations, self, store=self.store,
+                                                           journal=self.journal)
+        return self._organization_dialog
 
     def select_organization(self):
         """Открытие диалога выбора организации."""
-        dialog = OrganizationDialog(self.organizations, self)
+        dialog = self.organization_dialog()
+        dialog.load_data()
         if dialog.exec_():
             self._selected_organization = dialog.get_selected_organization()
             if self._selected_organization:
                 self.organization_button.setText(self._selected_organization["name"])
+                self._preview_header_dirty = True
                 self.update_previews()
             else:
                 QMessageBox.warning(self, "Предупреждение", "Пожалуйста, выберите организацию")
 
+    def schedule_preview(self):
+        """Отложенное обновление просмотра: серия быстрых правок даёт одну перерисовку."""
+        self._preview_timer.start()
+
+    def _mark_header_dirty(self, *args):
+        self._preview_header_dirty = True
+        self.schedule_preview()
+
+    def _mark_items_dirty(self, top_left, bottom_right, roles=()):
+        self._preview_dirty_rows.update(range(top_left.row(), bottom_right.row() + 1))
+        self.schedule_preview()
+
+    def _preview_header(self):
+        return header_lines(
+            self._selected_organization["name"] if self._selected_organization else "",
+            self.cashier_input.currentText(),
+            self.shift_input.text(),
+            self._display_receipt_number(),
+        )
+
+    def _display_receipt_number(self):
+        receipt_number = self.receipt_number_input.text()
+        if not receipt_number and self.numbers is not None:
+            # Номер, который будет присвоен при сохранении
+            receipt_number = str(self.numbers.peek(kkt_key(self._selected_organization), self.shift_input.text()))
+        elif not receipt_number:
+            # Случайный номер генерируется один раз, иначе он менялся бы при каждой правке
+            if self._generated_receipt_number is None:
+                self._generated_receipt_number = self.generate_random_receipt_number()
+            receipt_number = self._generated_receipt_number
+        return receipt_number
+
+    def _preview_line(self, row):
+        return fixed_item_line(*self.items_model.items.fixed(row))
+
+    def _preview_footer(self):
+        return footer_lines(self._preview_total, self._preview_vat_total)
+
     def update_previews(self):
-        """Обновление предварительного просмотра чека."""
-        organization = self.organization_button.text() or "Не выбрано"
-        cashier = self.cashier_input.currentText() or "Не указан"
-        shift = self.shift_input.text() or "Не указана"
-        receipt_number = self.receipt_number_input.text() or self.generate_random_receipt_number()
-        date = self.date_edit.date().toString("yyyy-MM-dd")
-        time = self.time_edit.time().toString("HH:mm:ss")
-        calculation_type = self.calculation_type_combo.currentText()
-
-        # Форматирование чека
-        preview = f"{organization.center(50)}\n"
-        preview += f"Адрес расчета: {organization}\n"
-        preview += f"Контактные данные: +7 (XXX) XXX-XX-XX\n"
-        preview += "\n" + "Кассовый чек".center(50) + "\n"
-        preview += f"Номер чека: {receipt_number}\n"
-        preview += f"Смена: {shift}\n"
-        preview += f"Кассир: {cashier}\n"
-        preview += "=" * 50 + "\n"
-
-        total_cost = 0
-        for row in range(self.items_table.rowCount()):
-            name = self.items_table.item(row, 0).text() if self.items_table.item(row, 0) else ""
-            quantity = float(self.items_table.item(row, 1).text()) if self.items_table.item(row, 1) else 0
-            price = float(self.items_table.item(row, 2).text()) if self.items_table.item(row, 2) else 0
-            cost = quantity * price
-            total_cost += cost
-
-            preview += f"{name}: {quantity} x {price:.2f} = {cost:.2f}\n"
-
-        preview += "=" * 50 + "\n"
-        preview += f"{'ИТОГО':<40}{total_cost:>10.2f}\n"
-
-        self.preview_text.setText(preview)
+        """Обновление предварительного просмотра чека.
+
+        Строки позиций кэшируются; пересчитываются только изменённые строки и итог,
+        а в документе заменяются только соответствующие блоки.
+        """
+        self._preview_timer.stop()
+        self._ensure_preview()
+        row_count = self.items_model.rowCount()
+        cached_rows = len(self._preview_lines)
+        rebuild = not self._preview_built or row_count < cached_rows
+
+        if rebuild:
+            self._preview_lines, self._preview_costs, self._preview_vats = [], [], []
+            self._preview_dirty_rows = set(range(row_count))
+            self._preview_header_dirty = True
+        for row in range(len(self._preview_lines), row_count):
+            self._preview_lines.append("")
+            self._preview_costs.append(0)
+            self._preview_vats.append(0)
+            self._preview_dirty_rows.add(row)
+
+        changed_rows = sorted(row for row in self._preview_dirty_rows if row < row_count)
+        for row in changed_rows:
+            line, cost, vat = self._preview_line(row)
+            self._preview_total += cost - self._preview_costs[row]
+            self._preview_vat_total += vat - self._preview_vats[row]
+            self._preview_lines[row] = line
+            self._preview_costs[row] = cost
+            self._preview_vats[row] = vat
+        self._preview_dirty_rows.clear()
+        if rebuild:
+            self._preview_total = sum(self._preview_costs)
+            self._preview_vat_total = sum(self._preview_vats)
+        if self._preview_header_dirty:
+            self._preview_header_lines = self._preview_header()
+            self._preview_header_dirty = False
+
+        header = self._preview_header_lines
+        if rebuild:
+            self.preview_text.setPlainText("\n".join(header + self._preview_lines + self._preview_footer()))
+            self._preview_built = True
+            return
+
+        for number, line in enumerate(header):
+            self._replace_preview_block(number, line)
+        for row in changed_rows:
+            if row < cached_rows:
+                self._replace_preview_block(len(header) + row, self._preview_lines[row])
+        if row_count > cached_rows:
+            # Новые позиции вставляются перед разделителем итога
+            block = self.preview_text.document().findBlockByNumber(len(header) + cached_rows)
+            cursor = QTextCursor(block)
+            cursor.insertText("\n".join(self._preview_lines[cached_rows:]) + "\n")
+        footer = self._preview_footer()
+        self._replace_preview_block(len(header) + row_count + 1, footer[1])
+        self._replace_preview_block(len(header) + row_count + 2, footer[2])
+
+    def _replace_preview_block(self, number, text):
+        block = self.preview_text.document().findBlockByNumber(number)
+        if block.text() == text:
+            return
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+        cursor.insertText(text)
 
     def generate_random_receipt_number(self):
         """Генерация случайного номера чека из 6 цифр."""
-        return f"{random.randint(100000, 999999)}"
+        return generate_receipt_number()
 
     def add_item(self):
-        dialog = AddItemDialog(self)
+        if self._add_item_dialog is None:
+            self._add_item_dialog = AddItemDialog(self)
+        dialog = self._add_item_dialog
+        dialog.reset()
         if dialog.exec_():
-            data = dialog.get_data()
-            row = self.items_table.rowCount()
-            self.items_table.insertRow(row)
-            for col, value in enumerate(data):
-                self.items_table.setItem(row, col, QTableWidgetItem(value))
+            self.items_model.append_items([dialog.get_data()])
             self.update_previews()
 
     def print_receipt(self):
-        QMessageBox.information(self, "Печать", "Функция печати пока не реализована")
+        start_printing(self, [self.get_receipt()])
+
+    def get_receipt(self):
+        """Чек диалога целиком, как его печатает и сохраняет core."""
+        receipt = dict(zip(RECEIPT_FIELDS, self.get_data()))
+        receipt["receipt_number"] = receipt["receipt_number"] or self._display_receipt_number()
+        receipt["organization"] = dict(self._selected_organization or {})
+        receipt["items"] = self.get_items()
+        return receipt
+
+    def accept(self):
+        """Присвоение номера чека перед закрытием: пустой - выдаётся, введённый - проверяется."""
+        if self.numbers is not None:
+            kkt = kkt_key(self._selected_organization)
+            shift = self.shift_input.text()
+            receipt_number = self.receipt_number_input.text().strip()
+            try:
+                if self.store is not None:
+                    # Открытая пачка записей окна держит блокировку базы: номер выдаётся другим соединением
+                    self.store.flush()
+                if not receipt_number:
+                    self.receipt_number_input.setText(str(self.numbers.allocate(kkt, shift)))
+                elif receipt_number.isdigit() and not self.numbers.claim(kkt, shift, int(receipt_number)):
+                    QMessageBox.warning(self, "Предупреждение",
+                                        f"Чек с номером {receipt_number} уже есть в этой смене")
+                    return
+            except ValueError as error:
+                QMessageBox.warning(self, "Предупреждение", str(error))
+                return
+            except sqlite3.Error as error:
+                QMessageBox.critical(self, "Ошибка", f"Не удалось выдать номер чека: {error}")
+                return
+        super().accept()
+
+    @property
+    def selected_organization(self):
+        return self._selected_organization
+
+    def get_items(self):
+        """Позиции чека из таблицы товаров/услуг."""
+        return self.items_model.items.items()
 
     def get_data(self):
         date_time = QDateTime(self.date_edit.date(), self.time_edit.time())
@@ -260,7 +1619,7 @@ class EditReceiptDialog(QDialog):
             self.shift_input.text(),
             self.receipt_number_input.text(),
             self.calculation_type_combo.currentText(),
-            date_time.toString("yyyy-MM-dd HH:mm:ss"),
+            date_time.toString(DATE_TIME_FORMAT),
             ""  # Способ оплаты
         ]
 
@@ -316,43 +1675,166 @@ class AddItemDialog(QDialog):
 
     def generate_random_name(self):
         """Генерация случайного числа в формате 0*******."""
-        random_number = random.randint(1000000, 9999999)
-        self.name_input.setText(f"0{random_number}")
+        self.name_input.setText(random_item_name())
+
+    def reset(self):
+        """Новое наименование и пустые поля перед очередной позицией."""
+        self.generate_random_name()
+        for line_edit in (self.quantity_input, self.price_input, self.discount_input, self.vat_input):
+            line_edit.clear()
+        self.name_input.setFocus()
+
+    def accept(self):
+        try:
+            parse_item(*(line_edit.text() for line_edit in (
+                self.quantity_input, self.price_input, self.discount_input, self.vat_input)))
+        except ValueError as error:
+            QMessageBox.warning(self, "Предупреждение", str(error))
+            return
+        super().accept()
 
     def get_data(self):
         """Получение данных из диалогового окна."""
-        name = self.name_input.text()
-        quantity = self.quantity_input.text() or "0"
-        price = self.price_input.text() or "0"
-        discount = self.discount_input.text() or "0"
-        vat = self.vat_input.text() or "0"
+        return make_item(
+            self.name_input.text(),
+            self.quantity_input.text(),
+            self.price_input.text(),
+            self.discount_input.text(),
+            self.vat_input.text(),
+        )
 
-        try:
-            quantity = float(quantity)
-            price = float(price)
-            discount = float(discount)
-            vat = float(vat)
-        except ValueError:
-            quantity, price, discount, vat = 0, 0, 0, 0
 
-        cost = quantity * price * (1 - discount / 100)
-        return name, str(quantity), str(price), str(discount), str(vat), f"{cost:.2f}"
+class ReportDialog(QDialog):
+    """X/Z-отчёты и сводки за день по накопленным в хранилище итогам."""
+
+    KINDS = [(REPORT_X, "X-отчёт"), (REPORT_Z, "Z-отчёт (закрытие смены)"), (REPORT_DAY, "Сводка за день")]
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.report = None
+        self.setWindowTitle("Отчёты")
+        self.setGeometry(300, 300, 520, 600)
+
+        self.kind_combo = QComboBox()
+        for _, title in self.KINDS:
+            self.kind_combo.addItem(title)
+        self.kind_combo.currentIndexChanged.connect(self.load_scopes)
+        self.scope_combo = QComboBox()
+
+        self.report_text = QTextEdit()
+        self.report_text.setReadOnly(True)
+        self.report_text.setFont(QFont("Courier New", 10))
+
+        self.build_button = QPushButton("Сформировать")
+        self.export_button = QPushButton("Экспорт")
+        self.close_button = QPushButton("Закрыть")
+        self.build_button.clicked.connect(self.build_report)
+        self.export_button.clicked.connect(self.export_report)
+        self.close_button.clicked.connect(self.close)
+        self.export_button.setEnabled(False)
+
+        form_layout = QHBoxLayout()
+        form_layout.addWidget(QLabel("Вид отчёта:"))
+        form_layout.addWidget(self.kind_combo)
+        form_layout.addWidget(QLabel("Смена / день:"))
+        form_layout.addWidget(self.scope_combo, 1)
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self.build_button)
+        button_layout.addWidget(self.export_button)
+        button_layout.addStretch()
+        button_layout.addWidget(self.close_button)
+
+        layout = QVBoxLayout()
+        layout.addLayout(form_layout)
+        layout.addWidget(self.report_text)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.load_scopes()
+
+    def kind(self):
+        return self.KINDS[self.kind_combo.currentIndex()][0]
+
+    def load_scopes(self):
+        """Смены для X/Z-отчёта или дни для сводки; данные - элементы списка."""
+        self.scope_combo.clear()
+        if self.kind() == REPORT_DAY:
+            for day in self.store.report_days():
+                self.scope_combo.addItem(day, day)
+            return
+        for organization, shift, closed in self.store.report_shifts():
+            title = f"{organization['name'] or 'Без организации'}, смена {shift or '-'}"
+            if closed:
+                title += " (закрыта)"
+            self.scope_combo.addItem(title, (organization, shift))
+
+    def build_report(self):
+        scope = self.scope_combo.currentData()
+        if scope is None:
+            return
+        kind = self.kind()
+        if kind == REPORT_DAY:
+            self.report = day_summary(self.store, scope)
+        elif kind == REPORT_X:
+            self.report = x_report(self.store, *scope)
+        else:
+            organization, shift = scope
+            if self.store.shift_closure(organization, shift) is None:
+                answer = QMessageBox.question(
+                    self, "Закрытие смены", f"Закрыть смену {shift}? Повторное закрытие невозможно."
+                )
+                if answer != QMessageBox.Yes:
+                    return
+            self.report = z_report(self.store, organization, shift)
+            index = self.scope_combo.currentIndex()
+            self.load_scopes()
+            self.scope_combo.setCurrentIndex(index)
+        self.report_text.setPlainText(render_report(self.report))
+        self.export_button.setEnabled(True)
+
+    def export_report(self):
+        if self.report is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Экспорт отчёта", "", "Текст (*.txt);;CSV (*.csv);;JSON (*.json)"
+        )
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8", newline="") as stream:
+                write_report(path, self.report, stream)
+        except OSError as error:
+            QMessageBox.warning(self, "Экспорт отчёта", str(error))
 
 
 class OrganizationDialog(QDialog):
-    def __init__(self, organizations, parent=None):
+    def __init__(self, organizations, parent=None, store=None, journal=None):
+        """organizations - общая OrganizationTableModel или список словарей."""
         super().__init__(parent)
-        self.organizations = organizations
+        if not isinstance(organizations, OrganizationTableModel):
+            organizations = OrganizationTableModel(organizations, self)
+        self.model = organizations
+        self.organizations = organizations.organizations
+        self.store = store
+        self.journal = journal
         self.setWindowTitle("Список организаций")
         self.setGeometry(300, 300, 600, 400)
 
-        # Таблица организаций
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(9)  # Исправлено количество столбцов
-        self.table.setHorizontalHeaderLabels([
-            "Категория", "Наименование", "Торговый объект", "Адрес расчета", "Контактные данные",
-            "Система налогообложения", "ИНН", "ЗН КХТ", "РН КХТ"
-        ])
+        # Подбор по вводу: наименование, торговый объект, адрес, ИНН, ЗН/РН КХТ
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Поиск: наименование, объект, адрес, ИНН, ЗН/РН КХТ")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(self.search)
+
+        # Таблица организаций показывает общую модель без копирования
+        self.proxy = OrganizationFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.table = QTableView(self)
+        self.table.setModel(self.proxy)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.setSelectionMode(QTableView.SingleSelection)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
         self.load_data()
 
@@ -367,6 +1849,7 @@ class OrganizationDialog(QDialog):
 
         # Макет
         layout = QVBoxLayout()
+        layout.addWidget(self.search_input)
         layout.addWidget(self.table)
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.create_button)
@@ -377,22 +1860,31 @@ class OrganizationDialog(QDialog):
         self.setLayout(layout)
 
     def load_data(self):
-        """Загрузка данных об организациях в таблицу."""
-        self.table.setRowCount(len(self.organizations))
-        for row, org in enumerate(self.organizations):
-            self.table.setItem(row, 0, QTableWidgetItem(org.get("category", "")))
-            self.table.setItem(row, 1, QTableWidgetItem(org.get("name", "")))
-            self.table.setItem(row, 2, QTableWidgetItem(org.get("trade_object", "")))
-            self.table.setItem(row, 3, QTableWidgetItem(org.get("address", "")))
-            self.table.setItem(row, 4, QTableWidgetItem(org.get("contact", "")))
-            self.table.setItem(row, 5, QTableWidgetItem(org.get("tax_system", "")))
-            self.table.setItem(row, 6, QTableWidgetItem(org.get("inn", "")))
-            self.table.setItem(row, 7, QTableWidgetItem(org.get("zn_kht", "")))
-            self.table.setItem(row, 8, QTableWidgetItem(org.get("rn_kht", "")))
+        """Подготовка таблицы к показу: данные живые, сбрасываются только поиск и выбор."""
+        self.search_input.clear()
+        self.table.clearSelection()
+        self.table.setCurrentIndex(QModelIndex())
+        self.table.scrollToTop()
+        self.search_input.setFocus()
+
+    def search(self, text):
+        self.proxy.set_rows(self.model.registry.search(text))
+        if self.proxy.rowCount() == 1:
+            self.table.selectRow(0)
+
+    def select_source_row(self, row):
+        self.table.selectRow(self.proxy.mapFromSource(self.model.index(row, 0)).row())
+
+    def current_row(self):
+        """Выбранная строка модели организаций (не таблицы) или -1."""
+        index = self.table.currentIndex()
+        if not index.isValid() or not self.table.selectionModel().isRowSelected(index.row(), QModelIndex()):
+            return -1
+        return self.proxy.mapToSource(index).row()
 
     def handle_select_button(self):
         """Обработка нажатия кнопки 'Выбрать' с проверкой выбора строки."""
-        selected_row = self.table.currentRow()
+        selected_row = self.current_row()
         if selected_row >= 0:
             self.accept()
         else:
@@ -402,24 +1894,31 @@ class OrganizationDialog(QDialog):
         dialog = OrganizationPropertiesDialog(self)
         if dialog.exec_():
             new_org = dialog.get_data()
-            self.organizations.append(new_org)
-            self.load_data()
+            duplicate = self.model.registry.find_duplicate(new_org)
+            if duplicate is not None:
+                row, field = duplicate
+                title = "ЗН КХТ" if field == "zn_kht" else "РН КХТ"
+                QMessageBox.warning(self, "Предупреждение",
+                                    f"Касса с {title} {new_org[field]} уже зарегистрирована: "
+                                    f"{self.model.organizations[row]['name']}")
+                self.search_input.clear()
+                self.select_source_row(row)
+                return
+            if self.journal is not None:
+                try:
+                    self.journal.append(organization_added(new_org))
+                except OSError as error:
+                    QMessageBox.critical(self, "Журнал операций", f"Организация не добавлена: {error}")
+                    return
+            self.model.add_organizations([new_org])
+            if self.store is not None:
+                self.store.add_organization(new_org)
+                self.store.flush()
+            self.search_input.clear()
+            self.select_source_row(self.model.rowCount() - 1)
 
     def get_selected_organization(self):
-        selected_row = self.table.currentRow()
-        if selected_row >= 0:
-            return {
-                "category": self.table.item(selected_row, 0).text(),
-                "name": self.table.item(selected_row, 1).text(),
-                "trade_object": self.table.item(selected_row, 2).text(),
-                "address": self.table.item(selected_row, 3).text(),
-                "contact": self.table.item(selected_row, 4).text(),
-                "tax_system": self.table.item(selected_row, 5).text(),
-                "inn": self.table.item(selected_row, 6).text(),
-                "zn_kht": self.table.item(selected_row, 7).text(),
-                "rn_kht": self.table.item(selected_row, 8).text()
-            }
-        return None
+        return self.model.organization(self.current_row())
 
 
 class OrganizationPropertiesDialog(QDialog):
@@ -431,7 +1930,7 @@ class OrganizationPropertiesDialog(QDialog):
         # Поля для ввода данных
         self.category_label = QLabel("Категория:")
         self.category_combo = QComboBox()
-        self.category_combo.addItems(["Запчасти", "Работы"])
+        self.category_combo.addItems(CATEGORIES)
 
         self.name_label = QLabel("Наименование:")
         self.name_input = QLineEdit()
@@ -506,8 +2005,27 @@ class OrganizationPropertiesDialog(QDialog):
         }
 
 
+# Обработчики, время которых пишется в трассировку (см. tracing.py)
+TRACED_SLOTS = {
+    MainWindow: ["edit_receipt", "delete_receipt", "print_selected", "apply_filter", "show_reports",
+                 "_append_imported"],
+    EditReceiptDialog: ["add_item", "update_previews", "select_organization", "accept"],
+    OrganizationDialog: ["load_data", "create_organization"],
+    ReportDialog: ["build_report"],
+}
+
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    trace_path = os.environ.get(tracing.TRACE_ENV)
+    if trace_path:
+        trace = tracing.enable(trace_path)
+        tracing.instrument(TRACED_SLOTS)
+        stall_monitor = tracing.StallMonitor(trace, parent=app)
+        stall_monitor.start()
+        app.aboutToQuit.connect(trace.save)
     window = MainWindow()
+    if trace_path:
+        window.addDockWidget(Qt.BottomDockWidgetArea, tracing.TracePanel(trace, window))
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""Замеры производительности горячих мест интерфейса (без показа окон).
+
+Запускается на платформе Qt offscreen; результаты пишутся в JSON,
+чтобы сравнивать версии между собой:
+    python bench.py --output bench.json
+    python bench.py --sizes 10000 100000 --compare bench.json
+При сравнении замеры, ставшие медленнее порога, выводятся в stderr,
+а код возврата равен 1.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+from PyQt5.QtWidgets import QApplication
+
+from core import CALCULATION_TYPES, CASHIERS, ORGANIZATION_FIELDS, make_item, receipt_row
+from storage import ReceiptStore
+
+ROW_SIZES = [10000, 100000, 1000000]
+PREVIEW_SIZES = [10, 100, 1000, 10000]
+ORGANIZATION_SIZES = [1000, 10000, 100000]
+DIALOG_REPEATS = 20
+
+
+def rss_bytes():
+    """Текущий объём резидентной памяти процесса."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # ru_maxrss - пик, а не текущее значение; в Linux в КБ, в macOS в байтах
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def receipt_values(index):
+    return receipt_row({
+        "category": "Запчасти",
+        "name": "Чек",
+        "organization_name": f"Организация {index % 50}",
+        "cashier": CASHIERS[index % len(CASHIERS)],
+        "shift": str(index // 1000),
+        "receipt_number": str(index + 1),
+        "calculation_type": CALCULATION_TYPES[index % len(CALCULATION_TYPES)],
+        "date_time": f"2024-01-{1 + index % 28:02d} {index % 24:02d}:00:00",
+        "payment_method": "Наличные",
+    })
+
+
+def organization(index):
+    data = {field: f"{field} {index}" for field in ORGANIZATION_FIELDS}
+    data.update(inn=f"{7700000000 + index}", rn_kht=f"{index:016d}")
+    return data
+
+
+class Bench:
+    def __init__(self, app, directory):
+        self.app = app
+        self.directory = directory
+        self.results = []
+
+    def store(self, name):
+        return ReceiptStore(os.path.join(self.directory, f"{name}.sqlite3"))
+
+    def record(self, name, size, seconds, rss_delta=None, **extra):
+        result = {"name": name, "size": size, "seconds": seconds, "per_item_us": seconds / size * 1e6}
+        if rss_delta is not None:
+            result["rss_bytes_per_item"] = rss_delta / size
+        result.update(extra)
+        self.results.append(result)
+        print(f"{name:<32}{size:>10}{seconds:>12.4f} s{result['per_item_us']:>12.2f} us"
+              + (f"{result['rss_bytes_per_item']:>10.0f} B" if rss_delta is not None else ""),
+              file=sys.stderr)
+
+    def row_insertion(self, sizes):
+        """Добавление строк по одной, как в MainWindow.edit_receipt, и пачкой, как при импорте."""
+        from app import MainWindow
+        for size in sizes:
+            for name, bulk in (("rows.append_receipt", False), ("rows.append_receipts", True)):
+                store = self.store(f"{name}_{size}")
+                window = MainWindow(store)
+                # Окно показывается: скрытая таблица не пересчитывает раскладку и ширины столбцов
+                window.show()
+                rows = [receipt_values(index) for index in range(size)]
+                # Отложенные события создания окна не должны попадать в замер
+                self.app.processEvents()
+                gc.collect()
+                rss_before = rss_bytes()
+                start = time.perf_counter()
+                if bulk:
+                    for first in range(0, size, 10000):
+                        window.model.append_receipts(rows[first:first + 10000])
+                else:
+                    for values in rows:
+                        window.model.append_receipt(values)
+                self.app.processEvents()
+                seconds = time.perf_counter() - start
+                del rows
+                gc.collect()
+                self.record(name, size, seconds, rss_bytes() - rss_before)
+                window.close()
+                window.deleteLater()
+                store.close()
+                self.app.processEvents()
+
+    def previews(self, sizes):
+        """update_previews: полная сборка, правка одной позиции и добавление позиции."""
+        from app import EditReceiptDialog
+        for size in sizes:
+            store = self.store(f"preview_{size}")
+            dialog = EditReceiptDialog([], store=store)
+            items = dialog.items_model
+            items.append_items(make_item(f"0{1000000 + row}", "2", "150.50", "5", "20") for row in range(size))
+            start = time.perf_counter()
+            dialog.update_previews()
+            self.record("preview.build", size, time.perf_counter() - start)
+
+            items.setData(items.index(size // 2, 2), "99.99")
+            start = time.perf_counter()
+            dialog.update_previews()
+            self.record("preview.edit_row", size, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            items.append_items([make_item("0999999", "1", "10", "0", "0")])
+            dialog.update_previews()
+            self.record("preview.append_row", size, time.perf_counter() - start)
+            dialog.deleteLater()
+            store.close()
+            self.app.processEvents()
+
+    def organizations(self, sizes):
+        """Открытие списка организаций: модель общая, поэтому память считается вместе с ней.
+
+        load_data диалога только сбрасывает поиск, поэтому organizations.load_data
+        замеряет саму загрузку: построение общей модели (индексы реестра)
+        и показ таблицы с ней.
+        """
+        from app import OrganizationDialog, OrganizationTableModel
+        for size in sizes:
+            organizations = [organization(index) for index in range(size)]
+            gc.collect()
+            rss_before = rss_bytes()
+            model = OrganizationTableModel(organizations)
+            start = time.perf_counter()
+            dialog = OrganizationDialog(model)
+            dialog.load_data()
+            self.record("organizations.open", size, time.perf_counter() - start, rss_bytes() - rss_before)
+            dialog.deleteLater()
+            self.app.processEvents()
+
+            start = time.perf_counter()
+            model = OrganizationTableModel(organizations)
+            dialog = OrganizationDialog(model)
+            dialog.load_data()
+            dialog.show()
+            self.app.processEvents()
+            self.record("organizations.load_data", size, time.perf_counter() - start)
+            dialog.close()
+            dialog.deleteLater()
+            self.app.processEvents()
+
+    def dialogs(self, repeats):
+        """Время создания окон и диалогов (медиана из repeats)."""
+        from app import AddItemDialog, EditReceiptDialog, MainWindow, OrganizationDialog, ReportDialog
+        from numbering import ReceiptNumberAllocator
+        store = self.store("dialogs")
+        numbers = ReceiptNumberAllocator(store.path)
+        organizations = [organization(index) for index in range(100)]
+        factories = {
+            "dialog.MainWindow": lambda: MainWindow(store),
+            "dialog.EditReceiptDialog": lambda: EditReceiptDialog(organizations, store=store, numbers=numbers),
+            "dialog.AddItemDialog": lambda: AddItemDialog(),
+            "dialog.OrganizationDialog": lambda: OrganizationDialog(organizations, store=store),
+            "dialog.ReportDialog": lambda: ReportDialog(store),
+        }
+        for name, factory in factories.items():
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                widget = factory()
+                timings.append(time.perf_counter() - start)
+                # close() останавливает потоки журнала и закрывает соединения главного окна
+                widget.close()
+                widget.deleteLater()
+                self.app.processEvents()
+            self.record(name, 1, statistics.median(timings), min_seconds=min(timings))
+
+        # Повторное открытие переиспользуемого диалога чека сводится к reset()
+        dialog = EditReceiptDialog(organizations, store=store, numbers=numbers)
+        dialog.update_previews()
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            dialog.reset()
+            timings.append(time.perf_counter() - start)
+        self.record("dialog.EditReceiptDialog.reset", 1, statistics.median(timings), min_seconds=min(timings))
+        dialog.deleteLater()
+        numbers.close()
+        store.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results, baseline, threshold):
+    """Замеры, ставшие медленнее базовых более чем в threshold раз."""
+    previous = {(result["name"], result["size"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["name"], result["size"]))
+        if old and old["seconds"] > 0 and result["seconds"] / old["seconds"] > threshold:
+            regressions.append((result, old))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Замеры производительности интерфейса")
+    parser.add_argument("--output", help="файл JSON с результатами (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="допустимое замедление относительно --compare (во сколько раз)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=ROW_SIZES, help="числа строк списка чеков")
+    parser.add_argument("--preview-sizes", type=int, nargs="+", default=PREVIEW_SIZES,
+                        help="числа позиций в чеке")
+    parser.add_argument("--organization-sizes", type=int, nargs="+", default=ORGANIZATION_SIZES,
+                        help="числа организаций")
+    parser.add_argument("--repeats", type=int, default=DIALOG_REPEATS, help="повторов создания диалогов")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as directory:
+        bench = Bench(app, directory)
+        bench.dialogs(args.repeats)
+        bench.previews(args.preview_sizes)
+        bench.organizations(args.organization_sizes)
+        bench.row_insertion(args.sizes)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "platform": platform.platform(),
+            "qpa": os.environ.get("QT_QPA_PLATFORM", ""),
+        },
+        "results": bench.results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as stream:
+            regressions = compare(bench.results, json.load(stream), args.threshold)
+        for result, old in regressions:
+            print(f"Замедление {result['name']} ({result['size']}): "
+                  f"{old['seconds']:.4f} s -> {result['seconds']:.4f} s", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""Пакетная обработка чеков из командной строки, без запуска Qt.
+
+Примеры:
+    python cli.py render receipts.jsonl --output-dir out --workers 8
+    python cli.py export receipts.csv --store receipts.sqlite3
+    python cli.py export receipts.fda --store receipts.sqlite3
+    python cli.py generate 1000000 --output receipts.jsonl --store load.sqlite3 --seed 7
+    python cli.py serve --socket /tmp/receipts.sock --workers 8
+    python cli.py report x --inn 7700000000 --rn-kht 0000000001 --shift 12
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from core import chunked, iter_receipts, normalize_receipt, receipt_row, render_receipt, write_receipts
+from fiscal import ARCHIVE_SUFFIX, ArchiveWriter
+from generator import (
+    DEFAULT_ORGANIZATIONS, DEFAULT_RECEIPTS_PER_DAY, DEFAULT_SEED, DEFAULT_START, ReceiptGenerator, chunk_tasks,
+    generate_chunk
+)
+from numbering import ReceiptNumberAllocator, assign_numbers, number_in_range
+from reports import REPORT_DAY, REPORT_X, day_summary, write_report, x_report, z_report
+from service import DEFAULT_SOCKET, serve
+from storage import DEFAULT_DB_PATH, ReceiptStore
+
+
+def bounded_map(executor, function, chunks, max_pending):
+    """Как executor.map, но не более max_pending задач в очереди.
+
+    Входные данные читаются по мере обработки, поэтому объём памяти
+    не зависит от размера файла. Результаты возвращаются в исходном порядке.
+    """
+    pending = {}
+    next_index = 0
+    next_result = 0
+    results = {}
+    chunks = iter(chunks)
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < max_pending:
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+                break
+            pending[executor.submit(function, chunk)] = next_index
+            next_index += 1
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()
+        while next_result in results:
+            yield results.pop(next_result)
+            next_result += 1
+
+
+def numbered_chunks(chunks, allocator):
+    """Пачки с присвоенными номерами; чеки с номером вне диапазона пропускаются."""
+    for chunk in chunks:
+        for receipt in chunk:
+            if not number_in_range(receipt.get("receipt_number", "")):
+                print(f"Номер чека вне диапазона, чек пропущен: {receipt['receipt_number']}", file=sys.stderr)
+        chunk = [receipt for receipt in chunk if number_in_range(receipt.get("receipt_number", ""))]
+        for number in assign_numbers(chunk, allocator):
+            print(f"Повтор номера чека: {number}", file=sys.stderr)
+        yield chunk
+
+
+def render_chunk(receipts):
+    """Нормализация и отрисовка пачки чеков в рабочем процессе."""
+    rendered = []
+    for data in receipts:
+        receipt = normalize_receipt(data)
+        rendered.append((receipt, render_receipt(receipt)))
+    return rendered
+
+
+def render_command(args):
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    store = None
+    if args.store:
+        store = ReceiptStore(args.store)
+    allocator = ReceiptNumberAllocator(args.numbering or args.store or DEFAULT_DB_PATH)
+
+    stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+    workers = args.workers or os.cpu_count() or 1
+    count = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = numbered_chunks(chunked(iter_receipts(args.input, stream), args.chunk_size), allocator)
+            for rendered in bounded_map(executor, render_chunk, chunks, workers * 2):
+                if store is not None:
+                    store.add_receipts(
+                        (receipt_row(receipt), receipt["organization"], receipt["items"])
+                        for receipt, _ in rendered
+                    )
+                for receipt, text in rendered:
+                    count += 1
+                    if args.output_dir:
+                        file_name = f"{count:08d}_{receipt['receipt_number']}.txt"
+                        with open(os.path.join(args.output_dir, file_name), "w", encoding="utf-8") as output:
+                            output.write(text + "\n")
+                    else:
+                        sys.stdout.write(text + "\n\f\n")
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if store is not None:
+            store.close()
+        allocator.close()
+    print(f"Обработано чеков: {count}", file=sys.stderr)
+    return 0
+
+
+def export_command(args):
+    store = ReceiptStore(args.store)
+    count = 0
+
+    def receipts():
+        nonlocal count
+        for receipt in store.iter_receipts():
+            count += 1
+            yield receipt
+
+    try:
+        if args.output == "-":
+            write_receipts(".jsonl", receipts(), sys.stdout)
+        else:
+            write_archive_or_receipts(args.output, receipts())
+    finally:
+        store.close()
+    print(f"Выгружено чеков: {count}", file=sys.stderr)
+    return 0
+
+
+def write_archive_or_receipts(path, receipts, stream=None):
+    """Запись потока чеков в файл: архив ФД или CSV/JSONL по расширению."""
+    if path.lower().endswith(ARCHIVE_SUFFIX):
+        with ArchiveWriter(path) as archive:
+            archive.extend(receipts)
+        for receipt_number, error in archive.skipped:
+            print(f"Чек {receipt_number} не записан в архив: {error}", file=sys.stderr)
+    elif stream is not None:
+        write_receipts(path, receipts, stream)
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as stream:
+            write_receipts(path, receipts, stream)
+
+
+def generate_command(args):
+    if not args.output and not args.store:
+        print("Укажите --output и/или --store", file=sys.stderr)
+        return 2
+    generator = ReceiptGenerator(args.seed, args.organizations, args.receipts_per_day, args.start)
+    store = ReceiptStore(args.store) if args.store else None
+    # Номера чеков в базе занимаются, чтобы редактор и импорт их не выдали повторно
+    allocator = ReceiptNumberAllocator(args.store) if args.store else None
+    workers = args.workers or os.cpu_count() or 1
+    count = 0
+
+    def receipts(chunks):
+        nonlocal count
+        for chunk in chunks:
+            if store is not None:
+                for number in assign_numbers(chunk, allocator):
+                    print(f"Повтор номера чека: {number}", file=sys.stderr)
+                store.add_receipts((receipt_row(receipt), receipt["organization"], receipt["items"])
+                                   for receipt in chunk)
+            count += len(chunk)
+            yield from chunk
+
+    try:
+        if store is not None:
+            known = {(org["inn"], org["rn_kht"]) for org in store.load_organizations()}
+            for organization in generator.organizations:
+                if (organization["inn"], organization["rn_kht"]) not in known:
+                    store.add_organization(organization)
+            store.flush()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = bounded_map(executor, generate_chunk, chunk_tasks(generator, args.count, args.chunk_size),
+                                 workers * 2)
+            if args.output == "-":
+                write_receipts(".jsonl", receipts(chunks), sys.stdout)
+            elif args.output:
+                write_archive_or_receipts(args.output, receipts(chunks))
+            else:
+                for _ in receipts(chunks):
+                    pass
+    finally:
+        if store is not None:
+            store.close()
+            allocator.close()
+    print(f"Создано чеков: {count}", file=sys.stderr)
+    return 0
+
+
+def serve_command(args):
+    serve(args.socket, args.workers)
+    return 0
+
+
+def report_command(args):
+    store = ReceiptStore(args.store)
+    organization = {"name": args.organization, "inn": args.inn, "rn_kht": args.rn_kht}
+    try:
+        if not organization["name"] and (args.inn or args.rn_kht):
+            # Наименование для шапки отчёта - из справочника организаций
+            known = store.find_organizations(inn=args.inn, rn_kht=args.rn_kht)
+            if known:
+                organization["name"] = known[0]["name"]
+        if args.kind == REPORT_DAY:
+            if not args.day:
+                print("Для сводки за день нужен --day", file=sys.stderr)
+                return 2
+            report = day_summary(store, args.day, organization if any(organization.values()) else None)
+        elif args.shift is None:
+            print("Для X/Z-отчёта нужен --shift", file=sys.stderr)
+            return 2
+        elif not store.shift_totals(organization, args.shift) and store.shift_closure(organization, args.shift) is None:
+            # Иначе Z-отчёт навсегда закрыл бы пустую смену
+            print(f"Нет чеков смены {args.shift} этой организации (проверьте --inn, --rn-kht, --organization)",
+                  file=sys.stderr)
+            return 1
+        elif args.kind == REPORT_X:
+            report = x_report(store, organization, args.shift)
+        else:
+            report = z_report(store, organization, args.shift)
+        if args.output in (None, "-"):
+            write_report(".txt", report, sys.stdout)
+        else:
+            with open(args.output, "w", encoding="utf-8", newline="") as stream:
+                write_report(args.output, report, stream)
+    finally:
+        store.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Пакетная обработка кассовых чеков")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="отрисовка чеков из CSV/JSONL")
+    render.add_argument("input", help="файл .csv или .jsonl ('-' - JSONL из stdin)")
+    render.add_argument("--output-dir", help="каталог для текстов чеков (по умолчанию stdout)")
+    render.add_argument("--store", help="сохранить чеки в базу SQLite по этому пути")
+    render.add_argument("--numbering", help="база нумерации чеков (по умолчанию --store или общая база)")
+    render.add_argument("--workers", type=int, default=None, help="число рабочих процессов")
+    render.add_argument("--chunk-size", type=int, default=500, help="чеков в одной задаче")
+    render.set_defaults(handler=render_command)
+
+    export = commands.add_parser("export", help="выгрузка чеков из базы в CSV/JSONL или архив ФД")
+    export.add_argument("output", help=f"файл .csv, .jsonl или {ARCHIVE_SUFFIX} ('-' - JSONL в stdout)")
+    export.add_argument("--store", default=DEFAULT_DB_PATH, help="база SQLite с чеками")
+    export.set_defaults(handler=export_command)
+
+    generate = commands.add_parser("generate", help="синтетические чеки для нагрузочных проверок")
+    generate.add_argument("count", type=int, help="число чеков")
+    generate.add_argument("--output", help=f"файл .csv, .jsonl или {ARCHIVE_SUFFIX} ('-' - JSONL в stdout)")
+    generate.add_argument("--store", help="добавить чеки и организации в базу SQLite по этому пути")
+    generate.add_argument("--seed", type=int, default=DEFAULT_SEED, help="seed: одинаковый seed - одинаковые чеки")
+    generate.add_argument("--organizations", type=int, default=DEFAULT_ORGANIZATIONS, help="число организаций")
+    generate.add_argument("--receipts-per-day", type=int, default=DEFAULT_RECEIPTS_PER_DAY,
+                          help="чеков в день по всем организациям")
+    generate.add_argument("--start", default=DEFAULT_START, help="первый день, YYYY-MM-DD")
+    generate.add_argument("--workers", type=int, default=None, help="число рабочих процессов")
+    generate.add_argument("--chunk-size", type=int, default=2000, help="чеков в одной задаче")
+    generate.set_defaults(handler=generate_command)
+
+    service = commands.add_parser("serve", help="служба отрисовки чеков на Unix-сокете")
+    service.add_argument("--socket", default=DEFAULT_SOCKET, help="путь к сокету")
+    service.add_argument("--workers", type=int, default=None, help="число рабочих процессов")
+    service.set_defaults(handler=serve_command)
+
+    report = commands.add_parser("report", help="X/Z-отчёт смены или сводка за день")
+    report.add_argument("kind", choices=["X", "Z", "day"], type=lambda value: value if value == "day" else value.upper())
+    report.add_argument("--store", default=DEFAULT_DB_PATH, help="база SQLite с чеками")
+    report.add_argument("--organization", default="", help="наименование организации в чеках (если у неё нет ИНН и РН ККТ)")
+    report.add_argument("--inn", default="", help="ИНН организации")
+    report.add_argument("--rn-kht", default="", help="РН ККТ организации")
+    report.add_argument("--shift", help="номер смены (для X/Z)")
+    report.add_argument("--day", help="день сводки, YYYY-MM-DD")
+    report.add_argument("--output", help="файл .txt, .csv или .json (по умолчанию текст в stdout)")
+    report.set_defaults(handler=report_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
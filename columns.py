@@ -0,0 +1,250 @@
+"""Компактное хранение чеков и позиций по столбцам в массивах array.
+
+Повторяющиеся строки (кассир, организация, признак расчета, пустые поля)
+кодируются словарём: в столбце лежат 2-байтовые коды, каждая строка
+хранится один раз. Дата/время - секунды от эпохи, номер чека - число,
+если он записан цифрами без ведущих нулей. Позиции чека - целые
+величины движка цен (pricing) вместо текста ячеек.
+
+Столбцы ведут себя как списки: индекс, срез, вставка срезом, удаление.
+"""
+from array import array
+
+from core import RECEIPT_FIELDS
+from pricing import (
+    ITEM_SCALES, format_fixed, format_money, line_cost, parse_field, parse_item, price_lines
+)
+
+
+class _Column:
+    """Массив кодов; encode/decode переводят значения в коды и обратно."""
+
+    __slots__ = ("codes",)
+    typecode = "q"
+
+    def __init__(self, values=()):
+        self.codes = array(self.typecode)
+        self.extend(values)
+
+    def encode(self, value):
+        return value
+
+    def decode(self, code):
+        return code
+
+    def _encode_all(self, values):
+        codes = [self.encode(value) for value in values]
+        return array(self.codes.typecode, codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return map(self.decode, self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.decode(code) for code in self.codes[index]]
+        return self.decode(self.codes[index])
+
+    # Коды вычисляются до обращения к self.codes: словарь может заменить массив более широким
+
+    def __setitem__(self, index, value):
+        codes = self._encode_all(value) if isinstance(index, slice) else self.encode(value)
+        self.codes[index] = codes
+
+    def __delitem__(self, index):
+        del self.codes[index]
+
+    def append(self, value):
+        code = self.encode(value)
+        self.codes.append(code)
+
+    def extend(self, values):
+        codes = self._encode_all(values)
+        self.codes.extend(codes)
+
+    def clear(self):
+        del self.codes[:]
+
+
+class IntColumn(_Column):
+    """Целые числа (секунды от эпохи) в 8-байтовом массиве."""
+
+    __slots__ = ()
+
+    def encode(self, value):
+        return int(value)
+
+    def _encode_all(self, values):
+        return array(self.typecode, map(int, values))
+
+
+class IdColumn(_Column):
+    """Идентификаторы чеков в хранилище; 0 означает несохранённый чек (None)."""
+
+    __slots__ = ()
+
+    def encode(self, value):
+        return 0 if value is None else value
+
+    def decode(self, code):
+        return code or None
+
+
+class DictionaryColumn(_Column):
+    """Строки, закодированные номерами в словаре значений столбца.
+
+    Коды 2-байтовые, пока различных значений не больше 65536, затем 4-байтовые.
+    Словарь только растёт: удаление строк не освобождает значения.
+    """
+
+    __slots__ = ("values", "_codes_by_value")
+    typecode = "H"
+
+    def __init__(self, values=()):
+        self.values = []
+        self._codes_by_value = {}
+        super().__init__(values)
+
+    def encode(self, value):
+        code = self._codes_by_value.get(value)
+        if code is None:
+            value = str(value)
+            code = self._codes_by_value.get(value)
+            if code is None:
+                code = self._codes_by_value[value] = len(self.values)
+                self.values.append(value)
+                if code == 0x10000 and self.codes.typecode == "H":
+                    self.codes = array("I", self.codes)
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+    def _encode_all(self, values):
+        # Почти все значения уже есть в словаре: сначала одно обращение к dict на значение
+        values = values if isinstance(values, list) else list(values)
+        codes = list(map(self._codes_by_value.get, values))
+        if None in codes:
+            codes = [self.encode(value) if code is None else code for value, code in zip(values, codes)]
+        return array(self.codes.typecode, codes)
+
+    def code(self, value):
+        """Код значения или None, если такого значения в столбце нет."""
+        return self._codes_by_value.get(value)
+
+
+class NumberColumn(DictionaryColumn):
+    """Номера чеков: цифровые - числами, прочие - через словарь (отрицательные коды)."""
+
+    __slots__ = ()
+    typecode = "q"
+    _encode_all = _Column._encode_all
+
+    def encode(self, value):
+        value = str(value)
+        if value.isdigit() and (value == "0" or value[0] != "0") and len(value) < 19:
+            return int(value)
+        return -1 - super().encode(value)
+
+    def decode(self, code):
+        return str(code) if code >= 0 else self.values[-1 - code]
+
+
+# Класс столбца для каждого поля списка чеков (RECEIPT_FIELDS)
+RECEIPT_COLUMN_TYPES = {
+    "receipt_number": NumberColumn,
+    "date_time": IntColumn,
+}
+
+
+def receipt_columns():
+    """Пустые столбцы списка чеков в порядке RECEIPT_FIELDS."""
+    return [RECEIPT_COLUMN_TYPES.get(field, DictionaryColumn)() for field in RECEIPT_FIELDS]
+
+
+class ItemColumns:
+    """Позиции чека: наименования в словаре, числа - целые величины движка цен."""
+
+    __slots__ = ("names", "quantities", "prices", "discounts", "vat_rates")
+
+    def __init__(self, items=()):
+        self.names = DictionaryColumn()
+        self.quantities = array("q")
+        self.prices = array("q")
+        self.discounts = array("q")
+        self.vat_rates = array("q")
+        self.extend(items)
+
+    def _numbers(self):
+        return self.quantities, self.prices, self.discounts, self.vat_rates
+
+    def __len__(self):
+        return len(self.quantities)
+
+    @staticmethod
+    def convert(item):
+        """Наименование и целые величины позиции из строк ITEM_FIELDS; некорректные числа считаются нулями."""
+        name, quantity, price, discount, vat_rate = (list(item) + [""] * 5)[:5]
+        try:
+            fixed = parse_item(quantity or "0", price or "0", discount or "0", vat_rate or "0")
+        except (ValueError, OverflowError):
+            fixed = (0, 0, 0, 0)
+        return name, fixed
+
+    def append(self, item):
+        self.extend_converted([self.convert(item)])
+
+    def extend(self, items):
+        self.extend_converted([self.convert(item) for item in items])
+
+    def extend_converted(self, rows):
+        """Добавление позиций, уже переведённых convert: столбцы не меняются при ошибке разбора."""
+        self.names.extend([name for name, _ in rows])
+        for column, values in zip(self._numbers(), zip(*(fixed for _, fixed in rows))):
+            column.extend(values)
+
+    def clear(self):
+        self.names.clear()
+        for column in self._numbers():
+            del column[:]
+
+    def __delitem__(self, index):
+        del self.names[index]
+        for column in self._numbers():
+            del column[index]
+
+    def fixed(self, row):
+        """Название и целые величины позиции: (name, quantity, price, discount, vat_rate)."""
+        return (self.names[row], self.quantities[row], self.prices[row],
+                self.discounts[row], self.vat_rates[row])
+
+    def set_value(self, row, column, text):
+        """Изменение поля позиции по номеру столбца ITEM_FIELDS; ValueError - некорректное значение."""
+        if column == 0:
+            self.names[row] = text
+        elif 1 <= column <= 4:
+            self._numbers()[column - 1][row] = parse_field(column - 1, text)
+        else:
+            raise ValueError("Стоимость рассчитывается и не изменяется")
+
+    def text(self, row, column):
+        if column == 0:
+            return self.names[row]
+        if column == 2:
+            return format_money(self.prices[row])
+        if column == 5:
+            return format_money(line_cost(*self.fixed(row)[1:])[0])
+        return format_fixed(self._numbers()[column - 1][row], ITEM_SCALES[column - 1])
+
+    def item(self, row):
+        """Позиция строками ITEM_FIELDS, как её возвращает core.make_item."""
+        return tuple(self.text(row, column) for column in range(6))
+
+    def items(self):
+        return [self.item(row) for row in range(len(self))]
+
+    def costs(self):
+        """Стоимости и суммы НДС всех позиций за один проход (массивы в копейках)."""
+        return price_lines(*self._numbers())
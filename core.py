@@ -0,0 +1,260 @@
+"""Данные и форматирование чеков без зависимости от Qt.
+
+Организация - словарь с полями ORGANIZATION_FIELDS, позиция - кортеж строк
+ITEM_FIELDS (как в таблице товаров диалога), чек - словарь с полями
+RECEIPT_FIELDS, а также "organization" и "items".
+"""
+import csv
+import json
+import random
+from datetime import datetime
+from itertools import islice
+
+from pricing import (
+    PERCENT_SCALE, QUANTITY_SCALE, format_fixed, format_money, line_cost, parse_field, parse_item
+)
+
+ORGANIZATION_FIELDS = [
+    "category", "name", "trade_object", "address", "contact",
+    "tax_system", "inn", "zn_kht", "rn_kht"
+]
+
+# Порядок совпадает со столбцами списка чеков и EditReceiptDialog.get_data
+RECEIPT_FIELDS = [
+    "category", "name", "organization_name", "cashier",
+    "shift", "receipt_number", "calculation_type", "date_time", "payment_method"
+]
+
+ITEM_FIELDS = ["name", "quantity", "price", "discount", "vat", "cost"]
+
+CATEGORIES = ["Запчасти", "Работы"]
+CASHIERS = ["Васильев Григорий Павлович", "Николаев Евгений Алексеевич"]
+CALCULATION_TYPES = ["Приход", "Расход", "Возврат прихода", "Возврат расхода"]
+
+DATE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+RECEIPT_WIDTH = 50
+
+
+def generate_receipt_number(rng=random):
+    """Генерация случайного номера чека из 6 цифр."""
+    return f"{rng.randint(100000, 999999)}"
+
+
+def random_item_name(rng=random):
+    """Генерация случайного наименования в формате 0*******."""
+    return f"0{rng.randint(1000000, 9999999)}"
+
+
+def make_item(name, quantity="0", price="0", discount="0", vat="0"):
+    """Позиция чека из введённых строк; некорректные и недопустимые числа считаются нулями.
+
+    Числа записываются так же, как их показывает таблица позиций (columns.ItemColumns).
+    """
+    try:
+        fixed = parse_item(*(value or "0" for value in (quantity, price, discount, vat)))
+    except ValueError:
+        fixed = (0, 0, 0, 0)
+    quantity, price, discount, vat = fixed
+    return (name, format_fixed(quantity, QUANTITY_SCALE), format_money(price),
+            format_fixed(discount, PERCENT_SCALE), format_fixed(vat, PERCENT_SCALE),
+            format_money(line_cost(*fixed)[0]))
+
+
+def _number(text, field):
+    try:
+        return parse_field(field, text)
+    except ValueError:
+        return 0
+
+
+def item_line(item):
+    """Строка позиции в чеке, её стоимость и сумма НДС в копейках."""
+    name, quantity, price, discount, vat_rate = (list(item) + [""] * 5)[:5]
+    numbers = (_number(value, field) for field, value in enumerate((quantity, price, discount, vat_rate)))
+    return fixed_item_line(name, *numbers)
+
+
+def fixed_item_line(name, quantity, price, discount, vat_rate):
+    """Как item_line, но для целых величин движка цен (columns.ItemColumns.fixed)."""
+    cost, vat = line_cost(quantity, price, discount, vat_rate)
+    line = f"{name}: {quantity / QUANTITY_SCALE:g} x {format_money(price)}"
+    if discount:
+        line += f" - {discount / PERCENT_SCALE:g}%"
+    return f"{line} = {format_money(cost)}", cost, vat
+
+
+def organization_header_lines(organization_name):
+    """Начало шапки чека, зависящее только от организации."""
+    organization = organization_name or "Не выбрано"
+    return [
+        organization.center(RECEIPT_WIDTH),
+        f"Адрес расчета: {organization}",
+        "Контактные данные: +7 (XXX) XXX-XX-XX",
+        "",
+        "Кассовый чек".center(RECEIPT_WIDTH),
+    ]
+
+
+def header_lines(organization_name, cashier, shift, receipt_number, organization_header=organization_header_lines):
+    return organization_header(organization_name) + [
+        f"Номер чека: {receipt_number}",
+        f"Смена: {shift or 'Не указана'}",
+        f"Кассир: {cashier or 'Не указан'}",
+        "=" * RECEIPT_WIDTH,
+    ]
+
+
+def footer_lines(total, vat_total):
+    return [
+        "=" * RECEIPT_WIDTH,
+        f"{'ИТОГО':<40}{format_money(total):>10}",
+        f"{'в т.ч. НДС':<40}{format_money(vat_total):>10}",
+        "",
+    ]
+
+
+def render_receipt(receipt, organization_header=organization_header_lines):
+    """Текст чека в том же виде, что и предварительный просмотр в редакторе.
+
+    organization_header - функция начала шапки (например, с кэшем по организации).
+    """
+    lines = header_lines(
+        receipt.get("organization_name") or receipt.get("organization", {}).get("name", ""),
+        receipt.get("cashier", ""),
+        receipt.get("shift", ""),
+        receipt.get("receipt_number", ""),
+        organization_header,
+    )
+    total = vat_total = 0
+    for item in receipt.get("items", ()):
+        line, cost, vat = item_line(item)
+        lines.append(line)
+        total += cost
+        vat_total += vat
+    return "\n".join(lines + footer_lines(total, vat_total))
+
+
+def normalize_receipt(data):
+    """Чек из словаря произвольного источника (JSON, CSV) с заполнением пропусков.
+
+    Позиции принимаются как словари ITEM_FIELDS или как последовательности строк;
+    стоимость всегда пересчитывается. Номер чека не генерируется:
+    его выдаёт numbering.ReceiptNumberAllocator.
+    """
+    organization = {field: str(data.get("organization", {}).get(field, "")) for field in ORGANIZATION_FIELDS}
+    receipt = {field: data.get(field, "") for field in RECEIPT_FIELDS}
+    receipt["organization_name"] = receipt["organization_name"] or organization["name"]
+    receipt["category"] = receipt["category"] or organization["category"]
+    receipt["calculation_type"] = receipt["calculation_type"] or CALCULATION_TYPES[0]
+    receipt["receipt_number"] = str(receipt["receipt_number"])
+    if not receipt["date_time"]:
+        receipt["date_time"] = datetime.now().strftime(DATE_TIME_FORMAT)
+    items = []
+    for item in data.get("items", ()):
+        if isinstance(item, dict):
+            item = [item.get(field, "") for field in ITEM_FIELDS]
+        items.append(make_item(*(str(value) for value in list(item)[:5])))
+    receipt["organization"] = organization
+    receipt["items"] = items
+    return receipt
+
+
+def receipt_row(receipt):
+    """Девять значений строки списка чеков (как EditReceiptDialog.get_data)."""
+    return [receipt.get(field, "") for field in RECEIPT_FIELDS]
+
+
+# Чтение и запись чеков в файлы
+
+def chunked(iterable, size):
+    """Разбиение потока на списки по size элементов без чтения всего потока."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_jsonl_receipts(lines):
+    """Чеки из JSONL: один объект чека на строку."""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+# Порядковый номер чека в файле: различает соседние чеки с одинаковыми полями
+CSV_RECEIPT_COLUMN = "receipt"
+CSV_ORGANIZATION_PREFIX = "organization."
+CSV_ITEM_PREFIX = "item."
+CSV_FIELDS = (
+    [CSV_RECEIPT_COLUMN]
+    + RECEIPT_FIELDS
+    + [CSV_ORGANIZATION_PREFIX + field for field in ORGANIZATION_FIELDS]
+    + [CSV_ITEM_PREFIX + field for field in ITEM_FIELDS]
+)
+
+
+def iter_csv_receipts(lines):
+    """Чеки из CSV: строка на позицию, поля чека повторяются.
+
+    Соседние строки с одинаковыми полями чека и организации (и столбцом
+    CSV_RECEIPT_COLUMN, если он есть) относятся к одному чеку.
+    Строка без наименования позиции задаёт чек без позиций.
+    """
+    current_key, current = None, None
+    for row in csv.DictReader(lines):
+        key = tuple(value for column, value in row.items() if not column.startswith(CSV_ITEM_PREFIX))
+        if key != current_key:
+            if current is not None:
+                yield current
+            current_key = key
+            current = {field: row.get(field, "") for field in RECEIPT_FIELDS}
+            current["organization"] = {
+                field: row.get(CSV_ORGANIZATION_PREFIX + field, "") for field in ORGANIZATION_FIELDS
+            }
+            current["items"] = []
+        if row.get(CSV_ITEM_PREFIX + "name"):
+            current["items"].append({field: row.get(CSV_ITEM_PREFIX + field, "") for field in ITEM_FIELDS})
+    if current is not None:
+        yield current
+
+
+def iter_receipts(path, stream):
+    """Чтение чеков из открытого текстового потока; формат - по расширению файла."""
+    if path.lower().endswith(".csv"):
+        return iter_csv_receipts(stream)
+    return iter_jsonl_receipts(stream)
+
+
+def receipt_to_json(receipt):
+    """Чек в виде, пригодном для JSON: позиции - словари ITEM_FIELDS."""
+    data = {field: receipt.get(field, "") for field in RECEIPT_FIELDS}
+    data["organization"] = {field: (receipt.get("organization") or {}).get(field, "") for field in ORGANIZATION_FIELDS}
+    data["items"] = [dict(zip(ITEM_FIELDS, item)) for item in receipt.get("items", ())]
+    return data
+
+
+def write_jsonl_receipts(receipts, stream):
+    for receipt in receipts:
+        stream.write(json.dumps(receipt_to_json(receipt), ensure_ascii=False) + "\n")
+
+
+def write_csv_receipts(receipts, stream):
+    """Запись в формате iter_csv_receipts: строка на позицию, чек без позиций - одной строкой."""
+    writer = csv.writer(stream)
+    writer.writerow(CSV_FIELDS)
+    for number, receipt in enumerate(receipts, 1):
+        head = [number] + [receipt.get(field, "") for field in RECEIPT_FIELDS]
+        head += [(receipt.get("organization") or {}).get(field, "") for field in ORGANIZATION_FIELDS]
+        items = receipt.get("items") or [[""] * len(ITEM_FIELDS)]
+        writer.writerows(head + list(item) for item in items)
+
+
+def write_receipts(path, receipts, stream):
+    """Запись чеков в открытый текстовый поток; формат - по расширению файла."""
+    if path.lower().endswith(".csv"):
+        write_csv_receipts(receipts, stream)
+    else:
+        write_jsonl_receipts(receipts, stream)
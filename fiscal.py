@@ -0,0 +1,484 @@
+"""Архив фискальных документов: чеки в двоичном формате TLV по образцу ФФД.
+
+Реквизит - тег (2 байта), длина (2 байта) и значение; числа - в порядке
+байтов little-endian, строки - в CP866, как на фискальном накопителе.
+Строка с символами вне CP866 («», латинские буквы с диакритикой)
+дополнительно записывается точной копией в UTF-8 (TAG_UTF8_TEXT).
+Чек - документ с тегом 3, внутри - реквизиты организации, чека и
+предметы расчета (тег 1059). Поля, для которых в ФФД нет реквизита
+(категория, контакты, скидка, текстовые номера и даты), записываются
+собственными тегами вне диапазона ФФД.
+
+Файл архива: заголовок ARCHIVE_MAGIC, документы подряд, индекс смещений
+(uint64) и концевик с его положением. ArchiveReader отображает файл
+в память (mmap) и разбирает только запрошенный документ; архив без
+концевика (запись прервана) индексируется просмотром заголовков документов.
+"""
+import mmap
+import struct
+import sys
+from array import array
+from datetime import datetime
+
+from core import DATE_TIME_FORMAT, ORGANIZATION_FIELDS, RECEIPT_FIELDS
+from pricing import PERCENT_SCALE, QUANTITY_SCALE, format_fixed, format_money, line_cost, parse_item
+
+ARCHIVE_SUFFIX = ".fda"
+ARCHIVE_MAGIC = b"FDARCH\x00\x01"
+FOOTER_MAGIC = b"FDINDEX\x00"
+_HEADER = struct.Struct("<HH")
+_TAG = struct.Struct("<H")
+_FOOTER = struct.Struct("<QQ8s")
+_OFFSET = struct.Struct("<Q")
+
+ENCODING = "cp866"
+MAX_LENGTH = 0xFFFF
+
+# Реквизиты ФФД
+TAG_RECEIPT = 3
+TAG_ADDRESS = 1009
+TAG_DATE_TIME = 1012
+TAG_ZN_KHT = 1013
+TAG_INN = 1018
+TAG_TOTAL = 1020
+TAG_CASHIER = 1021
+TAG_QUANTITY = 1023
+TAG_ITEM_NAME = 1030
+TAG_RN_KHT = 1037
+TAG_SHIFT = 1038
+TAG_RECEIPT_NUMBER = 1042
+TAG_COST = 1043
+TAG_USER_NAME = 1048
+TAG_CALCULATION_TYPE = 1054
+TAG_TAX_SYSTEM = 1055
+TAG_ITEM = 1059
+TAG_PRICE = 1079
+TAG_TRADE_OBJECT = 1187
+TAG_VAT_CODE = 1199
+TAG_VAT_AMOUNT = 1200
+
+# Собственные реквизиты архива
+TAG_CATEGORY = 60001
+TAG_RECEIPT_NAME = 60002
+TAG_ORGANIZATION_NAME = 60003
+TAG_PAYMENT_METHOD = 60004
+TAG_SHIFT_TEXT = 60005
+TAG_NUMBER_TEXT = 60006
+TAG_CALCULATION_TEXT = 60007
+TAG_DATE_TIME_TEXT = 60008
+TAG_ORGANIZATION_CATEGORY = 60010
+TAG_CONTACT = 60011
+TAG_TAX_SYSTEM_TEXT = 60012
+TAG_DISCOUNT = 60020
+TAG_VAT_RATE = 60021
+# Тег исходного реквизита (2 байта) и его значение в UTF-8
+TAG_UTF8_TEXT = 60100
+
+ORGANIZATION_TAGS = {
+    "name": TAG_USER_NAME, "inn": TAG_INN, "zn_kht": TAG_ZN_KHT, "rn_kht": TAG_RN_KHT,
+    "address": TAG_ADDRESS, "trade_object": TAG_TRADE_OBJECT,
+    "category": TAG_ORGANIZATION_CATEGORY, "contact": TAG_CONTACT,
+}
+RECEIPT_TAGS = {
+    "category": TAG_CATEGORY, "name": TAG_RECEIPT_NAME, "cashier": TAG_CASHIER,
+    "payment_method": TAG_PAYMENT_METHOD,
+}
+
+# Значения перечислений ФФД; прочие значения пишутся текстом в собственные реквизиты
+CALCULATION_CODES = {"Приход": 1, "Возврат прихода": 2, "Расход": 3, "Возврат расхода": 4}
+TAX_SYSTEM_CODES = {"ОСН": 1, "УСН доход": 2, "УСН доход - расход": 4, "ЕНВД": 8, "ЕСХН": 16, "ПСН": 32}
+# Ставка НДС в сотых долях процента -> код реквизита 1199
+VAT_CODES = {20 * PERCENT_SCALE: 1, 10 * PERCENT_SCALE: 2, 0: 5, 5 * PERCENT_SCALE: 7, 7 * PERCENT_SCALE: 8}
+
+_CALCULATION_TYPES = {code: name for name, code in CALCULATION_CODES.items()}
+_TAX_SYSTEMS = {code: name for name, code in TAX_SYSTEM_CODES.items()}
+_VAT_RATES = {code: rate for rate, code in VAT_CODES.items()}
+
+
+# Кодирование реквизитов
+
+def tlv(tag, value):
+    if len(value) > MAX_LENGTH:
+        raise ValueError(f"Реквизит {tag} длиннее {MAX_LENGTH} байт")
+    return _HEADER.pack(tag, len(value)) + value
+
+
+def _string(tag, text):
+    if not text:
+        return b""
+    text = str(text)
+    try:
+        return tlv(tag, text.encode(ENCODING))
+    except UnicodeEncodeError:
+        # В реквизите ФФД символы вне CP866 заменяются "?", как при печати на ККТ
+        return (tlv(tag, text.encode(ENCODING, "replace"))
+                + tlv(TAG_UTF8_TEXT, _TAG.pack(tag) + text.encode("utf-8")))
+
+
+def _vln(value):
+    """Целое минимальной длины; отрицательные - в дополнительном коде (в ФФД только >= 0)."""
+    return value.to_bytes(max(1, (value.bit_length() + 8) // 8), "little", signed=True)
+
+
+def _fvln(value, scale):
+    """Число с плавающей точкой ФФД: первый байт - число знаков после запятой."""
+    return bytes([len(str(scale)) - 1]) + _vln(value)
+
+
+def _read_vln(view):
+    return int.from_bytes(view, "little", signed=True)
+
+
+def _read_fvln(view, scale):
+    divisor = 10 ** view[0]
+    return _read_vln(view[1:]) * scale // divisor
+
+
+def _read_string(value):
+    # Точная копия из TAG_UTF8_TEXT приходит из _iter_fields уже строкой
+    return value if isinstance(value, str) else str(value, ENCODING)
+
+
+def _uint32_text(text):
+    """Номер смены или чека для целочисленного реквизита, иначе None."""
+    text = str(text)
+    if text.isdigit() and (text == "0" or text[0] != "0") and int(text) < 1 << 32:
+        return int(text)
+    return None
+
+
+def _timestamp(text):
+    """Дата и время для реквизита 1012 (uint32, секунды с 1970 года), иначе None."""
+    try:
+        moment = datetime.fromisoformat(str(text))
+        timestamp = int(moment.timestamp())
+    except (ValueError, OverflowError, OSError):
+        return None
+    if 0 <= timestamp < 1 << 32 and moment.microsecond == 0:
+        return timestamp
+    return None
+
+
+def iter_tlv(view):
+    """Пары (тег, значение) подряд идущих реквизитов; значения - срезы view без копирования."""
+    offset = 0
+    end = len(view)
+    while offset < end:
+        if offset + _HEADER.size > end:
+            raise ValueError("Обрезанный заголовок реквизита")
+        tag, length = _HEADER.unpack_from(view, offset)
+        offset += _HEADER.size
+        if offset + length > end:
+            raise ValueError(f"Обрезанное значение реквизита {tag}")
+        yield tag, view[offset:offset + length]
+        offset += length
+
+
+def _iter_fields(view):
+    """Как iter_tlv, но TAG_UTF8_TEXT выдаётся с тегом исходного реквизита и значением-строкой.
+
+    Копия следует за реквизитом в CP866 и заменяет его значение при разборе.
+    """
+    for tag, value in iter_tlv(view):
+        if tag == TAG_UTF8_TEXT:
+            yield _TAG.unpack_from(value)[0], str(value[_TAG.size:], "utf-8")
+        else:
+            yield tag, value
+
+
+# Организация
+
+def encode_organization(organization):
+    """Реквизиты пользователя (ИНН, ЗН/РН КХТ, система налогообложения и др.)."""
+    parts = [_string(tag, organization.get(field, "")) for field, tag in ORGANIZATION_TAGS.items()]
+    tax_system = organization.get("tax_system", "")
+    if tax_system in TAX_SYSTEM_CODES:
+        parts.append(tlv(TAG_TAX_SYSTEM, bytes([TAX_SYSTEM_CODES[tax_system]])))
+    else:
+        parts.append(_string(TAG_TAX_SYSTEM_TEXT, tax_system))
+    return b"".join(parts)
+
+
+_ORGANIZATION_FIELDS_BY_TAG = {tag: field for field, tag in ORGANIZATION_TAGS.items()}
+
+
+def _decode_organization_tag(organization, tag, value):
+    """Реквизит организации в словарь; False - тег не относится к организации."""
+    field = _ORGANIZATION_FIELDS_BY_TAG.get(tag)
+    if field is not None:
+        organization[field] = _read_string(value)
+    elif tag == TAG_TAX_SYSTEM:
+        organization["tax_system"] = _TAX_SYSTEMS.get(value[0], "")
+    elif tag == TAG_TAX_SYSTEM_TEXT:
+        organization["tax_system"] = _read_string(value)
+    else:
+        return False
+    return True
+
+
+def decode_organization(view):
+    organization = dict.fromkeys(ORGANIZATION_FIELDS, "")
+    for tag, value in _iter_fields(memoryview(view)):
+        _decode_organization_tag(organization, tag, value)
+    return organization
+
+
+# Предметы расчета
+
+def encode_item(item):
+    """Позиция - строки ITEM_FIELDS; стоимость и НДС пересчитываются, некорректные числа - нули."""
+    name, quantity, price, discount, vat_rate = (list(item) + [""] * 5)[:5]
+    try:
+        fixed = parse_item(quantity or "0", price or "0", discount or "0", vat_rate or "0")
+    except ValueError:
+        fixed = (0, 0, 0, 0)
+    return encode_fixed_item(name, *fixed)
+
+
+def encode_fixed_item(name, quantity, price, discount, vat_rate):
+    """Позиция из целых величин движка цен (columns.ItemColumns.fixed)."""
+    cost, vat = line_cost(quantity, price, discount, vat_rate)
+    parts = [
+        _string(TAG_ITEM_NAME, name),
+        tlv(TAG_QUANTITY, _fvln(quantity, QUANTITY_SCALE)),
+        tlv(TAG_PRICE, _vln(price)),
+    ]
+    if discount:
+        parts.append(tlv(TAG_DISCOUNT, _fvln(discount, PERCENT_SCALE)))
+    if vat_rate in VAT_CODES:
+        parts.append(tlv(TAG_VAT_CODE, bytes([VAT_CODES[vat_rate]])))
+    else:
+        parts.append(tlv(TAG_VAT_RATE, _fvln(vat_rate, PERCENT_SCALE)))
+    parts.append(tlv(TAG_COST, _vln(cost)))
+    parts.append(tlv(TAG_VAT_AMOUNT, _vln(vat)))
+    return tlv(TAG_ITEM, b"".join(parts)), cost
+
+
+def decode_item(view):
+    """Позиция строками ITEM_FIELDS, как columns.ItemColumns.item."""
+    name, quantity, price, discount, vat_rate, cost = "", 0, 0, 0, 0, 0
+    for tag, value in _iter_fields(memoryview(view)):
+        if tag == TAG_ITEM_NAME:
+            name = _read_string(value)
+        elif tag == TAG_QUANTITY:
+            quantity = _read_fvln(value, QUANTITY_SCALE)
+        elif tag == TAG_PRICE:
+            price = _read_vln(value)
+        elif tag == TAG_DISCOUNT:
+            discount = _read_fvln(value, PERCENT_SCALE)
+        elif tag == TAG_VAT_CODE:
+            vat_rate = _VAT_RATES.get(value[0], 0)
+        elif tag == TAG_VAT_RATE:
+            vat_rate = _read_fvln(value, PERCENT_SCALE)
+        elif tag == TAG_COST:
+            cost = _read_vln(value)
+    return (name, format_fixed(quantity, QUANTITY_SCALE), format_money(price),
+            format_fixed(discount, PERCENT_SCALE), format_fixed(vat_rate, PERCENT_SCALE), format_money(cost))
+
+
+# Чек
+
+def encode_receipt(receipt):
+    """Документ "кассовый чек" (тег 3) из чека core: поля, организация и позиции."""
+    organization = receipt.get("organization") or {}
+    parts = [encode_organization(organization)]
+    parts.extend(_string(tag, receipt.get(field, "")) for field, tag in RECEIPT_TAGS.items())
+    if receipt.get("organization_name", "") != organization.get("name", ""):
+        parts.append(_string(TAG_ORGANIZATION_NAME, receipt["organization_name"]))
+    for field, tag, text_tag in (("shift", TAG_SHIFT, TAG_SHIFT_TEXT),
+                                 ("receipt_number", TAG_RECEIPT_NUMBER, TAG_NUMBER_TEXT)):
+        number = _uint32_text(receipt.get(field, ""))
+        parts.append(tlv(tag, number.to_bytes(4, "little")) if number is not None
+                     else _string(text_tag, receipt.get(field, "")))
+    calculation_type = receipt.get("calculation_type", "")
+    if calculation_type in CALCULATION_CODES:
+        parts.append(tlv(TAG_CALCULATION_TYPE, bytes([CALCULATION_CODES[calculation_type]])))
+    else:
+        parts.append(_string(TAG_CALCULATION_TEXT, calculation_type))
+    if receipt.get("date_time"):
+        # Даты до 1970 года и нераспознанные - текстом, без потери значения
+        timestamp = _timestamp(receipt["date_time"])
+        parts.append(tlv(TAG_DATE_TIME, timestamp.to_bytes(4, "little")) if timestamp is not None
+                     else _string(TAG_DATE_TIME_TEXT, receipt["date_time"]))
+    total = 0
+    for item in receipt.get("items", ()):
+        encoded, cost = encode_item(item)
+        parts.append(encoded)
+        total += cost
+    parts.append(tlv(TAG_TOTAL, _vln(total)))
+    return tlv(TAG_RECEIPT, b"".join(parts))
+
+
+_RECEIPT_FIELDS_BY_TAG = {tag: field for field, tag in RECEIPT_TAGS.items()}
+_RECEIPT_FIELDS_BY_TAG.update({
+    TAG_SHIFT_TEXT: "shift", TAG_NUMBER_TEXT: "receipt_number",
+    TAG_CALCULATION_TEXT: "calculation_type", TAG_ORGANIZATION_NAME: "organization_name",
+    TAG_DATE_TIME_TEXT: "date_time",
+})
+
+
+def decode_receipt(view):
+    """Чек core (как storage.ReceiptStore.load_receipt) из документа с тегом 3."""
+    view = memoryview(view)
+    tag, length = _HEADER.unpack_from(view)
+    if tag != TAG_RECEIPT:
+        raise ValueError(f"Документ {tag} не является кассовым чеком")
+    receipt = dict.fromkeys(RECEIPT_FIELDS, "")
+    organization = dict.fromkeys(ORGANIZATION_FIELDS, "")
+    items = []
+    organization_name = None
+    for tag, value in _iter_fields(view[_HEADER.size:_HEADER.size + length]):
+        field = _RECEIPT_FIELDS_BY_TAG.get(tag)
+        if field is not None:
+            receipt[field] = _read_string(value)
+            if tag == TAG_ORGANIZATION_NAME:
+                organization_name = receipt[field]
+        elif tag == TAG_ITEM:
+            items.append(decode_item(value))
+        elif tag in (TAG_SHIFT, TAG_RECEIPT_NUMBER):
+            receipt["shift" if tag == TAG_SHIFT else "receipt_number"] = str(int.from_bytes(value, "little"))
+        elif tag == TAG_CALCULATION_TYPE:
+            receipt["calculation_type"] = _CALCULATION_TYPES.get(value[0], "")
+        elif tag == TAG_DATE_TIME:
+            receipt["date_time"] = datetime.fromtimestamp(int.from_bytes(value, "little")).strftime(DATE_TIME_FORMAT)
+        else:
+            _decode_organization_tag(organization, tag, value)
+    receipt["organization_name"] = organization["name"] if organization_name is None else organization_name
+    receipt["organization"] = organization
+    receipt["items"] = items
+    return receipt
+
+
+# Файл архива
+
+class ArchiveWriter:
+    """Запись архива: документы в порядке добавления, в конце - индекс смещений.
+
+    Чек, который не помещается в документ (длина реквизита больше MAX_LENGTH),
+    extend пропускает: его номер и ошибка попадают в skipped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._stream = open(path, "wb")
+        self._stream.write(ARCHIVE_MAGIC)
+        self._offsets = array("Q")
+        self.skipped = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, receipt):
+        """Запись чека; возвращает его номер в архиве. ValueError - чек не кодируется."""
+        document = encode_receipt(receipt)
+        self._offsets.append(self._stream.tell())
+        self._stream.write(document)
+        return len(self._offsets) - 1
+
+    def extend(self, receipts):
+        for receipt in receipts:
+            try:
+                self.append(receipt)
+            except ValueError as error:
+                self.skipped.append((receipt.get("receipt_number", ""), str(error)))
+
+    def close(self):
+        if self._stream.closed:
+            return
+        # Индекс выравнивается по 8 байтам
+        self._stream.write(b"\x00" * (-self._stream.tell() % 8))
+        index_offset = self._stream.tell()
+        offsets = array("Q", self._offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        offsets.tofile(self._stream)
+        self._stream.write(_FOOTER.pack(index_offset, len(self._offsets), FOOTER_MAGIC))
+        self._stream.close()
+
+
+class ArchiveReader:
+    """Чтение архива через mmap: чек по номеру без разбора остальных документов."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Пустой файл архива: {path}")
+        self._view = memoryview(self._map)
+        if self._view[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(f"Файл не является архивом чеков: {path}")
+        self._index_offset, self._count, self._offsets = self._read_index()
+
+    def _read_index(self):
+        size = len(self._view)
+        if size >= len(ARCHIVE_MAGIC) + _FOOTER.size:
+            index_offset, count, magic = _FOOTER.unpack_from(self._view, size - _FOOTER.size)
+            if magic == FOOTER_MAGIC and index_offset + count * _OFFSET.size == size - _FOOTER.size:
+                return index_offset, count, None
+        # Концевика нет - запись прервалась: смещения собираются по заголовкам документов
+        offsets = array("Q")
+        offset = len(ARCHIVE_MAGIC)
+        while offset + _HEADER.size <= size:
+            tag, length = _HEADER.unpack_from(self._view, offset)
+            if tag != TAG_RECEIPT or offset + _HEADER.size + length > size:
+                break
+            offsets.append(offset)
+            offset += _HEADER.size + length
+        return 0, len(offsets), offsets
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _offset(self, number):
+        if not -self._count <= number < self._count:
+            raise IndexError("Нет чека с таким номером в архиве")
+        number %= self._count
+        if self._offsets is not None:
+            return self._offsets[number]
+        return _OFFSET.unpack_from(self._view, self._index_offset + number * _OFFSET.size)[0]
+
+    def _document(self, number):
+        # Срез отображения: пока он не освобождён, close вызывает BufferError
+        offset = self._offset(number)
+        _, length = _HEADER.unpack_from(self._view, offset)
+        return self._view[offset:offset + _HEADER.size + length]
+
+    def document(self, number):
+        """Документ целиком (копия в bytes: не мешает закрытию архива)."""
+        document = self._document(number)
+        try:
+            return bytes(document)
+        finally:
+            document.release()
+
+    def __getitem__(self, number):
+        document = self._document(number)
+        try:
+            return decode_receipt(document)
+        finally:
+            document.release()
+
+    def __iter__(self):
+        for number in range(self._count):
+            yield self[number]
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,191 @@
+"""Синтетические чеки для нагрузочных проверок: воспроизводимые при одном seed.
+
+Каждый чек строится собственным генератором случайных чисел, зависящим
+только от seed и номера чека, поэтому набор данных не зависит от числа
+процессов и размера пачек. Организации, кассиры и каталог товаров
+строятся из seed заново в каждом процессе.
+
+Чеки идут по времени: каждый день каждая организация открывает смену,
+номера чеков в смене идут подряд, как их выдаёт numbering.
+Пример (через cli.py):
+    python cli.py generate 1000000 --output receipts.jsonl --store load.sqlite3 --seed 7
+"""
+import random
+from datetime import datetime, timedelta
+
+from core import CALCULATION_TYPES, CASHIERS, CATEGORIES, DATE_TIME_FORMAT, make_item, random_item_name
+
+DEFAULT_SEED = 1
+DEFAULT_ORGANIZATIONS = 50
+DEFAULT_RECEIPTS_PER_DAY = 2000
+DEFAULT_START = "2024-01-01"
+CATALOG_SIZE = 5000
+
+OPENING_HOUR = 9
+WORKING_SECONDS = 12 * 60 * 60
+
+# Доли признаков расчета: в основном приход, возвраты редки
+# (в порядке CALCULATION_TYPES: приход, расход, возврат прихода, возврат расхода)
+CALCULATION_WEIGHTS = [90, 3, 6, 1]
+PAYMENT_METHODS = ["Наличные", "Безналичные"]
+PAYMENT_WEIGHTS = [35, 65]
+# Число позиций в чеке: 1-2 чаще всего, длинные чеки редки
+ITEM_COUNTS = [1, 2, 3, 4, 5, 7, 10, 15, 25]
+ITEM_COUNT_WEIGHTS = [30, 25, 15, 10, 7, 6, 4, 2, 1]
+QUANTITIES = ["1", "2", "3", "5", "10"]
+QUANTITY_WEIGHTS = [70, 15, 7, 5, 3]
+DISCOUNTS = ["0", "5", "10", "15", "50"]
+DISCOUNT_WEIGHTS = [80, 8, 7, 4, 1]
+VAT_RATES = ["20", "10", "0"]
+VAT_WEIGHTS = [75, 20, 5]
+TAX_SYSTEMS = ["ОСН", "УСН доход", "УСН доход - расход", "ПСН"]
+
+_NAME_WORDS = ["Авто", "Мотор", "Деталь", "Сервис", "Ремонт", "Север", "Восток", "Профи", "Гарант", "Техно"]
+_STREETS = ["Ленина", "Мира", "Садовая", "Заводская", "Лесная", "Советская", "Школьная", "Новая"]
+_CITIES = ["Москва", "Казань", "Самара", "Тверь", "Пермь", "Омск", "Тула", "Сочи"]
+_SURNAMES = ["Иванов", "Петров", "Сидоров", "Кузнецов", "Смирнов", "Попов", "Морозов", "Волков"]
+_FIRST_NAMES = ["Алексей", "Дмитрий", "Сергей", "Андрей", "Михаил", "Павел", "Олег", "Игорь"]
+_PATRONYMICS = ["Алексеевич", "Петрович", "Иванович", "Сергеевич", "Олегович", "Павлович"]
+_INN_WEIGHTS = [2, 4, 10, 3, 5, 9, 4, 6, 8]
+
+
+def _inn(rng):
+    """ИНН юридического лица (10 цифр) с правильным контрольным разрядом."""
+    digits = [rng.randint(0, 9) for _ in range(9)]
+    digits[0] = rng.randint(1, 9)
+    check = sum(digit * weight for digit, weight in zip(digits, _INN_WEIGHTS)) % 11 % 10
+    return "".join(map(str, digits + [check]))
+
+
+def _digits(rng, count):
+    return f"{rng.randrange(10 ** count):0{count}d}"
+
+
+def _person(rng):
+    return f"{rng.choice(_SURNAMES)} {rng.choice(_FIRST_NAMES)} {rng.choice(_PATRONYMICS)}"
+
+
+def generate_organizations(count=DEFAULT_ORGANIZATIONS, seed=DEFAULT_SEED):
+    """Организации (словари ORGANIZATION_FIELDS) с различными ИНН, ЗН КХТ и РН КХТ."""
+    rng = random.Random(f"{seed}:organizations")
+    organizations = []
+    for index in range(count):
+        name = f"ООО «{rng.choice(_NAME_WORDS)}{rng.choice(_NAME_WORDS).lower()}-{index + 1}»"
+        city = rng.choice(_CITIES)
+        organizations.append({
+            "category": rng.choice(CATEGORIES),
+            "name": name,
+            "trade_object": f"Магазин {name}",
+            "address": f"г. {city}, ул. {rng.choice(_STREETS)}, д. {rng.randint(1, 150)}",
+            "contact": f"+7 ({rng.randint(900, 999)}) {_digits(rng, 3)}-{_digits(rng, 2)}-{_digits(rng, 2)}",
+            "tax_system": rng.choice(TAX_SYSTEMS),
+            "inn": _inn(rng),
+            # Номер организации в старших разрядах делает ЗН и РН различными
+            "zn_kht": f"{index + 1:06d}{_digits(rng, 10)}",
+            "rn_kht": f"{index + 1:06d}{_digits(rng, 10)}",
+        })
+    return organizations
+
+
+def generate_cashiers(organizations, seed=DEFAULT_SEED):
+    """Кассиры каждой организации: 2-4 человека, у первой - кассиры редактора."""
+    rng = random.Random(f"{seed}:cashiers")
+    cashiers = []
+    for index in range(len(organizations)):
+        staff = list(CASHIERS) if index == 0 else []
+        size = rng.randint(2, 4)
+        while len(staff) < size:
+            staff.append(_person(rng))
+        cashiers.append(staff)
+    return cashiers
+
+
+def generate_catalog(size=CATALOG_SIZE, seed=DEFAULT_SEED):
+    """Каталог товаров: наименование, цена, продаётся ли на вес, ставка НДС."""
+    rng = random.Random(f"{seed}:catalog")
+    catalog = []
+    for _ in range(size):
+        # Цены распределены логнормально: много дешёвых позиций, немного дорогих
+        price = round(min(rng.lognormvariate(6, 1.2), 500000), 2)
+        catalog.append((random_item_name(rng), f"{price:.2f}", rng.random() < 0.1,
+                        rng.choices(VAT_RATES, VAT_WEIGHTS)[0]))
+    return catalog
+
+
+class ReceiptGenerator:
+    """Чек по номеру: generator.receipt(index) одинаков в любом процессе при том же seed."""
+
+    def __init__(self, seed=DEFAULT_SEED, organizations=DEFAULT_ORGANIZATIONS,
+                 receipts_per_day=DEFAULT_RECEIPTS_PER_DAY, start=DEFAULT_START):
+        self.seed = seed
+        self.organization_count = organizations
+        self.receipts_per_day = max(receipts_per_day, organizations)
+        self.start = datetime.fromisoformat(start)
+        self._organizations = None
+        self._cashiers = None
+        self._catalog = None
+
+    def __getstate__(self):
+        # В рабочий процесс передаются только параметры; данные строятся там из seed
+        state = dict(self.__dict__)
+        state.update(_organizations=None, _cashiers=None, _catalog=None)
+        return state
+
+    def _load(self):
+        if self._organizations is None:
+            self._organizations = generate_organizations(self.organization_count, self.seed)
+            self._cashiers = generate_cashiers(self._organizations, self.seed)
+            self._catalog = generate_catalog(CATALOG_SIZE, self.seed)
+
+    @property
+    def organizations(self):
+        self._load()
+        return self._organizations
+
+    def receipt(self, index):
+        """Чек core (поля, организация, позиции) с номером index в наборе."""
+        self._load()
+        rng = random.Random(f"{self.seed}:receipt:{index}")
+        day, position = divmod(index, self.receipts_per_day)
+        organization_index = position % self.organization_count
+        organization = self._organizations[organization_index]
+        staff = self._cashiers[organization_index]
+        # Чеки дня равномерно распределены по рабочему времени, в порядке номеров
+        step = WORKING_SECONDS / self.receipts_per_day
+        date_time = self.start + timedelta(days=day, hours=OPENING_HOUR,
+                                           seconds=int(position * step + rng.random() * step))
+        items = []
+        for _ in range(rng.choices(ITEM_COUNTS, ITEM_COUNT_WEIGHTS)[0]):
+            name, price, by_weight, vat_rate = rng.choice(self._catalog)
+            if by_weight:
+                quantity = f"{rng.uniform(0.1, 5):.3f}"
+            else:
+                quantity = rng.choices(QUANTITIES, QUANTITY_WEIGHTS)[0]
+            items.append(make_item(name, quantity, price, rng.choices(DISCOUNTS, DISCOUNT_WEIGHTS)[0], vat_rate))
+        return {
+            "category": organization["category"],
+            "name": "Кассовый чек",
+            "organization_name": organization["name"],
+            "cashier": staff[day % len(staff)],
+            "shift": str(day + 1),
+            "receipt_number": str(position // self.organization_count + 1),
+            "calculation_type": rng.choices(CALCULATION_TYPES, CALCULATION_WEIGHTS)[0],
+            "date_time": date_time.strftime(DATE_TIME_FORMAT),
+            "payment_method": rng.choices(PAYMENT_METHODS, PAYMENT_WEIGHTS)[0],
+            "organization": organization,
+            "items": items,
+        }
+
+    def chunk(self, first, count):
+        return [self.receipt(index) for index in range(first, first + count)]
+
+
+def generate_chunk(task):
+    """Пачка чеков в рабочем процессе: task - (генератор, первый номер, число чеков)."""
+    generator, first, count = task
+    return generator.chunk(first, count)
+
+
+def chunk_tasks(generator, total, chunk_size):
+    for first in range(0, total, chunk_size):
+        yield generator, first, min(chunk_size, total - first)
@@ -0,0 +1,322 @@
+"""Журнал операций редактора: запись только в конец, групповая фиксация, откат.
+
+Каждое создание и удаление чека и создание организации записывается
+строкой JSON в файл-сегмент журнала. Запись и fsync выполняет отдельный
+поток: операции, накопившиеся за время предыдущего fsync, фиксируются
+одним вызовом (групповая фиксация), поэтому поток интерфейса не ждёт диска.
+
+Снимком служит база ReceiptStore: после её фиксации окно отмечает
+контрольную точку, и фоновый поток удаляет сегменты, целиком вошедшие
+в снимок. При запуске повторяются только операции после контрольной
+точки; повтор идемпотентен (чеки - с исходными id).
+"""
+import json
+import os
+import threading
+
+from core import RECEIPT_FIELDS, receipt_row
+
+SEGMENT_SUFFIX = ".log"
+CHECKPOINT_FILE = "checkpoint"
+SEGMENT_SIZE = 4 << 20
+
+ADD_RECEIPT = "add_receipt"
+DELETE_RECEIPT = "delete_receipt"
+ADD_ORGANIZATION = "add_organization"
+
+
+def journal_directory(store_path):
+    """Каталог журнала рядом с базой чеков (имя "-journal" занято журналом отката SQLite)."""
+    return store_path + ".oplog"
+
+
+class Journal:
+    """Сегментированный журнал с групповой фиксацией и фоновым удалением сегментов."""
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self._condition = threading.Condition()
+        self._pending = []
+        self._closing = False
+        self._error = None
+        self._checkpoint = self._read_checkpoint()
+        self._saved_checkpoint = self._checkpoint
+        self._segments = self._list_segments()
+        self._last_seq = max(self._checkpoint, self._scan_last_seq())
+        self._durable_seq = self._last_seq
+        self._output = None
+        self._compact = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._compactor = threading.Thread(target=self._compact_loop, name="journal-compactor", daemon=True)
+        self._writer.start()
+        self._compactor.start()
+
+    # Файлы
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f"{first_seq:016d}{SEGMENT_SUFFIX}")
+
+    def _list_segments(self):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE), encoding="utf-8") as stream:
+                return int(stream.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _read_segment(self, first_seq):
+        """Записи сегмента; оборванная при сбое последняя строка пропускается."""
+        with open(self._segment_path(first_seq), encoding="utf-8") as stream:
+            for line in stream:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+
+    def _scan_last_seq(self):
+        # Последний сегмент может оказаться пустым (сбой сразу после создания):
+        # тогда номер берётся из предыдущих сегментов и имени пустого
+        last = 0
+        for first_seq in reversed(self._segments):
+            last = max(last, first_seq - 1)
+            for entry in self._read_segment(first_seq):
+                last = max(last, entry["seq"])
+            if last >= first_seq:
+                break
+        return last
+
+    # Запись
+
+    @property
+    def error(self):
+        """Ошибка записи или fsync, после которой журнал не принимает операции; None - журнал исправен."""
+        with self._condition:
+            return self._error
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise OSError(f"Журнал операций не записывается: {self._error}") from self._error
+
+    def append(self, operation):
+        """Добавление операции в очередь записи; возвращает её номер. OSError - журнал не записывается."""
+        with self._condition:
+            self._raise_error()
+            self._last_seq += 1
+            entry = dict(operation, seq=self._last_seq)
+            self._pending.append((self._last_seq, json.dumps(entry, ensure_ascii=False) + "\n"))
+            self._condition.notify_all()
+            return self._last_seq
+
+    @property
+    def last_seq(self):
+        with self._condition:
+            return self._last_seq
+
+    def wait_durable(self, seq=None, timeout=None):
+        """Ожидание fsync операции seq (по умолчанию - последней); False по тайм-ауту, OSError - ошибка записи."""
+        with self._condition:
+            seq = self._last_seq if seq is None else seq
+            durable = self._condition.wait_for(lambda: self._durable_seq >= seq or self._error is not None, timeout)
+            if self._durable_seq < seq:
+                self._raise_error()
+            return durable
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closing)
+                if not self._pending:
+                    break
+                batch, self._pending = self._pending, []
+            try:
+                if self._output is None or self._output.tell() >= self.segment_size:
+                    self._open_segment(batch[0][0])
+                self._output.write("".join(line for _, line in batch))
+                self._output.flush()
+                os.fsync(self._output.fileno())
+            except OSError as error:
+                # Пачка не сохранена: дальнейшие операции отклоняются append
+                with self._condition:
+                    self._error = error
+                    self._pending = []
+                    self._condition.notify_all()
+                break
+            with self._condition:
+                self._durable_seq = batch[-1][0]
+                self._condition.notify_all()
+        if self._output is not None:
+            try:
+                self._output.close()
+            except OSError:
+                pass
+
+    def _open_segment(self, first_seq):
+        # Каждый запуск пишет в новый сегмент: хвост прежнего мог оборваться при сбое
+        if self._output is not None:
+            self._output.close()
+        self._output = open(self._segment_path(first_seq), "a", encoding="utf-8")
+        with self._condition:
+            self._segments.append(first_seq)
+
+    # Контрольные точки и сжатие
+
+    def checkpoint(self, seq=None):
+        """Операции до seq включительно вошли в снимок (зафиксированы в базе)."""
+        with self._condition:
+            seq = self._last_seq if seq is None else seq
+            if seq > self._checkpoint:
+                self._checkpoint = seq
+                self._compact.set()
+
+    def _compact_loop(self):
+        while True:
+            self._compact.wait()
+            self._compact.clear()
+            self._compact_once()
+            with self._condition:
+                if self._closing:
+                    return
+
+    def _compact_once(self):
+        with self._condition:
+            checkpoint = self._checkpoint
+            segments = list(self._segments)
+        if checkpoint != self._saved_checkpoint:
+            path = os.path.join(self.directory, CHECKPOINT_FILE)
+            with open(path + ".tmp", "w", encoding="utf-8") as stream:
+                stream.write(str(checkpoint))
+                stream.flush()
+                os.fsync(stream.fileno())
+            os.replace(path + ".tmp", path)
+            self._saved_checkpoint = checkpoint
+        # Сегмент не нужен, если следующий за ним начинается не позже контрольной точки
+        obsolete = [first for first, following in zip(segments, segments[1:]) if following - 1 <= checkpoint]
+        for first_seq in obsolete:
+            os.remove(self._segment_path(first_seq))
+        if obsolete:
+            with self._condition:
+                self._segments = [first for first in self._segments if first not in obsolete]
+
+    def tail(self):
+        """Операции после контрольной точки, по возрастанию номера."""
+        with self._condition:
+            checkpoint = self._checkpoint
+            segments = list(self._segments)
+        for first_seq in segments:
+            for entry in self._read_segment(first_seq):
+                if entry["seq"] > checkpoint:
+                    yield entry
+
+    def close(self):
+        """Запись очереди, сохранение контрольной точки и остановка потоков."""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._writer.join()
+        self._compact.set()
+        self._compactor.join()
+
+
+# Операции
+
+def receipt_added(receipt_id, values, organization, items):
+    return {"op": ADD_RECEIPT, "id": receipt_id, "values": list(values),
+            "organization": dict(organization or {}), "items": [list(item) for item in items]}
+
+
+def receipt_deleted(receipt_id, receipt):
+    """receipt - чек целиком (ReceiptStore.load_receipt), чтобы удаление можно было отменить."""
+    return {"op": DELETE_RECEIPT, "id": receipt_id, "receipt": receipt}
+
+
+def organization_added(organization):
+    return {"op": ADD_ORGANIZATION, "organization": dict(organization)}
+
+
+def inverse(operation):
+    """Операция, отменяющая operation (для чеков)."""
+    if operation["op"] == ADD_RECEIPT:
+        receipt = dict(zip(RECEIPT_FIELDS, operation["values"]), organization=operation["organization"],
+                       items=operation["items"])
+        return receipt_deleted(operation["id"], receipt)
+    if operation["op"] == DELETE_RECEIPT:
+        receipt = operation["receipt"]
+        return receipt_added(operation["id"], receipt_row(receipt), receipt["organization"], receipt["items"])
+    raise ValueError(f"Операция не отменяется: {operation['op']}")
+
+
+def apply(store, operation):
+    """Повтор операции над базой; уже выполненные операции пропускаются. True - база изменена."""
+    kind = operation["op"]
+    if kind == ADD_RECEIPT:
+        if store.load_receipt(operation["id"]) is not None:
+            return False
+        store.add_receipt(operation["values"], operation["organization"],
+                          [tuple(item) for item in operation["items"]], receipt_id=operation["id"])
+        return True
+    if kind == DELETE_RECEIPT:
+        # id удалённого последним чека может достаться следующему: удаляется только тот же чек
+        stored = store.load_receipt(operation["id"])
+        if stored is None or receipt_row(stored) != receipt_row(operation["receipt"]):
+            return False
+        store.delete_receipts([operation["id"]])
+        return True
+    if kind == ADD_ORGANIZATION:
+        organization = operation["organization"]
+        known = store.find_organizations(inn=organization.get("inn", ""), rn_kht=organization.get("rn_kht", ""))
+        if organization in known:
+            return False
+        store.add_organization(organization)
+        return True
+    raise ValueError(f"Неизвестная операция журнала: {kind}")
+
+
+def replay(store, journal):
+    """Повтор операций после контрольной точки и новая контрольная точка; число применённых."""
+    applied = 0
+    last = None
+    for entry in journal.tail():
+        applied += apply(store, entry)
+        last = entry["seq"]
+    store.flush()
+    if last is not None:
+        journal.checkpoint(last)
+    return applied
+
+
+class UndoStack:
+    """История операций окна для отмены и повтора (в памяти, на один сеанс)."""
+
+    def __init__(self, limit=1000):
+        self.limit = limit
+        self._done = []
+        self._undone = []
+
+    def push(self, operation):
+        self._done.append(operation)
+        del self._done[:-self.limit]
+        self._undone.clear()
+
+    def can_undo(self):
+        return bool(self._done)
+
+    def can_redo(self):
+        return bool(self._undone)
+
+    def undo(self):
+        """Операция, которую нужно выполнить для отмены последней."""
+        operation = self._done.pop()
+        self._undone.append(operation)
+        return inverse(operation)
+
+    def redo(self):
+        operation = self._undone.pop()
+        self._done.append(operation)
+        return operation
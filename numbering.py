@@ -0,0 +1,233 @@
+"""Выдача номеров чеков без повторов в пределах ККТ и смены.
+
+Занятые номера каждой пары (ККТ, смена) хранятся битовой картой в SQLite,
+поэтому проверка занятости - O(1), а состояние переживает перезапуск.
+Изменения выполняются в транзакциях BEGIN IMMEDIATE: одновременные вызовы
+из разных процессов упорядочиваются SQLite, из разных потоков - блокировкой.
+"""
+import sqlite3
+import threading
+
+from storage import DEFAULT_DB_PATH
+
+FIRST_NUMBER = 1
+MAX_NUMBER = 999999
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipt_numbers (
+    kkt TEXT NOT NULL,
+    shift TEXT NOT NULL,
+    next_number INTEGER NOT NULL,
+    used BLOB NOT NULL,
+    PRIMARY KEY (kkt, shift)
+);
+"""
+
+
+def kkt_key(organization):
+    """Ключ ККТ организации: РН КХТ, а если он не задан - ЗН КХТ."""
+    organization = organization or {}
+    return organization.get("rn_kht") or organization.get("zn_kht") or ""
+
+
+class _Sequence:
+    """Состояние одной пары (ККТ, смена): следующий номер и карта занятых."""
+
+    __slots__ = ("rowid", "next_number", "used", "dirty", "grown")
+
+    def __init__(self, rowid, next_number, used):
+        self.rowid = rowid
+        self.next_number = next_number
+        self.used = bytearray(used)
+        self.dirty = None
+        self.grown = False
+
+    def is_used(self, number):
+        byte = number >> 3
+        return byte < len(self.used) and bool(self.used[byte] & (1 << (number & 7)))
+
+    def mark(self, number):
+        if not FIRST_NUMBER <= number <= MAX_NUMBER:
+            raise ValueError(f"Номер чека вне диапазона {FIRST_NUMBER}-{MAX_NUMBER}: {number}")
+        byte = number >> 3
+        if byte >= len(self.used):
+            # Карта растёт удвоением, чтобы перезапись всего BLOB была редкой
+            self.used.extend(bytes(max(byte + 1, 2 * len(self.used)) - len(self.used)))
+            self.grown = True
+        self.used[byte] |= 1 << (number & 7)
+        if self.dirty is None:
+            self.dirty = (byte, byte)
+        else:
+            self.dirty = (min(self.dirty[0], byte), max(self.dirty[1], byte))
+
+    def advance(self):
+        while self.is_used(self.next_number):
+            self.next_number += 1
+
+
+class ReceiptNumberAllocator:
+    """Последовательные номера чеков, уникальные в пределах ККТ и смены."""
+
+    def __init__(self, path=DEFAULT_DB_PATH, timeout=30.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, isolation_level=None, timeout=timeout,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self._cache = {}
+        self._data_version = None
+
+    def close(self):
+        self.connection.close()
+
+    def _cached(self, kkt, shift):
+        # Кэш действителен, пока никакое другое соединение не меняло базу
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._cache.clear()
+            self._data_version = data_version
+        key = (kkt, shift)
+        sequence = self._cache.get(key)
+        if sequence is None:
+            row = self.connection.execute(
+                "SELECT rowid, next_number, used FROM receipt_numbers WHERE kkt = ? AND shift = ?",
+                key
+            ).fetchone()
+            if row is not None:
+                sequence = self._cache[key] = _Sequence(*row)
+        return sequence
+
+    def _load(self, kkt, shift):
+        sequence = self._cached(kkt, shift)
+        if sequence is None:
+            cursor = self.connection.execute(
+                "INSERT INTO receipt_numbers (kkt, shift, next_number, used) VALUES (?, ?, ?, zeroblob(64))",
+                (kkt, shift, FIRST_NUMBER)
+            )
+            sequence = self._cache[(kkt, shift)] = _Sequence(cursor.lastrowid, FIRST_NUMBER, bytes(64))
+        return sequence
+
+    def _save(self, sequence):
+        if sequence.grown:
+            self.connection.execute(
+                "UPDATE receipt_numbers SET next_number = ?, used = ? WHERE rowid = ?",
+                (sequence.next_number, bytes(sequence.used), sequence.rowid)
+            )
+        else:
+            self.connection.execute(
+                "UPDATE receipt_numbers SET next_number = ? WHERE rowid = ?",
+                (sequence.next_number, sequence.rowid)
+            )
+            if sequence.dirty is not None:
+                # Перезаписываются только изменённые байты карты
+                start, end = sequence.dirty
+                with self.connection.blobopen("receipt_numbers", "used", sequence.rowid) as blob:
+                    blob.seek(start)
+                    blob.write(bytes(sequence.used[start:end + 1]))
+        sequence.dirty = None
+        sequence.grown = False
+
+    def _transaction(self, kkt, shift, operation):
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                sequence = self._load(kkt, shift)
+                result = operation(sequence)
+                self._save(sequence)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                self._cache.clear()
+                raise
+            # Собственная запись не меняет data_version этого соединения
+            return result
+
+    def peek(self, kkt, shift):
+        """Номер, который будет выдан следующим (без резервирования)."""
+        with self._lock:
+            sequence = self._cached(kkt, shift)
+            if sequence is None:
+                return FIRST_NUMBER
+            sequence.advance()
+            return sequence.next_number
+
+    def is_used(self, kkt, shift, number):
+        with self._lock:
+            sequence = self._cached(kkt, shift)
+            return sequence is not None and sequence.is_used(number)
+
+    def allocate(self, kkt, shift):
+        """Следующий свободный номер."""
+        def operation(sequence):
+            sequence.advance()
+            number = sequence.next_number
+            sequence.mark(number)
+            sequence.advance()
+            return number
+        return self._transaction(kkt, shift, operation)
+
+    def reserve(self, kkt, shift, count):
+        """Резервирование count подряд идущих свободных номеров одним вызовом."""
+        def operation(sequence):
+            sequence.advance()
+            start = sequence.next_number
+            number = start
+            while number < start + count:
+                if sequence.is_used(number):
+                    start = number + 1
+                number += 1
+            for number in range(start, start + count):
+                sequence.mark(number)
+            sequence.advance()
+            return range(start, start + count)
+        if count <= 0:
+            return range(0)
+        return self._transaction(kkt, shift, operation)
+
+    def claim(self, kkt, shift, number):
+        """Занять введённый вручную номер; False, если он уже выдан."""
+        return not self.claim_many(kkt, shift, [number])
+
+    def claim_many(self, kkt, shift, numbers):
+        """Занять несколько номеров; возвращает список уже занятых (повторов)."""
+        def operation(sequence):
+            duplicates = []
+            for number in numbers:
+                if sequence.is_used(number):
+                    duplicates.append(number)
+                else:
+                    sequence.mark(number)
+            sequence.advance()
+            return duplicates
+        return self._transaction(kkt, shift, operation)
+
+
+def number_in_range(receipt_number):
+    """False для номера цифрами вне FIRST_NUMBER-MAX_NUMBER: такой номер нельзя занять."""
+    receipt_number = str(receipt_number).strip()
+    return not receipt_number.isdigit() or FIRST_NUMBER <= int(receipt_number) <= MAX_NUMBER
+
+
+def assign_numbers(receipts, allocator):
+    """Номера для пачки чеков: пустые выдаются диапазонами, введённые проверяются на повтор.
+
+    Номера вне диапазона не занимаются (их отбирает number_in_range).
+    Возвращает список повторяющихся номеров.
+    """
+    missing = {}
+    claimed = {}
+    for receipt in receipts:
+        key = (kkt_key(receipt.get("organization")), str(receipt.get("shift", "")))
+        receipt_number = str(receipt.get("receipt_number", "")).strip()
+        if not receipt_number:
+            missing.setdefault(key, []).append(receipt)
+        elif receipt_number.isdigit() and number_in_range(receipt_number):
+            claimed.setdefault(key, []).append(int(receipt_number))
+    duplicates = []
+    for (kkt, shift), numbers in claimed.items():
+        duplicates.extend(allocator.claim_many(kkt, shift, numbers))
+    for (kkt, shift), group in missing.items():
+        for receipt, number in zip(group, allocator.reserve(kkt, shift, len(group))):
+            receipt["receipt_number"] = str(number)
+    return duplicates
@@ -0,0 +1,117 @@
+"""Реестр организаций (ККМ) с индексами для поиска повторов и подбора по вводу.
+
+Организации - словари ORGANIZATION_FIELDS в порядке добавления; строка
+реестра - позиция в этом списке. ЗН КХТ и РН КХТ однозначно определяют
+кассу, поэтому по ним проверяются повторы; ИНН общий для всех касс
+организации и индексируется списком строк.
+Подбор по вводу ищет слова наименования, торгового объекта и адреса
+по префиксу в отсортированном массиве слов, как search.ReceiptIndex.
+"""
+import bisect
+import re
+
+UNIQUE_FIELDS = ["zn_kht", "rn_kht"]
+SEARCH_FIELDS = ["name", "trade_object", "address"]
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+class OrganizationRegistry:
+    """Список организаций с индексами по ИНН, ЗН КХТ, РН КХТ и словам."""
+
+    def __init__(self, organizations=()):
+        self.organizations = []
+        self._by_inn = {}
+        self._unique = {field: {} for field in UNIQUE_FIELDS}
+        # Пары (слово, строка), отсортированные для поиска по префиксу
+        self._words = []
+        self.extend(organizations)
+
+    def __len__(self):
+        return len(self.organizations)
+
+    def __getitem__(self, row):
+        return self.organizations[row]
+
+    def _index(self, row, organization):
+        inn = organization.get("inn", "")
+        if inn:
+            self._by_inn.setdefault(inn, []).append(row)
+        for field in UNIQUE_FIELDS:
+            value = organization.get(field, "")
+            if value:
+                self._unique[field].setdefault(value, row)
+
+    def extend(self, organizations):
+        """Добавление в конец; индексы дополняются, а не строятся заново."""
+        first = len(self.organizations)
+        self.organizations.extend(organizations)
+        added = self.organizations[first:]
+        words = []
+        for row, organization in enumerate(added, first):
+            self._index(row, organization)
+            for field in SEARCH_FIELDS:
+                words.extend((word, row) for word in _words(organization.get(field, "")))
+        if len(words) > 64:
+            self._words = sorted(self._words + words)
+        else:
+            for pair in words:
+                bisect.insort(self._words, pair)
+        return range(first, len(self.organizations))
+
+    def add(self, organization):
+        return self.extend([organization])[0]
+
+    def find_duplicate(self, organization):
+        """Строка и поле уже зарегистрированной кассы с тем же ЗН/РН КХТ, иначе None."""
+        for field in UNIQUE_FIELDS:
+            value = organization.get(field, "")
+            row = self._unique[field].get(value) if value else None
+            if row is not None:
+                return row, field
+        return None
+
+    def by_inn(self, inn):
+        """Строки всех касс организации с этим ИНН."""
+        return list(self._by_inn.get(inn, ()))
+
+    def by_kkt(self, zn_kht=None, rn_kht=None):
+        """Строка кассы по ЗН или РН КХТ (или None)."""
+        if rn_kht:
+            return self._unique["rn_kht"].get(rn_kht)
+        if zn_kht:
+            return self._unique["zn_kht"].get(zn_kht)
+        return None
+
+    def _prefix_rows(self, prefix):
+        start = bisect.bisect_left(self._words, (prefix,))
+        end = bisect.bisect_left(self._words, (prefix[:-1] + chr(ord(prefix[-1]) + 1),))
+        return {row for _, row in self._words[start:end]}
+
+    def search(self, text):
+        """Строки, где каждое слово запроса - начало слова наименования, объекта или адреса.
+
+        Число из запроса сверяется также с ИНН и ЗН/РН КХТ. Пустой запрос - None.
+        """
+        terms = _words(text)
+        if not terms:
+            return None
+        rows = None
+        for term in terms:
+            matched = self._prefix_rows(term)
+            if term.isdigit():
+                matched.update(self._by_inn.get(term, ()))
+                row = self.by_kkt(zn_kht=term)
+                if row is not None:
+                    matched.add(row)
+                row = self.by_kkt(rn_kht=term)
+                if row is not None:
+                    matched.add(row)
+            rows = matched if rows is None else rows & matched
+            if not rows:
+                break
+        return sorted(rows)
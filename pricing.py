@@ -0,0 +1,120 @@
+"""Расчёт стоимости позиций чека в целых копейках.
+
+Все величины хранятся целыми числами с фиксированной точкой:
+количество - в тысячных, цена и стоимость - в копейках,
+скидка и ставка НДС - в сотых долях процента. Округление - до копейки,
+половина в большую сторону.
+"""
+from array import array
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+QUANTITY_SCALE = 1000
+MONEY_SCALE = 100
+PERCENT_SCALE = 100
+
+# Масштабы и допустимые значения (в единицах ввода) числовых полей позиции:
+# количество, цена, скидка, ставка НДС. Стоимость позиции не больше 10 ** 15 копеек,
+# поэтому величины и итоги чека помещаются в 8-байтовые массивы (array "q")
+MAX_QUANTITY = 100000
+MAX_PRICE = 100000000
+ITEM_SCALES = (QUANTITY_SCALE, MONEY_SCALE, PERCENT_SCALE, PERCENT_SCALE)
+ITEM_LIMITS = ((0, MAX_QUANTITY), (0, MAX_PRICE), (0, 100), (0, 100))
+
+_HUNDRED_PERCENT = 100 * PERCENT_SCALE
+_COST_DIVISOR = QUANTITY_SCALE * _HUNDRED_PERCENT
+
+PricingResult = namedtuple("PricingResult", "costs vat_amounts totals vat_totals")
+
+
+def to_fixed(value, scale, minimum=None, maximum=None):
+    """Перевод числа или строки ("1,5", "2.35", "") в целое с масштабом scale.
+
+    ValueError - некорректное число или значение вне [minimum, maximum].
+    """
+    if isinstance(value, int):
+        number = value
+    else:
+        text = str(value).strip().replace(",", ".") or "0"
+        try:
+            number = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"Некорректное число: {value!r}")
+        if not number.is_finite():
+            raise ValueError(f"Некорректное число: {value!r}")
+    if minimum is not None and number < minimum or maximum is not None and number > maximum:
+        if maximum is None:
+            raise ValueError(f"Значение должно быть не меньше {minimum}: {value!r}")
+        raise ValueError(f"Значение должно быть от {minimum} до {maximum}: {value!r}")
+    if isinstance(number, int):
+        return number * scale
+    return int((number * scale).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def format_money(kopecks):
+    """Копейки в строку вида "1234.56"."""
+    sign = "-" if kopecks < 0 else ""
+    rubles, kopecks = divmod(abs(kopecks), MONEY_SCALE)
+    return f"{sign}{rubles}.{kopecks:02d}"
+
+
+def format_fixed(value, scale):
+    """Целое с масштабом scale (степень 10) в строку без лишних нулей: 1500 при 1000 - "1.5"."""
+    sign = "-" if value < 0 else ""
+    whole, fraction = divmod(abs(value), scale)
+    if not fraction:
+        return f"{sign}{whole}"
+    return f"{sign}{whole}.{fraction:0{len(str(scale)) - 1}d}".rstrip("0")
+
+
+def _divide_round(numerator, denominator):
+    """Целочисленное деление с округлением половины вверх."""
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def line_cost(quantity, price, discount=0, vat_rate=0):
+    """Стоимость одной позиции и сумма НДС в ней, в копейках.
+
+    НДС входит в цену: сумма налога = стоимость * ставка / (100 + ставка).
+    """
+    cost = _divide_round(quantity * price * (_HUNDRED_PERCENT - discount), _COST_DIVISOR)
+    return cost, _divide_round(cost * vat_rate, _HUNDRED_PERCENT + vat_rate)
+
+
+def price_lines(quantities, prices, discounts, vat_rates):
+    """Стоимости и суммы НДС для столбцов позиций за один проход."""
+    # Формула _divide_round развёрнута в выражения: вызов функции на строку заметно дороже
+    double_divisor = 2 * _COST_DIVISOR
+    costs = array("q", [
+        (2 * quantity * price * (_HUNDRED_PERCENT - discount) + _COST_DIVISOR) // double_divisor
+        for quantity, price, discount in zip(quantities, prices, discounts)
+    ])
+    vat_amounts = array("q", [
+        (2 * cost * rate + _HUNDRED_PERCENT + rate) // (2 * (_HUNDRED_PERCENT + rate)) if rate else 0
+        for cost, rate in zip(costs, vat_rates)
+    ])
+    return costs, vat_amounts
+
+
+def price_receipts(offsets, quantities, prices, discounts, vat_rates):
+    """Расчёт пачки чеков, позиции которых лежат подряд в общих столбцах.
+
+    offsets - границы чеков: позиции чека i занимают [offsets[i], offsets[i + 1]).
+    Итог чека - сумма округлённых стоимостей позиций, поэтому он сходится
+    с чеком до копейки.
+    """
+    costs, vat_amounts = price_lines(quantities, prices, discounts, vat_rates)
+    bounds = list(zip(offsets, offsets[1:]))
+    totals = array("q", [sum(costs[start:end]) for start, end in bounds])
+    vat_totals = array("q", [sum(vat_amounts[start:end]) for start, end in bounds])
+    return PricingResult(costs, vat_amounts, totals, vat_totals)
+
+
+def parse_field(field, value):
+    """Числовое поле позиции с номером field (0 - количество, ..., 3 - ставка НДС) с проверкой диапазона."""
+    return to_fixed(value, ITEM_SCALES[field], *ITEM_LIMITS[field])
+
+
+def parse_item(quantity, price, discount="0", vat_rate="0"):
+    """Строковые поля позиции в целые величины движка; ValueError - некорректное значение."""
+    return tuple(parse_field(field, value) for field, value in enumerate((quantity, price, discount, vat_rate)))
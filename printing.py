@@ -0,0 +1,72 @@
+"""Печатные формы чека без зависимости от Qt: команды ESC/POS и запись на устройство.
+
+PDF строится в app.py средствами Qt (нужны шрифты с кириллицей).
+"""
+import os
+import re
+import threading
+
+from core import render_receipt
+
+ESC = b"\x1b"
+GS = b"\x1d"
+
+# Кодовая страница PC866 (кириллица) в большинстве чековых принтеров
+ESC_POS_CODEPAGE = 17
+ESC_POS_ENCODING = "cp866"
+
+
+def render_escpos(receipt, cut=True, feed_lines=4):
+    """Чек в виде команд ESC/POS: инициализация, кодовая страница, текст, отрезка."""
+    return escpos_from_text(render_receipt(receipt), cut, feed_lines)
+
+
+def escpos_from_text(text, cut=True, feed_lines=4):
+    """Команды ESC/POS для уже отрисованного текста чека."""
+    text = text.replace("\r", "")
+    data = bytearray(ESC + b"@")
+    data += ESC + b"t" + bytes([ESC_POS_CODEPAGE])
+    data += text.encode(ESC_POS_ENCODING, errors="replace")
+    data += b"\n" + ESC + b"d" + bytes([feed_lines])
+    if cut:
+        data += GS + b"V\x42\x00"
+    return bytes(data)
+
+
+def receipt_file_name(index, receipt, extension):
+    """Имя файла печатной формы: порядковый номер и номер чека."""
+    receipt_number = re.sub(r"[^\w-]", "_", str(receipt.get("receipt_number", ""))) or "0"
+    return f"{index + 1:06d}_{receipt_number}.{extension}"
+
+
+class OrderedWriter:
+    """Запись готовых форм в файл или устройство в исходном порядке.
+
+    Формы приходят из рабочих потоков в порядке готовности; те, что пришли
+    раньше своей очереди, ждут в буфере. Пропущенные (отменённые) номера
+    отмечаются через skip().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._next = 0
+        self._buffer = {}
+        # Устройство (например, /dev/usb/lp0) открывается без буферизации
+        self._output = open(path, "ab", buffering=0 if not os.path.isfile(path) and os.path.exists(path) else -1)
+
+    def write(self, index, data):
+        with self._lock:
+            self._buffer[index] = data
+            while self._next in self._buffer:
+                chunk = self._buffer.pop(self._next)
+                if chunk:
+                    self._output.write(chunk)
+                self._next += 1
+
+    def skip(self, index):
+        self.write(index, b"")
+
+    def close(self):
+        with self._lock:
+            self._output.close()
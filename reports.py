@@ -0,0 +1,155 @@
+"""Отчёты о смене (X, Z) и сводки за день без зависимости от Qt.
+
+Отчёт строится по итогам storage.ReceiptStore.shift_totals: хранилище
+меняет одну строку итогов при каждом добавлении и удалении чека, поэтому
+отчёт не перебирает чеки и готов сразу. Суммы в отчёте - в копейках.
+"""
+import csv
+import json
+from datetime import datetime
+
+from core import CALCULATION_TYPES, DATE_TIME_FORMAT, RECEIPT_WIDTH
+from pricing import format_money
+
+REPORT_X = "X"
+REPORT_Z = "Z"
+REPORT_DAY = "day"
+
+REPORT_TITLES = {
+    REPORT_X: "Отчёт без гашения (X)",
+    REPORT_Z: "Отчёт о закрытии смены (Z)",
+    REPORT_DAY: "Сводка за день",
+}
+
+# Знак признака расчета в итоге смены: поступления в кассу - плюс, выплаты - минус
+CALCULATION_SIGNS = {
+    "Приход": 1,
+    "Расход": -1,
+    "Возврат прихода": -1,
+    "Возврат расхода": 1,
+}
+
+REPORT_CSV_FIELDS = ["cashier", "calculation_type", "receipts", "total", "vat_total"]
+
+
+def build_report(kind, rows, organization=None, shift=None, day=None):
+    """Отчёт из строк (cashier, calculation_type, receipts, total, vat_total).
+
+    В calculation_types - итоги по каждому признаку расчета, в cashiers -
+    итоги кассиров по признакам; total и vat_total отчёта - сальдо с учётом
+    CALCULATION_SIGNS.
+    """
+    calculation_types = {
+        calculation_type: {"receipts": 0, "total": 0, "vat_total": 0} for calculation_type in CALCULATION_TYPES
+    }
+    cashiers = {}
+    receipts = total = vat_total = 0
+    for cashier, calculation_type, count, amount, vat in rows:
+        for totals in (
+            calculation_types.setdefault(calculation_type, {"receipts": 0, "total": 0, "vat_total": 0}),
+            cashiers.setdefault(cashier, {}).setdefault(calculation_type, {"receipts": 0, "total": 0, "vat_total": 0}),
+        ):
+            totals["receipts"] += count
+            totals["total"] += amount
+            totals["vat_total"] += vat
+        sign = CALCULATION_SIGNS.get(calculation_type, 1)
+        receipts += count
+        total += sign * amount
+        vat_total += sign * vat
+    return {
+        "kind": kind,
+        "organization": dict(organization) if organization else None,
+        "shift": shift,
+        "day": day,
+        "created_at": datetime.now().strftime(DATE_TIME_FORMAT),
+        "calculation_types": calculation_types,
+        "cashiers": cashiers,
+        "receipts": receipts,
+        "total": total,
+        "vat_total": vat_total,
+    }
+
+
+def x_report(store, organization, shift):
+    """Текущие итоги смены без её закрытия."""
+    return build_report(REPORT_X, store.shift_totals(organization, shift), organization, shift)
+
+
+def z_report(store, organization, shift):
+    """Закрытие смены; для уже закрытой возвращается сохранённый при закрытии отчёт."""
+    report = store.shift_closure(organization, shift)
+    if report is None:
+        report = build_report(REPORT_Z, store.shift_totals(organization, shift), organization, shift)
+        store.close_shift(organization, shift, report)
+    return report
+
+
+def day_summary(store, day, organization=None):
+    """Итоги за календарный день ("YYYY-MM-DD") по одной или всем организациям."""
+    return build_report(REPORT_DAY, store.shift_totals(organization, day=day), organization, day=day)
+
+
+def _amount_line(title, totals):
+    return f"{title:<28}{totals['receipts']:>8}{format_money(totals['total']):>14}"
+
+
+def report_lines(report):
+    """Текст отчёта шириной чека."""
+    organization = report["organization"] or {}
+    lines = [
+        (organization.get("name") or "Все организации").center(RECEIPT_WIDTH),
+        REPORT_TITLES[report["kind"]].center(RECEIPT_WIDTH),
+    ]
+    if organization.get("inn"):
+        lines.append(f"ИНН: {organization['inn']}")
+    if organization.get("rn_kht"):
+        lines.append(f"РН ККТ: {organization['rn_kht']}")
+    if report["shift"] is not None:
+        lines.append(f"Смена: {report['shift']}")
+    if report["day"] is not None:
+        lines.append(f"День: {report['day']}")
+    lines.append(f"Сформирован: {report['created_at']}")
+    lines.append("=" * RECEIPT_WIDTH)
+    lines.append(f"{'Признак расчета':<28}{'Чеков':>8}{'Сумма':>14}")
+    for calculation_type, totals in report["calculation_types"].items():
+        lines.append(_amount_line(calculation_type, totals))
+    for cashier, calculation_types in report["cashiers"].items():
+        lines.append("-" * RECEIPT_WIDTH)
+        lines.append(f"Кассир: {cashier or 'Не указан'}")
+        for calculation_type, totals in calculation_types.items():
+            lines.append(_amount_line(calculation_type, totals))
+    lines += [
+        "=" * RECEIPT_WIDTH,
+        f"{'Чеков всего':<40}{report['receipts']:>10}",
+        f"{'ИТОГО':<40}{format_money(report['total']):>10}",
+        f"{'в т.ч. НДС':<40}{format_money(report['vat_total']):>10}",
+        "",
+    ]
+    return lines
+
+
+def render_report(report):
+    return "\n".join(report_lines(report))
+
+
+def write_report(path, report, stream):
+    """Запись отчёта в открытый текстовый поток; формат - по расширению файла.
+
+    .json - отчёт целиком, .csv - строка на кассира и признак расчета
+    (пустой кассир - итог по признаку), иначе - текст отчёта.
+    """
+    path = path.lower()
+    if path.endswith(".json"):
+        json.dump(report, stream, ensure_ascii=False, indent=2)
+    elif path.endswith(".csv"):
+        writer = csv.writer(stream)
+        writer.writerow(REPORT_CSV_FIELDS)
+        for calculation_type, totals in report["calculation_types"].items():
+            writer.writerow(["", calculation_type, totals["receipts"],
+                             format_money(totals["total"]), format_money(totals["vat_total"])])
+        for cashier, calculation_types in report["cashiers"].items():
+            for calculation_type, totals in calculation_types.items():
+                writer.writerow([cashier, calculation_type, totals["receipts"],
+                                 format_money(totals["total"]), format_money(totals["vat_total"])])
+    else:
+        stream.write(render_report(report) + "\n")
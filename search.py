@@ -0,0 +1,195 @@
+"""Индексы списка чеков для быстрого отбора по нескольким условиям.
+
+Индекс строится по столбцам ReceiptTableModel (списки значений по строкам):
+- для кассира, организации, смены и признака расчета - инвертированные списки
+  "значение -> номера строк";
+- для даты/времени - отсортированный массив дат с номерами строк (поиск bisect);
+- для номера чека - отсортированный массив номеров: все ключи с общим
+  префиксом лежат в нём подряд, как листья одного узла префиксного дерева,
+  а памяти требуется на порядок меньше, чем узлам-словарям.
+Строки, добавленные в конец, попадают в отсортированный хвост,
+который вливается в основной массив при накоплении.
+Столбцы со словарным кодированием (columns.DictionaryColumn) индексируются
+и проверяются по кодам, без раскодирования строк.
+"""
+import bisect
+from array import array
+
+ORGANIZATION_COLUMN = 2
+CASHIER_COLUMN = 3
+SHIFT_COLUMN = 4
+NUMBER_COLUMN = 5
+CALCULATION_TYPE_COLUMN = 6
+DATE_TIME_COLUMN = 7
+
+INVERTED_FIELDS = {
+    "organization": ORGANIZATION_COLUMN,
+    "cashier": CASHIER_COLUMN,
+    "shift": SHIFT_COLUMN,
+    "calculation_type": CALCULATION_TYPE_COLUMN,
+}
+
+
+class _SortedIndex:
+    """Отсортированные пары (ключ, строка) и отсортированный хвост дописанных строк.
+
+    Хвост вливается в основной массив, когда дорастает до восьмой части его
+    размера; sorted() сливает две упорядоченные серии за линейное время.
+    """
+
+    MIN_TAIL = 4096
+
+    def __init__(self, column):
+        # Сортировка номеров строк по ключу быстрее сортировки кортежей
+        order = sorted(range(len(column)), key=column.__getitem__)
+        self.keys = [column[row] for row in order]
+        self.rows = array("l", order)
+        self.tail = []
+
+    def _set(self, pairs):
+        self.keys = [key for key, _ in pairs]
+        self.rows = array("l", [row for _, row in pairs])
+        self.tail = []
+
+    def add(self, key, row):
+        bisect.insort(self.tail, (key, row))
+        if len(self.tail) >= max(self.MIN_TAIL, len(self.keys) // 8):
+            self._set(sorted(list(zip(self.keys, self.rows)) + self.tail))
+
+    def _bounds(self, low, high):
+        start = 0 if low is None else bisect.bisect_left(self.keys, low)
+        end = len(self.keys) if high is None else bisect.bisect_left(self.keys, high)
+        tail_start = 0 if low is None else bisect.bisect_left(self.tail, (low,))
+        tail_end = len(self.tail) if high is None else bisect.bisect_left(self.tail, (high,))
+        return start, end, tail_start, tail_end
+
+    def range(self, low, high):
+        """Строки с low <= ключ < high (граница None - без ограничения)."""
+        start, end, tail_start, tail_end = self._bounds(low, high)
+        rows = self.rows[start:end]
+        rows.extend(row for _, row in self.tail[tail_start:tail_end])
+        return rows
+
+    def count(self, low, high):
+        start, end, tail_start, tail_end = self._bounds(low, high)
+        return end - start + tail_end - tail_start
+
+
+class ReceiptIndex:
+    """Индексы по столбцам списка чеков; столбцы передаются живыми ссылками.
+
+    Индекс каждого поля строится при первом запросе по этому полю.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.invalidate()
+
+    def invalidate(self):
+        """Сбросить индексы (вставка в середину, удаление, сброс модели)."""
+        self._inverted = {}
+        self._sorted = {}
+        self._row_count = len(self.columns[0])
+
+    def rows_appended(self, first, last):
+        """Учесть строки first..last, дописанные в конец; в остальных случаях - сброс."""
+        if first != self._row_count:
+            self.invalidate()
+            return
+        for field, postings in self._inverted.items():
+            column = self.columns[INVERTED_FIELDS[field]]
+            for row in range(first, last + 1):
+                postings.setdefault(column[row], array("l")).append(row)
+        for column_index, index in self._sorted.items():
+            column = self.columns[column_index]
+            for row in range(first, last + 1):
+                index.add(column[row], row)
+        self._row_count = last + 1
+
+    def _postings(self, field):
+        if self._row_count != len(self.columns[0]):
+            self.invalidate()
+        postings = self._inverted.get(field)
+        if postings is None:
+            column = self.columns[INVERTED_FIELDS[field]]
+            codes = getattr(column, "codes", None)
+            by_code = {}
+            for row, value in enumerate(column if codes is None else codes):
+                by_code.setdefault(value, array("l")).append(row)
+            if codes is not None:
+                by_code = {column.decode(code): rows for code, rows in by_code.items()}
+            postings = self._inverted[field] = by_code
+        return postings
+
+    def _sorted_index(self, column_index):
+        if self._row_count != len(self.columns[0]):
+            self.invalidate()
+        index = self._sorted.get(column_index)
+        if index is None:
+            index = self._sorted[column_index] = _SortedIndex(self.columns[column_index])
+        return index
+
+    def values(self, field):
+        """Различные значения поля (для подсказок в фильтрах)."""
+        return sorted(value for value in self._postings(field) if value)
+
+    def query(self, number_prefix=None, date_from=None, date_to=None, **equal):
+        """Номера строк, удовлетворяющих всем условиям, по возрастанию, или None без условий.
+
+        equal - точные значения полей INVERTED_FIELDS; date_from/date_to -
+        секунды от эпохи включительно; None или пустая строка - условие не задано.
+        Кандидаты берутся из самого избирательного индекса, остальные
+        условия проверяются по значениям столбцов.
+        """
+        equal = {field: value for field, value in equal.items() if value is not None and value != ""}
+        unknown = set(equal) - set(INVERTED_FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля фильтра: {', '.join(sorted(unknown))}")
+        number_prefix = number_prefix or None
+        date_high = None if date_to is None else date_to + 1
+
+        # (размер, условие, получение кандидатов)
+        candidates = []
+        for field, value in equal.items():
+            postings = self._postings(field).get(value, ())
+            candidates.append((len(postings), field, lambda postings=postings: list(postings)))
+        if date_from is not None or date_to is not None:
+            dates = self._sorted_index(DATE_TIME_COLUMN)
+            candidates.append((dates.count(date_from, date_high), "date",
+                               lambda: sorted(dates.range(date_from, date_high))))
+        if number_prefix is not None:
+            numbers = self._sorted_index(NUMBER_COLUMN)
+            high = number_prefix[:-1] + chr(ord(number_prefix[-1]) + 1)
+            candidates.append((numbers.count(number_prefix, high), "number",
+                               lambda: sorted(numbers.range(number_prefix, high))))
+        if not candidates:
+            return None
+
+        _, chosen, fetch = min(candidates, key=lambda candidate: candidate[0])
+        rows = fetch()
+        # Условие, по которому выбраны кандидаты, уже выполнено
+        for field, value in equal.items():
+            if field != chosen:
+                column = self.columns[INVERTED_FIELDS[field]]
+                if hasattr(column, "code"):
+                    column, value = column.codes, column.code(value)
+                rows = [row for row in rows if column[row] == value]
+        if chosen != "date" and (date_from is not None or date_to is not None):
+            column = self.columns[DATE_TIME_COLUMN]
+            low = date_from if date_from is not None else float("-inf")
+            high = date_to if date_to is not None else float("inf")
+            rows = [row for row in rows if low <= column[row] <= high]
+        if chosen != "number" and number_prefix is not None:
+            column = self.columns[NUMBER_COLUMN]
+            rows = [row for row in rows if column[row].startswith(number_prefix)]
+        return rows
+
+    def matches(self, row, number_prefix=None, date_from=None, date_to=None, **equal):
+        """Проверка одной строки по тем же условиям, что и query."""
+        if any(value not in (None, "") and self.columns[INVERTED_FIELDS[field]][row] != value
+               for field, value in equal.items()):
+            return False
+        date = self.columns[DATE_TIME_COLUMN][row]
+        return ((date_from is None or date >= date_from)
+                and (date_to is None or date <= date_to)
+                and (not number_prefix or self.columns[NUMBER_COLUMN][row].startswith(number_prefix)))
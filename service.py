@@ -0,0 +1,334 @@
+"""Служба отрисовки чеков на Unix-сокете: пул процессов без запуска Qt.
+
+Протокол - строки JSON в обе стороны. Запрос - чек в формате импорта
+(JSONL) или объект {"id": ..., "format": "text", "receipt": {...}}.
+Ответы возвращаются в порядке запросов соединения:
+    {"id": ..., "format": "text", "text": "..."}
+    {"id": ..., "format": "escpos", "data": "<base64>"}
+    {"id": ..., "format": "fda", "data": "<base64>"}   (документ TLV, как в архиве fiscal)
+    {"id": ..., "error": "..."}
+Запрос {"command": "metrics"} возвращает счётчики службы: принято,
+отрисовано, ошибок, очередь, чеков в секунду и попадания в кэш шапок.
+
+Запуск (через cli.py):
+    python cli.py serve --socket /tmp/receipts.sock --workers 8
+Текст совпадает с предварительным просмотром EditReceiptDialog
+(core.render_receipt); PDF строится только в приложении (нужен Qt).
+"""
+import asyncio
+import base64
+import functools
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from core import normalize_receipt, organization_header_lines, render_receipt
+from fiscal import encode_receipt
+from printing import escpos_from_text
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or "/tmp", "receipts-render.sock")
+FORMATS = ["text", "escpos", "fda"]
+READ_SIZE = 1 << 16
+# Запросов в одной задаче пула и задач в работе на одно соединение
+BATCH_SIZE = 200
+MAX_PENDING_BATCHES = 8
+ORGANIZATION_CACHE_SIZE = 4096
+THROUGHPUT_WINDOW = 10.0
+
+
+# Рабочий процесс
+
+def _ignore_interrupt():
+    # Ctrl+C получает вся группа процессов; пул останавливает сама служба
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+@functools.lru_cache(maxsize=ORGANIZATION_CACHE_SIZE)
+def cached_organization_header(organization_name):
+    """Начало шапки чека; кэш в каждом рабочем процессе (список не изменять)."""
+    return organization_header_lines(organization_name)
+
+
+def render_request(request):
+    """Ответ на один запрос (без id)."""
+    output_format = request.get("format", "text")
+    receipt = normalize_receipt(request["receipt"])
+    if output_format == "fda":
+        return {"format": output_format, "data": base64.b64encode(encode_receipt(receipt)).decode("ascii")}
+    text = render_receipt(receipt, cached_organization_header)
+    if output_format == "escpos":
+        return {"format": output_format, "data": base64.b64encode(escpos_from_text(text)).decode("ascii")}
+    return {"format": output_format, "text": text}
+
+
+def render_batch(requests):
+    """Пачка запросов в рабочем процессе: ответы и изменение счётчиков кэша шапок."""
+    before = cached_organization_header.cache_info()
+    responses = []
+    for request in requests:
+        try:
+            response = render_request(request)
+        except Exception as error:
+            response = {"error": f"{type(error).__name__}: {error}"}
+        response["id"] = request.get("id")
+        responses.append(response)
+    after = cached_organization_header.cache_info()
+    return responses, after.hits - before.hits, after.misses - before.misses
+
+
+def parse_request(line, number):
+    """Запрос из строки JSON; чек без обёртки - запрос текста. ValueError - некорректный запрос."""
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError("Ожидался объект JSON")
+    if "command" in data:
+        return data
+    request = data if "receipt" in data else {"receipt": data}
+    request.setdefault("id", number)
+    if request.get("format", "text") not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {request['format']}")
+    return request
+
+
+# Служба
+
+class Metrics:
+    """Счётчики службы; обновляются только из цикла событий."""
+
+    def __init__(self, workers):
+        self.started = time.monotonic()
+        self.workers = workers
+        self.connections = 0
+        self.received = 0
+        self.rendered = 0
+        self.failed = 0
+        self.queued = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._completed = deque()
+
+    def completed(self, responses, hits, misses):
+        now = time.monotonic()
+        failed = sum("error" in response for response in responses)
+        self.failed += failed
+        self.rendered += len(responses) - failed
+        self.queued -= len(responses)
+        self.cache_hits += hits
+        self.cache_misses += misses
+        self._completed.append((now, len(responses)))
+        while self._completed and self._completed[0][0] < now - THROUGHPUT_WINDOW:
+            self._completed.popleft()
+
+    def snapshot(self):
+        now = time.monotonic()
+        recent = sum(count for moment, count in self._completed if moment >= now - THROUGHPUT_WINDOW)
+        uptime = now - self.started
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "uptime_s": round(uptime, 3),
+            "workers": self.workers,
+            "connections": self.connections,
+            "received": self.received,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "queue_depth": self.queued,
+            "receipts_per_s": round(recent / min(THROUGHPUT_WINDOW, uptime or 1), 1),
+            "header_cache_hit_rate": round(self.cache_hits / lookups, 4) if lookups else None,
+        }
+
+
+class RenderService:
+    def __init__(self, path=DEFAULT_SOCKET, workers=None):
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.metrics = Metrics(self.workers)
+        self.executor = None
+        self._server = None
+
+    async def start(self):
+        _remove_stale_socket(self.path)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_interrupt)
+        # Процессы пула запускаются до открытия сокета: иначе они унаследуют
+        # соединение клиента, и после его закрытия службой клиент не получит EOF
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, os.getpid) for _ in range(self.workers)))
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=READ_SIZE)
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader, writer):
+        self.metrics.connections += 1
+        # Ответы уходят в порядке запросов; очередь ограничивает число пачек в работе
+        pending = asyncio.Queue(MAX_PENDING_BATCHES)
+        sender = asyncio.create_task(self._send(pending, writer))
+        try:
+            async for batch in self._read_batches(reader):
+                await pending.put(batch)
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await sender
+            self.metrics.connections -= 1
+            writer.close()
+
+    async def _read_batches(self, reader):
+        """Пачки ответов в порядке запросов: future пула или готовый список ответов."""
+        loop = asyncio.get_running_loop()
+        carry = b""
+        number = 0
+        while True:
+            chunk = await reader.read(READ_SIZE)
+            lines = (carry + chunk).split(b"\n")
+            carry = lines.pop() if chunk else b""
+            requests = []
+            for line in lines:
+                if not line.strip():
+                    continue
+                number += 1
+                self.metrics.received += 1
+                try:
+                    request = parse_request(line, number)
+                except ValueError as error:
+                    self.metrics.failed += 1
+                    request = {"command": None, "error": str(error), "id": number}
+                if "command" in request:
+                    # Ошибки и команды отвечаются после уже принятых чеков
+                    if requests:
+                        yield self._submit(loop, requests)
+                        requests = []
+                    yield [self._command(request)]
+                    continue
+                requests.append(request)
+                if len(requests) == BATCH_SIZE:
+                    yield self._submit(loop, requests)
+                    requests = []
+            if requests:
+                yield self._submit(loop, requests)
+            if not chunk:
+                return
+
+    def _submit(self, loop, requests):
+        self.metrics.queued += len(requests)
+        return loop.run_in_executor(self.executor, render_batch, requests)
+
+    def _command(self, request):
+        if "error" in request:
+            return {"id": request["id"], "error": request["error"]}
+        if request["command"] == "metrics":
+            return {"metrics": self.metrics.snapshot()}
+        return {"error": f"Неизвестная команда: {request['command']}"}
+
+    async def _send(self, pending, writer):
+        broken = False
+        while True:
+            batch = await pending.get()
+            if batch is None:
+                return
+            if isinstance(batch, list):
+                responses = batch
+            else:
+                responses, hits, misses = await batch
+                self.metrics.completed(responses, hits, misses)
+            if broken:
+                continue
+            try:
+                writer.write("".join(json.dumps(response, ensure_ascii=False) + "\n"
+                                     for response in responses).encode("utf-8"))
+                await writer.drain()
+            except ConnectionError:
+                # Клиент ушёл: оставшиеся пачки дорабатываются ради счётчиков
+                broken = True
+
+
+def _remove_stale_socket(path):
+    """Удаление сокета, оставшегося от завершившейся службы; работающая - ошибка."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+    else:
+        raise RuntimeError(f"Служба уже запущена: {path}")
+    finally:
+        probe.close()
+
+
+def serve(path=DEFAULT_SOCKET, workers=None):
+    """Запуск службы до SIGINT/SIGTERM; итоговые счётчики - в stderr."""
+    async def main():
+        service = await RenderService(path, workers).start()
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, lambda: stop.done() or stop.set_result(None))
+        print(f"Служба отрисовки: {path}, процессов: {service.workers}", file=sys.stderr)
+        server = asyncio.create_task(service.serve_forever())
+        try:
+            await stop
+        finally:
+            server.cancel()
+            service.close()
+        print(json.dumps(service.metrics.snapshot(), ensure_ascii=False), file=sys.stderr)
+
+    asyncio.run(main())
+
+
+# Клиент
+
+def render_remote(receipts, path=DEFAULT_SOCKET, output_format="text"):
+    """Отрисовка чеков службой: ответы по мере готовности, в порядке чеков.
+
+    Чеки отправляются из отдельного потока, чтобы чтение ответов
+    не ждало окончания отправки.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(path)
+
+    def send():
+        try:
+            with connection.makefile("wb") as stream:
+                for number, receipt in enumerate(receipts, 1):
+                    request = {"id": number, "format": output_format, "receipt": receipt}
+                    stream.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        finally:
+            connection.shutdown(socket.SHUT_WR)
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    try:
+        with connection.makefile("rb") as stream:
+            for line in stream:
+                yield json.loads(line)
+    finally:
+        sender.join()
+        connection.close()
+
+
+def service_metrics(path=DEFAULT_SOCKET):
+    """Счётчики работающей службы."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall(b'{"command": "metrics"}\n')
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile("rb") as stream:
+            return json.loads(stream.readline())["metrics"]
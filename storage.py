@@ -0,0 +1,537 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from core import DATE_TIME_FORMAT, ITEM_FIELDS, ORGANIZATION_FIELDS, RECEIPT_FIELDS
+from pricing import format_money, parse_item, price_receipts
+
+DEFAULT_DB_PATH = os.environ.get(
+    "RECEIPTS_DB", os.path.join(os.path.expanduser("~"), "receipts.sqlite3")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS organizations (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL DEFAULT '',
+    name TEXT NOT NULL DEFAULT '',
+    trade_object TEXT NOT NULL DEFAULT '',
+    address TEXT NOT NULL DEFAULT '',
+    contact TEXT NOT NULL DEFAULT '',
+    tax_system TEXT NOT NULL DEFAULT '',
+    inn TEXT NOT NULL DEFAULT '',
+    zn_kht TEXT NOT NULL DEFAULT '',
+    rn_kht TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS organizations_inn ON organizations (inn);
+CREATE INDEX IF NOT EXISTS organizations_rn_kht ON organizations (rn_kht);
+
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL DEFAULT '',
+    name TEXT NOT NULL DEFAULT '',
+    organization_name TEXT NOT NULL DEFAULT '',
+    cashier TEXT NOT NULL DEFAULT '',
+    shift TEXT NOT NULL DEFAULT '',
+    receipt_number TEXT NOT NULL DEFAULT '',
+    calculation_type TEXT NOT NULL DEFAULT '',
+    date_time INTEGER NOT NULL DEFAULT 0,
+    payment_method TEXT NOT NULL DEFAULT '',
+    organization_inn TEXT NOT NULL DEFAULT '',
+    organization_rn_kht TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS receipts_date_time ON receipts (date_time);
+CREATE INDEX IF NOT EXISTS receipts_shift ON receipts (shift);
+CREATE INDEX IF NOT EXISTS receipts_cashier ON receipts (cashier);
+CREATE INDEX IF NOT EXISTS receipts_organization_inn ON receipts (organization_inn);
+CREATE INDEX IF NOT EXISTS receipts_organization_rn_kht ON receipts (organization_rn_kht);
+
+CREATE TABLE IF NOT EXISTS receipt_items (
+    receipt_id INTEGER NOT NULL REFERENCES receipts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    quantity TEXT NOT NULL DEFAULT '0',
+    price TEXT NOT NULL DEFAULT '0',
+    discount TEXT NOT NULL DEFAULT '0',
+    vat TEXT NOT NULL DEFAULT '0',
+    cost TEXT NOT NULL DEFAULT '0',
+    PRIMARY KEY (receipt_id, position)
+) WITHOUT ROWID;
+
+-- Итоги для отчётов о смене: строка на ключ, меняется при каждом добавлении и удалении чека
+CREATE TABLE IF NOT EXISTS shift_totals (
+    organization_inn TEXT NOT NULL,
+    organization_rn_kht TEXT NOT NULL,
+    organization_name TEXT NOT NULL,
+    shift TEXT NOT NULL,
+    day TEXT NOT NULL,
+    cashier TEXT NOT NULL,
+    calculation_type TEXT NOT NULL,
+    receipts INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    vat_total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (organization_inn, organization_rn_kht, organization_name, shift, day, cashier, calculation_type)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS shift_totals_day ON shift_totals (day);
+
+CREATE TABLE IF NOT EXISTS shift_closures (
+    organization_inn TEXT NOT NULL,
+    organization_rn_kht TEXT NOT NULL,
+    organization_name TEXT NOT NULL,
+    shift TEXT NOT NULL,
+    closed_at INTEGER NOT NULL,
+    report TEXT NOT NULL,
+    PRIMARY KEY (organization_inn, organization_rn_kht, organization_name, shift)
+) WITHOUT ROWID;
+"""
+
+TOTALS_KEY = ["organization_inn", "organization_rn_kht", "organization_name", "shift", "day",
+              "cashier", "calculation_type"]
+UPSERT_TOTALS = (
+    f"INSERT INTO shift_totals ({', '.join(TOTALS_KEY)}, receipts, total, vat_total) "
+    f"VALUES ({', '.join('?' * (len(TOTALS_KEY) + 3))}) "
+    f"ON CONFLICT ({', '.join(TOTALS_KEY)}) DO UPDATE SET "
+    "receipts = receipts + excluded.receipts, total = total + excluded.total, "
+    "vat_total = vat_total + excluded.vat_total"
+)
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def _organization_condition(organization, prefix=""):
+    """Условие отбора итогов организации: по ИНН и РН ККТ, по имени - только без реквизитов."""
+    inn, rn_kht = organization.get("inn", ""), organization.get("rn_kht", "")
+    if inn or rn_kht:
+        return f"{prefix}organization_inn = ? AND {prefix}organization_rn_kht = ?", [inn, rn_kht]
+    return (f"{prefix}organization_inn = '' AND {prefix}organization_rn_kht = '' AND {prefix}organization_name = ?",
+            [organization.get("name", "")])
+
+
+def to_timestamp(date_time):
+    """Перевод даты/времени чека ("yyyy-MM-dd HH:mm:ss" или число) в секунды от эпохи."""
+    if isinstance(date_time, str):
+        return int(datetime.fromisoformat(date_time).timestamp())
+    return int(date_time)
+
+
+def _price(item_lists):
+    """Расчёт списков позиций нескольких чеков одним проходом движка цен.
+
+    Некорректные числа считаются нулями. Возвращает смещения и PricingResult.
+    """
+    offsets, columns = [0], ([], [], [], [])
+    for items in item_lists:
+        for item in items:
+            try:
+                fixed = parse_item(*item[1:5])
+            except ValueError:
+                fixed = (0, 0, 0, 0)
+            for column, value in zip(columns, fixed):
+                column.append(value)
+        offsets.append(len(columns[0]))
+    return offsets, price_receipts(offsets, *columns)
+
+
+def _reprice(receipts):
+    """Пересчёт стоимостей позиций страницы чеков одним проходом движка цен."""
+    offsets, result = _price(receipt["items"] for receipt in receipts)
+    costs = result.costs
+    for receipt, start in zip(receipts, offsets):
+        for position, item in enumerate(receipt["items"]):
+            item[5] = format_money(costs[start + position])
+        receipt["items"] = [tuple(item) for item in receipt["items"]]
+
+
+class ReceiptStore:
+    """Хранилище чеков и организаций в SQLite.
+
+    Запись идёт в открытую транзакцию, которая фиксируется пачкой:
+    после batch_size операций или явным вызовом flush().
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, batch_size=500, timeout=30.0):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = 0
+        self.connection = sqlite3.connect(path, isolation_level=None, timeout=timeout)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        has_totals = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shift_totals'"
+        ).fetchone()
+        self.connection.executescript(SCHEMA)
+        if not has_totals and self.max_receipt_id():
+            # База создана до появления итогов смен: один раз пересчитываются по всем чекам
+            self.rebuild_shift_totals()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    # Транзакции
+
+    def _write(self, sql, parameters=()):
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN")
+        cursor = self.connection.execute(sql, parameters)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+        return cursor
+
+    def _write_many(self, sql, rows):
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN")
+        self.connection.executemany(sql, rows)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def set_durable(self, durable=True):
+        """Синхронизация каждой фиксации с диском (synchronous=FULL вместо NORMAL).
+
+        При NORMAL зафиксированная в режиме WAL транзакция может пропасть
+        при отключении питания; если фиксация служит снимком для журнала
+        операций, это недопустимо.
+        """
+        self.flush()
+        self.connection.execute(f"PRAGMA synchronous={'FULL' if durable else 'NORMAL'}")
+
+    def flush(self):
+        """Фиксация накопленных изменений одной транзакцией."""
+        if self.connection.in_transaction:
+            self.connection.execute("COMMIT")
+        self._pending = 0
+
+    # Организации
+
+    def load_organizations(self):
+        """Все организации в виде словарей, как их возвращает OrganizationPropertiesDialog.get_data."""
+        cursor = self.connection.execute(
+            f"SELECT {', '.join(ORGANIZATION_FIELDS)} FROM organizations ORDER BY id"
+        )
+        return [dict(zip(ORGANIZATION_FIELDS, row)) for row in cursor]
+
+    def add_organization(self, organization):
+        cursor = self._write(
+            f"INSERT INTO organizations ({', '.join(ORGANIZATION_FIELDS)}) "
+            f"VALUES ({', '.join('?' * len(ORGANIZATION_FIELDS))})",
+            [organization.get(field, "") for field in ORGANIZATION_FIELDS]
+        )
+        return cursor.lastrowid
+
+    def find_organizations(self, inn=None, rn_kht=None):
+        conditions, parameters = [], []
+        if inn is not None:
+            conditions.append("inn = ?")
+            parameters.append(inn)
+        if rn_kht is not None:
+            conditions.append("rn_kht = ?")
+            parameters.append(rn_kht)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self.connection.execute(
+            f"SELECT {', '.join(ORGANIZATION_FIELDS)} FROM organizations {where} ORDER BY id",
+            parameters
+        )
+        return [dict(zip(ORGANIZATION_FIELDS, row)) for row in cursor]
+
+    # Чеки
+
+    def add_receipt(self, values, organization=None, items=(), receipt_id=None):
+        """Добавление чека; values - девять значений строки списка чеков.
+
+        receipt_id задаётся при повторе журнала и отмене удаления.
+        Возвращает идентификатор чека в базе.
+        """
+        values = list(values)
+        values[RECEIPT_FIELDS.index("date_time")] = to_timestamp(
+            values[RECEIPT_FIELDS.index("date_time")])
+        organization = organization or {}
+        cursor = self._write(
+            f"INSERT INTO receipts (id, {', '.join(RECEIPT_FIELDS)}, organization_inn, organization_rn_kht) "
+            f"VALUES ({', '.join('?' * (len(RECEIPT_FIELDS) + 3))})",
+            [receipt_id] + values + [organization.get("inn", ""), organization.get("rn_kht", "")]
+        )
+        receipt_id = cursor.lastrowid
+        if items:
+            self._write_many(
+                f"INSERT INTO receipt_items (receipt_id, position, {', '.join(ITEM_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(ITEM_FIELDS) + 2))})",
+                [(receipt_id, position, *item) for position, item in enumerate(items)]
+            )
+        _, result = _price([items])
+        self._write_many(UPSERT_TOTALS, [
+            self._totals_row(values, organization.get("inn", ""), organization.get("rn_kht", ""),
+                             1, result.totals[0], result.vat_totals[0])
+        ])
+        return receipt_id
+
+    def add_receipts(self, receipts):
+        """Добавление пачки чеков одной транзакцией.
+
+        receipts - тройки (values, organization, items), как аргументы add_receipt.
+        Возвращает диапазон идентификаторов добавленных чеков.
+        """
+        receipts = list(receipts)
+        self.flush()
+        # IMMEDIATE: идентификаторы назначаются после захвата блокировки записи
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            first_id = self.max_receipt_id() + 1
+            date_time_index = RECEIPT_FIELDS.index("date_time")
+            receipt_rows, item_rows = [], []
+            for receipt_id, (values, organization, items) in enumerate(receipts, first_id):
+                values = list(values)
+                values[date_time_index] = to_timestamp(values[date_time_index])
+                organization = organization or {}
+                receipt_rows.append([receipt_id] + values + [organization.get("inn", ""),
+                                                             organization.get("rn_kht", "")])
+                item_rows.extend((receipt_id, position, *item) for position, item in enumerate(items))
+            self.connection.executemany(
+                f"INSERT INTO receipts (id, {', '.join(RECEIPT_FIELDS)}, organization_inn, organization_rn_kht) "
+                f"VALUES ({', '.join('?' * (len(RECEIPT_FIELDS) + 3))})",
+                receipt_rows
+            )
+            self.connection.executemany(
+                f"INSERT INTO receipt_items (receipt_id, position, {', '.join(ITEM_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(ITEM_FIELDS) + 2))})",
+                item_rows
+            )
+            _, result = _price(items for _, _, items in receipts)
+            self.connection.executemany(UPSERT_TOTALS, self._sum_totals(
+                (row[1:-2], row[-2], row[-1], 1, total, vat_total)
+                for row, total, vat_total in zip(receipt_rows, result.totals, result.vat_totals)
+            ))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return range(first_id, first_id + len(receipts))
+
+    def delete_receipts(self, receipt_ids):
+        receipt_ids = list(receipt_ids)
+        if not receipt_ids:
+            return
+        # Итоги уменьшаются на суммы удаляемых чеков, пересчитанные по их позициям
+        rows = []
+        for receipt_id in receipt_ids:
+            row = self.connection.execute(
+                f"SELECT {', '.join(RECEIPT_FIELDS)}, organization_inn, organization_rn_kht "
+                "FROM receipts WHERE id = ?",
+                (receipt_id,)
+            ).fetchone()
+            if row is not None:
+                rows.append((row, self.receipt_items(receipt_id)))
+        _, result = _price(items for _, items in rows)
+        self._write_many(UPSERT_TOTALS, self._sum_totals(
+            (row[:-2], row[-2], row[-1], -1, -total, -vat_total)
+            for (row, _), total, vat_total in zip(rows, result.totals, result.vat_totals)
+        ))
+        self._write_many("DELETE FROM receipts WHERE id = ?", [(receipt_id,) for receipt_id in receipt_ids])
+
+    def receipt_items(self, receipt_id):
+        cursor = self.connection.execute(
+            f"SELECT {', '.join(ITEM_FIELDS)} FROM receipt_items WHERE receipt_id = ? ORDER BY position",
+            (receipt_id,)
+        )
+        return cursor.fetchall()
+
+    def load_receipt(self, receipt_id):
+        """Чек целиком (как core.normalize_receipt): поля, организация и позиции."""
+        row = self.connection.execute(
+            f"SELECT {', '.join(RECEIPT_FIELDS)}, organization_inn, organization_rn_kht FROM receipts WHERE id = ?",
+            (receipt_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        receipt = dict(zip(RECEIPT_FIELDS, row))
+        receipt["date_time"] = datetime.fromtimestamp(receipt["date_time"]).strftime(DATE_TIME_FORMAT)
+        inn, rn_kht = row[len(RECEIPT_FIELDS):]
+        organizations = self.find_organizations(inn=inn, rn_kht=rn_kht) if inn or rn_kht else []
+        receipt["organization"] = organizations[0] if organizations else dict(
+            {field: "" for field in ORGANIZATION_FIELDS},
+            name=receipt["organization_name"], inn=inn, rn_kht=rn_kht
+        )
+        receipt["items"] = self.receipt_items(receipt_id)
+        return receipt
+
+    def iter_receipts(self, page_size=1000):
+        """Все чеки целиком, постранично; стоимости позиций пересчитываются движком цен."""
+        organizations = {}
+        after_id = 0
+        while True:
+            rows = self.connection.execute(
+                f"SELECT id, {', '.join(RECEIPT_FIELDS)}, organization_inn, organization_rn_kht "
+                "FROM receipts WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            items = {}
+            for row in self.connection.execute(
+                f"SELECT receipt_id, {', '.join(ITEM_FIELDS)} FROM receipt_items "
+                "WHERE receipt_id BETWEEN ? AND ? ORDER BY receipt_id, position",
+                (rows[0][0], rows[-1][0])
+            ):
+                items.setdefault(row[0], []).append(list(row[1:]))
+
+            page = []
+            for row in rows:
+                receipt = dict(zip(RECEIPT_FIELDS, row[1:]))
+                receipt["date_time"] = datetime.fromtimestamp(receipt["date_time"]).strftime(DATE_TIME_FORMAT)
+                key = row[-2:]
+                if key not in organizations:
+                    found = self.find_organizations(inn=key[0], rn_kht=key[1]) if any(key) else []
+                    organizations[key] = found[0] if found else None
+                receipt["organization"] = organizations[key] or dict(
+                    {field: "" for field in ORGANIZATION_FIELDS},
+                    name=receipt["organization_name"], inn=key[0], rn_kht=key[1]
+                )
+                receipt["items"] = items.get(row[0], [])
+                page.append(receipt)
+            _reprice(page)
+            yield from page
+            after_id = rows[-1][0]
+
+    # Итоги смен
+
+    @staticmethod
+    def _totals_row(values, inn, rn_kht, receipts, total, vat_total):
+        receipt = dict(zip(RECEIPT_FIELDS, values))
+        day = datetime.fromtimestamp(to_timestamp(receipt["date_time"])).strftime(DAY_FORMAT)
+        return (inn, rn_kht, receipt["organization_name"], str(receipt["shift"]), day,
+                receipt["cashier"], receipt["calculation_type"], receipts, total, vat_total)
+
+    def _sum_totals(self, receipts):
+        """Строки UPSERT_TOTALS, просуммированные по ключу.
+
+        receipts - (values, inn, rn_kht, count, total, vat_total); count -1
+        и отрицательные суммы означают удаление чека.
+        """
+        sums = {}
+        for values, inn, rn_kht, count, total, vat_total in receipts:
+            key = self._totals_row(values, inn, rn_kht, count, total, vat_total)[:-3]
+            counts = sums.setdefault(key, [0, 0, 0])
+            counts[0] += count
+            counts[1] += total
+            counts[2] += vat_total
+        return [key + tuple(counts) for key, counts in sums.items()]
+
+    def rebuild_shift_totals(self, page_size=1000):
+        """Пересчёт итогов смен по всем чекам (для баз, созданных до их появления)."""
+        self.flush()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.execute("DELETE FROM shift_totals")
+            after_id = 0
+            while True:
+                rows = self.connection.execute(
+                    f"SELECT id, {', '.join(RECEIPT_FIELDS)}, organization_inn, organization_rn_kht "
+                    "FROM receipts WHERE id > ? ORDER BY id LIMIT ?",
+                    (after_id, page_size)
+                ).fetchall()
+                if not rows:
+                    break
+                items = {}
+                for item in self.connection.execute(
+                    f"SELECT receipt_id, {', '.join(ITEM_FIELDS)} FROM receipt_items "
+                    "WHERE receipt_id BETWEEN ? AND ? ORDER BY receipt_id, position",
+                    (rows[0][0], rows[-1][0])
+                ):
+                    items.setdefault(item[0], []).append(item[1:])
+                _, result = _price(items.get(row[0], ()) for row in rows)
+                self.connection.executemany(UPSERT_TOTALS, self._sum_totals(
+                    (row[1:-2], row[-2], row[-1], 1, total, vat_total)
+                    for row, total, vat_total in zip(rows, result.totals, result.vat_totals)
+                ))
+                after_id = rows[-1][0]
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def shift_totals(self, organization=None, shift=None, day=None):
+        """Итоги по кассирам и признакам расчета: (cashier, calculation_type, receipts, total, vat_total).
+
+        organization - словарь с name, inn и rn_kht; None - все организации.
+        Организация с ИНН или РН ККТ отбирается по ним (имя в чеках могло меняться),
+        без реквизитов - по имени. Суммы в копейках.
+        """
+        conditions, parameters = ["1"], []
+        if organization is not None:
+            condition, values = _organization_condition(organization)
+            conditions.append(condition)
+            parameters += values
+        if shift is not None:
+            conditions.append("shift = ?")
+            parameters.append(str(shift))
+        if day is not None:
+            conditions.append("day = ?")
+            parameters.append(day)
+        return self.connection.execute(
+            "SELECT cashier, calculation_type, SUM(receipts), SUM(total), SUM(vat_total) "
+            f"FROM shift_totals WHERE {' AND '.join(conditions)} "
+            "GROUP BY cashier, calculation_type HAVING SUM(receipts) > 0 ORDER BY cashier, calculation_type",
+            parameters
+        ).fetchall()
+
+    def report_shifts(self):
+        """Смены, по которым есть чеки: (организация, смена, закрыта ли)."""
+        # Организация определяется реквизитами, как в shift_totals; имя - только без них
+        without_requisites = "t.organization_inn = '' AND t.organization_rn_kht = ''"
+        cursor = self.connection.execute(
+            "SELECT MAX(t.organization_name), t.organization_inn, t.organization_rn_kht, t.shift, "
+            "MAX(c.closed_at IS NOT NULL) FROM shift_totals t LEFT JOIN shift_closures c "
+            "ON c.organization_inn = t.organization_inn AND c.organization_rn_kht = t.organization_rn_kht "
+            f"AND c.shift = t.shift AND (NOT ({without_requisites}) OR c.organization_name = t.organization_name) "
+            "GROUP BY t.organization_inn, t.organization_rn_kht, "
+            f"CASE WHEN {without_requisites} THEN t.organization_name END, t.shift "
+            "HAVING SUM(t.receipts) > 0 ORDER BY 1, t.shift"
+        )
+        return [({"name": name, "inn": inn, "rn_kht": rn_kht}, shift, bool(closed))
+                for name, inn, rn_kht, shift, closed in cursor]
+
+    def report_days(self):
+        cursor = self.connection.execute(
+            "SELECT day FROM shift_totals GROUP BY day HAVING SUM(receipts) > 0 ORDER BY day"
+        )
+        return [day for day, in cursor]
+
+    def shift_closure(self, organization, shift):
+        """Сохранённый Z-отчёт смены или None, если смена не закрыта."""
+        condition, parameters = _organization_condition(organization)
+        row = self.connection.execute(
+            f"SELECT report FROM shift_closures WHERE {condition} AND shift = ? ORDER BY closed_at LIMIT 1",
+            parameters + [str(shift)]
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def close_shift(self, organization, shift, report):
+        """Сохранение Z-отчёта; смена закрывается один раз."""
+        self._write(
+            "INSERT INTO shift_closures (organization_inn, organization_rn_kht, organization_name, shift, "
+            "closed_at, report) VALUES (?, ?, ?, ?, ?, ?)",
+            (organization.get("inn", ""), organization.get("rn_kht", ""), organization.get("name", ""),
+             str(shift), int(datetime.now().timestamp()), json.dumps(report, ensure_ascii=False))
+        )
+        self.flush()
+
+    def max_receipt_id(self):
+        return self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM receipts").fetchone()[0]
+
+    def count_receipts(self):
+        return self.connection.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+
+    def fetch_page(self, after_id=0, up_to_id=None, limit=1000):
+        """Страница чеков с id > after_id (постраничная выборка по ключу, без OFFSET).
+
+        Возвращает список (id, [девять значений]) с датой в секундах от эпохи.
+        """
+        if up_to_id is None:
+            up_to_id = self.max_receipt_id()
+        cursor = self.connection.execute(
+            f"SELECT id, {', '.join(RECEIPT_FIELDS)} FROM receipts "
+            "WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (after_id, up_to_id, limit)
+        )
+        return [(row[0], list(row[1:])) for row in cursor]
@@ -0,0 +1,190 @@
+"""Замеры времени обработчиков и задержек цикла событий Qt (включаются по требованию).
+
+Включение - переменная окружения RECEIPTS_TRACE с путём к файлу трассировки:
+    RECEIPTS_TRACE=trace.json python app.py
+Файл пишется в формате Chrome Trace Event (открывается в chrome://tracing
+и Perfetto). Без переменной методы не оборачиваются и накладных расходов нет.
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from PyQt5.QtCore import QObject, QTimer, Qt
+from PyQt5.QtWidgets import QDockWidget, QTableWidget, QTableWidgetItem, QHeaderView
+
+TRACE_ENV = "RECEIPTS_TRACE"
+MAX_EVENTS = 1000000
+
+HEARTBEAT_MS = 50
+# Задержка срабатывания таймера сверх интервала, которая считается зависанием
+STALL_THRESHOLD_MS = 100
+PANEL_REFRESH_MS = 1000
+
+
+class Tracer:
+    """Журнал событий трассировки и накопленные счётчики по обработчикам."""
+
+    def __init__(self, path, max_events=MAX_EVENTS):
+        self.path = path
+        self.events = deque(maxlen=max_events)
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def complete(self, name, category, start_us, duration_us):
+        """Событие с длительностью (фаза "X"); счётчики обновляются по имени."""
+        with self._lock:
+            self.events.append({
+                "name": name, "cat": category, "ph": "X", "ts": start_us, "dur": duration_us,
+                "pid": self._pid, "tid": threading.get_ident(),
+            })
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = [0, 0.0, 0.0, 0.0]
+            counter[0] += 1
+            counter[1] += duration_us
+            counter[2] = max(counter[2], duration_us)
+            counter[3] = duration_us
+
+    def snapshot(self):
+        """Счётчики: имя -> (вызовов, всего мс, максимум мс, последний мс)."""
+        with self._lock:
+            return {
+                name: (calls, total / 1000, longest / 1000, last / 1000)
+                for name, (calls, total, longest, last) in self.counters.items()
+            }
+
+    def save(self, path=None):
+        with self._lock:
+            events = list(self.events)
+        with open(path or self.path, "w", encoding="utf-8") as output:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, output, ensure_ascii=False)
+
+
+_tracer = None
+
+
+def tracer():
+    """Включённый трассировщик или None."""
+    return _tracer
+
+
+def enable(path):
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path)
+    return _tracer
+
+
+def _positional_limit(function):
+    """Сколько позиционных аргументов принимает функция (None - без ограничения)."""
+    parameters = inspect.signature(function).parameters.values()
+    if any(parameter.kind == parameter.VAR_POSITIONAL for parameter in parameters):
+        return None
+    return sum(parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)
+               for parameter in parameters)
+
+
+def traced(function, name):
+    """Обёртка, записывающая каждый вызов function в трассировку."""
+    limit = _positional_limit(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # Сигналы Qt передают лишние аргументы (например, checked у clicked);
+        # PyQt отбрасывает их по сигнатуре слота, а у обёртки сигнатура *args
+        if limit is not None:
+            args = args[:limit]
+        start = _tracer.now_us()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _tracer.complete(name, "slot", start, _tracer.now_us() - start)
+    return wrapper
+
+
+def instrument(targets):
+    """Обернуть методы классов: targets - {класс: [имена методов]}.
+
+    Вызывается до создания окон: сигналы, подключённые раньше,
+    продолжат вызывать исходные методы.
+    """
+    if _tracer is None:
+        return
+    for cls, names in targets.items():
+        for name in names:
+            method = cls.__dict__.get(name)
+            if method is not None and not hasattr(method, "__wrapped__"):
+                setattr(cls, name, traced(method, f"{cls.__name__}.{name}"))
+
+
+class StallMonitor(QObject):
+    """Задержки цикла событий: таймер с коротким интервалом и проверка опоздания.
+
+    Если обработчик занимает поток интерфейса, очередное срабатывание
+    таймера опаздывает; опоздания больше STALL_THRESHOLD_MS записываются
+    событием "event loop stall".
+    """
+
+    def __init__(self, tracer, interval_ms=HEARTBEAT_MS, threshold_ms=STALL_THRESHOLD_MS, parent=None):
+        super().__init__(parent)
+        self.tracer = tracer
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self._last = None
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._beat)
+
+    def start(self):
+        self._last = self.tracer.now_us()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def _beat(self):
+        now = self.tracer.now_us()
+        late_ms = (now - self._last) / 1000 - self.interval_ms
+        if late_ms > self.threshold_ms:
+            start = self._last + self.interval_ms * 1000
+            self.tracer.complete("event loop stall", "stall", start, now - start)
+        self._last = now
+
+
+class TracePanel(QDockWidget):
+    """Панель счётчиков: вызовы, суммарное, максимальное и последнее время обработчиков."""
+
+    HEADERS = ["Обработчик", "Вызовов", "Всего, мс", "Макс., мс", "Посл., мс"]
+
+    def __init__(self, tracer, parent=None):
+        super().__init__("Замеры", parent)
+        self.tracer = tracer
+        self.table = QTableWidget(0, len(self.HEADERS), self)
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.setWidget(self.table)
+        self._timer = QTimer(self)
+        self._timer.setInterval(PANEL_REFRESH_MS)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start()
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        counters = sorted(self.tracer.snapshot().items(), key=lambda item: -item[1][1])
+        self.table.setRowCount(len(counters))
+        for row, (name, (calls, total, longest, last)) in enumerate(counters):
+            for column, value in enumerate((name, str(calls), f"{total:.1f}", f"{longest:.1f}", f"{last:.1f}")):
+                self.table.setItem(row, column, QTableWidgetItem(value))